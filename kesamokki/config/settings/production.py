@@ -78,6 +78,17 @@ STORAGES = {
     "staticfiles": {
         "BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage",
     },
+    # Printed invoices are private objects, never given the public ACL above
+    "invoices": {
+        "BACKEND": "storages.backends.gcloud.GoogleCloudStorage",
+        "OPTIONS": {
+            "bucket_name": env("DJANGO_GCP_PRIVATE_BUCKET_NAME", default=GS_BUCKET_NAME),
+            "location": "private",
+            "default_acl": "projectPrivate",
+            "querystring_auth": True,
+            "file_overwrite": False,
+        },
+    },
 }
 MEDIA_URL = f"https://storage.googleapis.com/{GS_BUCKET_NAME}/media/"
 
@@ -34,6 +34,11 @@ TEMPLATES[0]["OPTIONS"]["debug"] = True  # type: ignore[index]
 # ------------------------------------------------------------------------------
 # https://docs.djangoproject.com/en/dev/ref/settings/#media-url
 MEDIA_URL = "http://media.testserver/"
+# Printed invoices are rendered by many tests; keep them out of the working tree
+STORAGES = {
+    **STORAGES,  # noqa: F405
+    "invoices": {"BACKEND": "django.core.files.storage.InMemoryStorage"},
+}
 # django-webpack-loader
 # ------------------------------------------------------------------------------
 WEBPACK_LOADER["DEFAULT"]["LOADER_CLASS"] = "webpack_loader.loaders.FakeWebpackLoader"  # noqa: F405
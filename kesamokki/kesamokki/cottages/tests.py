@@ -1,6 +1,10 @@
 import pytest
+from datetime import date, timedelta
+from decimal import Decimal
 from django.urls import reverse
 from .models import Cottage
+from kesamokki.reservations.models import Reservation, ReservationStatus
+from kesamokki.users.models import Customer
 
 pytestmark = pytest.mark.django_db
 
@@ -12,4 +16,41 @@ def test_str():
         beds=2,
         base_price=180,
     )
-    assert str(obj) == "Aurora Hut"
\ No newline at end of file
+    assert str(obj) == "Aurora Hut"
+
+def test_list_excludes_cottages_booked_for_stay(client, user):
+    free = Cottage.objects.create(
+        name="Pine Cabin",
+        description="Quiet cabin",
+        location="Kuopio",
+        beds=4,
+        base_price=100,
+        cleaning_fee=50,
+    )
+    booked = Cottage.objects.create(
+        name="Birch Cabin",
+        description="Busy cabin",
+        location="Kuopio",
+        beds=4,
+        base_price=100,
+    )
+    start = date.today() + timedelta(days=10)
+    Reservation.objects.create(
+        cottage=booked,
+        user=user,
+        customer=Customer.objects.create(full_name="Guest", address_line1="Street 1"),
+        start_date=start + timedelta(days=1),
+        end_date=start + timedelta(days=4),
+        guests=2,
+        total_price=350,
+        status=ReservationStatus.CONFIRMED,
+    )
+
+    response = client.get(
+        reverse("cottages:list"),
+        {"start": start.isoformat(), "end": (start + timedelta(days=3)).isoformat()},
+    )
+
+    assert list(response.context["cottages"]) == [free]
+    assert response.context["cottages"][0].stay_price == Decimal("350.00")
+    assert response.context["stay_nights"] == 3
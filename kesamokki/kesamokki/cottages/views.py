@@ -1,8 +1,11 @@
+from datetime import date
 from django.views.generic import ListView, DetailView
 from django.shortcuts import render
+from django.db.models import Exists, ExpressionWrapper, DecimalField, F, OuterRef
 from .models import Cottage, CottageImage
 from django.contrib.auth.mixins import LoginRequiredMixin
 from kesamokki.users.models import Customer
+from kesamokki.reservations.models import Reservation, ACTIVE_STATUSES
 
 
 
@@ -28,11 +31,41 @@ class CottageListView(ListView):
         
         if max_price and max_price.isdigit():
             queryset = queryset.filter(base_price__lte=int(max_price))
+        
+        # Only list cottages that are free for the requested stay
+        stay = self.get_stay_dates()
+        if stay:
+            start, end = stay
+            booked = Reservation.objects.filter(
+                cottage=OuterRef('pk'),
+                status__in=ACTIVE_STATUSES,
+                start_date__lt=end,
+                end_date__gt=start,
+            )
+            queryset = queryset.filter(~Exists(booked)).annotate(
+                stay_price=ExpressionWrapper(
+                    F('base_price') * (end - start).days + F('cleaning_fee'),
+                    output_field=DecimalField(max_digits=10, decimal_places=2),
+                )
+            )
             
         return queryset
     
+    def get_stay_dates(self):
+        """Return the requested (start, end) dates, or None if not given or invalid."""
+        try:
+            start = date.fromisoformat(self.request.GET.get('start', ''))
+            end = date.fromisoformat(self.request.GET.get('end', ''))
+        except ValueError:
+            return None
+        if start >= end:
+            return None
+        return start, end
+    
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+        stay = self.get_stay_dates()
+        context['stay_nights'] = (stay[1] - stay[0]).days if stay else 0
         return context
 
 class CottageDetailView(LoginRequiredMixin, DetailView):
@@ -1,6 +1,9 @@
 from django.contrib import admin
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
-from .models import Invoice
+from kesamokki.utils.csv_export import export_as_csv
+from .export import INVOICE_EXPORT_COLUMNS
+from .models import Invoice, invalidate_invoices, refresh_revenue_on_commit
 
 @admin.register(Invoice)
 class InvoiceAdmin(admin.ModelAdmin):
@@ -29,7 +32,7 @@ class InvoiceAdmin(admin.ModelAdmin):
         'notes',
     )
     
-    readonly_fields = ('created_at', 'invoice_number')
+    readonly_fields = ('created_at', 'invoice_number', 'reminder_count', 'last_reminded_at')
     
     fieldsets = (
         (None, {
@@ -39,7 +42,7 @@ class InvoiceAdmin(admin.ModelAdmin):
             'fields': ('created_at', 'billed_at', 'due_date', 'paid_at')
         }),
         (_('Status'), {
-            'fields': ('status',)
+            'fields': ('status', 'reminder_count', 'last_reminded_at')
         }),
         (_('Additional Information'), {
             'fields': ('notes',),
@@ -47,7 +50,8 @@ class InvoiceAdmin(admin.ModelAdmin):
         }),
     )
     
-    actions = ['mark_as_paid']
+    actions = ['mark_as_paid', export_as_csv]
+    export_columns = INVOICE_EXPORT_COLUMNS
     
     def get_customer_name(self, obj):
         """Get the customer name from the related reservation."""
@@ -63,10 +67,11 @@ class InvoiceAdmin(admin.ModelAdmin):
     
     def mark_as_paid(self, request, queryset):
         """Admin action to mark selected invoices as paid."""
-        updated = 0
-        for invoice in queryset.filter(status='pending'):
-            invoice.mark_as_paid()
-            updated += 1
+        pending = queryset.filter(status='pending')
+        months = set(pending.dates('billed_at', 'month'))
+        updated = pending.update(status='paid', paid_at=timezone.now(), updated_at=timezone.now())
+        invalidate_invoices()
+        refresh_revenue_on_commit(months)
         
         if updated == 1:
             message = _('1 invoice was marked as paid.')
@@ -74,4 +79,11 @@ class InvoiceAdmin(admin.ModelAdmin):
             message = _('{} invoices were marked as paid.').format(updated)
         
         self.message_user(request, message)
-    mark_as_paid.short_description = _('Mark selected invoices as paid')
\ No newline at end of file
+    mark_as_paid.short_description = _('Mark selected invoices as paid')
+
+    def delete_queryset(self, request, queryset):
+        """Bulk delete (the delete_selected action) skips Invoice.delete, so invalidate here."""
+        months = set(queryset.dates('billed_at', 'month'))
+        super().delete_queryset(request, queryset)
+        invalidate_invoices()
+        refresh_revenue_on_commit(months)
\ No newline at end of file
@@ -0,0 +1,91 @@
+"""
+Pre-rendered invoice documents kept in the private ``invoices`` storage.
+
+An artifact is stored under a hash of everything the printed invoice shows,
+so it is rendered once and reused until one of those fields changes. The hash
+doubles as a strong ETag for the download. The storage is never exposed
+through a URL; documents are only served by the invoice print view.
+"""
+import hashlib
+import json
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import storages
+from django.template.loader import render_to_string
+
+from .models import Invoice
+
+# Bump when pages/invoice_print.html changes so every artifact is re-rendered
+ARTIFACT_TEMPLATE_VERSION = 1
+
+
+def artifact_digest(invoice):
+    """Content hash of the invoice, reservation, cottage and customer fields on the print page."""
+    reservation = invoice.reservation
+    customer = reservation.customer
+    cottage = reservation.cottage
+    fields = [
+        ARTIFACT_TEMPLATE_VERSION,
+        invoice.pk, invoice.invoice_number, invoice.billed_at, invoice.due_date,
+        invoice.amount, invoice.status, invoice.paid_at, invoice.notes,
+        reservation.start_date, reservation.end_date, reservation.guests, reservation.total_price,
+        cottage.name, cottage.base_price, cottage.cleaning_fee,
+        customer.full_name, customer.email, customer.phone, customer.address_line1,
+        customer.address_line2, customer.postal_code, customer.city, str(customer.country_code),
+    ]
+    payload = json.dumps(fields, default=str, separators=(',', ':'))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def artifact_dir(invoice):
+    return f'invoices/{invoice.pk}'
+
+
+def artifact_path(invoice, digest):
+    return f'{artifact_dir(invoice)}/{digest}.html'
+
+
+def artifact_storage():
+    return storages['invoices']
+
+
+def _render(invoice, digest):
+    """Store the print document for ``digest`` and point the invoice at it."""
+    storage = artifact_storage()
+    path = artifact_path(invoice, digest)
+    html = render_to_string('pages/invoice_print.html', {'invoice': invoice})
+    name = storage.save(path, ContentFile(html.encode()))
+    if name != path:
+        # A concurrent request stored the same content first
+        storage.delete(name)
+
+    previous = invoice.artifact_hash
+    # Only the request that moves the hash on drops the file it replaced, so a
+    # request holding stale content can't delete a newer render
+    moved = Invoice.objects.filter(pk=invoice.pk, artifact_hash=previous).update(artifact_hash=digest)
+    if moved and previous and previous != digest:
+        storage.delete(artifact_path(invoice, previous))
+    invoice.artifact_hash = digest
+
+
+def get_artifact(invoice):
+    """
+    Return the digest of the invoice's print document, rendering it when the
+    content changed since the last render. The stored hash is trusted, so an
+    unchanged invoice costs no storage call.
+    """
+    digest = artifact_digest(invoice)
+    if invoice.artifact_hash != digest:
+        _render(invoice, digest)
+    return digest
+
+
+def open_artifact(invoice, digest=None):
+    """Open the stored print document, rendering it again if the file was lost."""
+    digest = digest or get_artifact(invoice)
+    path = artifact_path(invoice, digest)
+    try:
+        return artifact_storage().open(path)
+    except FileNotFoundError:
+        _render(invoice, digest)
+        return artifact_storage().open(path)
@@ -0,0 +1,111 @@
+"""
+Overdue invoice sweep.
+
+Open invoices past their due date are walked in ``(due_date, id)`` order
+through the partial index on ``(due_date, id) WHERE status = 'pending'``,
+reminded in batches over one mail connection per batch, and stamped with a
+single UPDATE per batch.
+"""
+import logging
+import smtplib
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import F, Q
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import Invoice, InvoiceStatus, invoice_reference
+
+REMINDER_BATCH_SIZE = 200
+REMINDER_INTERVAL_DAYS = 7
+REMINDER_MAX_COUNT = 3
+
+logger = logging.getLogger(__name__)
+
+
+def overdue_invoices(today=None):
+    """Pending invoices whose due date has passed."""
+    today = today or timezone.now().date()
+    return Invoice.objects.filter(status=InvoiceStatus.PENDING, due_date__lt=today)
+
+
+def invoices_to_remind(now=None, interval_days=REMINDER_INTERVAL_DAYS, max_count=REMINDER_MAX_COUNT):
+    """Overdue invoices not reminded within ``interval_days`` and below ``max_count`` reminders."""
+    now = now or timezone.now()
+    return overdue_invoices(now.date()).filter(
+        Q(last_reminded_at__isnull=True) | Q(last_reminded_at__lt=now - timedelta(days=interval_days)),
+        reminder_count__lt=max_count,
+    )
+
+
+def _reminder(number, amount, due_date, pk, name, email):
+    body = render_to_string('emails/invoice_reminder.txt', {
+        'name': name,
+        'number': number,
+        'amount': amount,
+        'due_date': due_date,
+        'reference': invoice_reference(pk),
+    })
+    return EmailMessage(f'Payment reminder: invoice {number}', body, settings.DEFAULT_FROM_EMAIL, [email])
+
+
+def send_overdue_reminders(batch_size=REMINDER_BATCH_SIZE, dry_run=False, **kwargs):
+    """
+    Remind the customers of overdue invoices, ``batch_size`` invoices at a time.
+
+    Invoices are walked in ``(due_date, id)`` order, matching the partial
+    index, so every batch is one indexed range query, one mail connection and
+    one UPDATE. Only the invoices whose mail went out are stamped; one that
+    fails to send is logged and picked up again by the next run without
+    stopping the batch. Returns ``(reminded, skipped, failed)``; invoices
+    without an email address are skipped.
+    """
+    now = timezone.now()
+    pending = invoices_to_remind(now, **kwargs).order_by('due_date', 'id')
+    reminded = skipped = failed = 0
+    after = Q()
+
+    while True:
+        rows = list(pending.filter(after).values_list(
+            'id', 'invoice_number', 'amount', 'due_date',
+            'reservation__customer__full_name', 'reservation__customer__email', 'reservation__user__email',
+        )[:batch_size])
+        if not rows:
+            break
+        last_id, last_due = rows[-1][0], rows[-1][3]
+        after = Q(due_date__gt=last_due) | Q(due_date=last_due, id__gt=last_id)
+
+        reminders = []
+        for pk, number, amount, due_date, name, customer_email, user_email in rows:
+            email = customer_email or user_email
+            if not email:
+                skipped += 1
+                continue
+            reminders.append((pk, _reminder(number, amount, due_date, pk, name, email)))
+
+        if dry_run:
+            reminded += len(reminders)
+            continue
+        if not reminders:
+            continue
+
+        sent = []
+        with get_connection() as connection:
+            for pk, message in reminders:
+                try:
+                    connection.send_messages([message])
+                except (smtplib.SMTPException, OSError):
+                    logger.exception('Could not send the payment reminder of invoice %s', pk)
+                    failed += 1
+                else:
+                    sent.append(pk)
+        Invoice.objects.filter(id__in=sent).update(
+            reminder_count=F('reminder_count') + 1,
+            last_reminded_at=now,
+            updated_at=now,
+        )
+        reminded += len(sent)
+
+    return reminded, skipped, failed
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from kesamokki.invoices.models import MonthlyRevenue
+from kesamokki.invoices.revenue import REVENUE_CLOSE_AFTER_DAYS, months_to_backfill, months_to_close
+
+
+class Command(BaseCommand):
+    help = (
+        "Roll up past billing months that have no rollup yet, then rebuild and freeze "
+        "the ones old enough. Meant to run monthly."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--close-after-days",
+            type=int,
+            default=REVENUE_CLOSE_AFTER_DAYS,
+            help="Only close months that ended at least this many days ago.",
+        )
+
+    def handle(self, *args, **options):
+        months = months_to_close(close_after_days=options["close_after_days"])
+        # Reads never build missing months; the ones not closed now are rolled up here
+        missing = sorted(set(months_to_backfill()) - set(months))
+        MonthlyRevenue.objects.refresh(missing)
+        MonthlyRevenue.objects.close(months)
+        self.stdout.write(self.style.SUCCESS(
+            f"Rolled up {len(missing)} missing and closed {len(months)} revenue months."
+        ))
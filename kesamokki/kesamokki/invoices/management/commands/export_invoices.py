@@ -0,0 +1,47 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from kesamokki.invoices.export import EXPORT_CHUNK_SIZE, filter_invoices, iter_invoice_zip
+from kesamokki.invoices.models import Invoice
+
+
+class Command(BaseCommand):
+    help = "Write a ZIP archive of the print pages of the matching invoices."
+
+    def add_arguments(self, parser):
+        parser.add_argument("output", help="Path of the ZIP file to write.")
+        parser.add_argument(
+            "--status",
+            choices=["pending", "paid", "cancelled", "overdue"],
+            help="Only export invoices with this status.",
+        )
+        parser.add_argument(
+            "--billed-from",
+            type=date.fromisoformat,
+            help="First billing date to include (YYYY-MM-DD).",
+        )
+        parser.add_argument(
+            "--billed-to",
+            type=date.fromisoformat,
+            help="Last billing date to include (YYYY-MM-DD).",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=EXPORT_CHUNK_SIZE,
+            help="Invoices fetched per round trip from the server-side cursor.",
+        )
+
+    def handle(self, *args, **options):
+        queryset = filter_invoices(
+            Invoice.objects.all(),
+            options["status"],
+            billed_from=options["billed_from"],
+            billed_to=options["billed_to"],
+        )
+        with open(options["output"], "wb") as archive:  # noqa: PTH123
+            for chunk in iter_invoice_zip(queryset, chunk_size=options["chunk_size"]):
+                archive.write(chunk)
+
+        self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}."))
@@ -0,0 +1,36 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from kesamokki.invoices.services import INVOICE_BATCH_SIZE, INVOICE_DUE_DAYS, generate_invoices
+
+
+class Command(BaseCommand):
+    help = "Create invoices for every confirmed reservation that does not have one yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--billed-at",
+            type=date.fromisoformat,
+            help="Billing date in YYYY-MM-DD format. Defaults to today.",
+        )
+        parser.add_argument(
+            "--due-days",
+            type=int,
+            default=INVOICE_DUE_DAYS,
+            help="Days between the billing date and the due date.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=INVOICE_BATCH_SIZE,
+            help="Number of invoices written per insert batch.",
+        )
+
+    def handle(self, *args, **options):
+        created = generate_invoices(
+            billed_at=options["billed_at"],
+            due_days=options["due_days"],
+            batch_size=options["batch_size"],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Created {created} invoices."))
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from kesamokki.invoices.reconciliation import parse_statement, reconcile
+
+
+class Command(BaseCommand):
+    help = "Mark invoices paid from a bank statement (CSV or KTL reference payment file)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Statement file to import.")
+        parser.add_argument(
+            "--format",
+            choices=["auto", "csv", "ktl"],
+            default="auto",
+            help="Statement format. Guessed from the first line by default.",
+        )
+        parser.add_argument(
+            "--encoding",
+            default="utf-8",
+            help="Text encoding of the statement file.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report the matches without marking anything paid.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with open(options["path"], encoding=options["encoding"], newline="") as statement:  # noqa: PTH123
+                payments = parse_statement(statement, options["format"])
+        except (OSError, UnicodeDecodeError, ValueError) as e:
+            raise CommandError(f"Could not read the statement: {e}") from e
+
+        result = reconcile(payments, dry_run=options["dry_run"])
+
+        for pk, payment in result.mismatched:
+            self.stdout.write(f"Line {payment.line}: amount {payment.amount} does not match invoice id {pk}.")
+        for pk, payment in result.duplicates:
+            self.stdout.write(f"Line {payment.line}: invoice id {pk} was already paid earlier in the statement.")
+        for payment in result.unmatched:
+            self.stdout.write(f"Line {payment.line}: no open invoice for reference {payment.reference.strip() or '-'}.")
+
+        verb = "Would mark" if options["dry_run"] else "Marked"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {len(result.matched)} invoices paid; {len(result.mismatched)} amount mismatches, "
+            f"{len(result.duplicates)} duplicates, {len(result.unmatched)} unmatched lines.",
+        ))
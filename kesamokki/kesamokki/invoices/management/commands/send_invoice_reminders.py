@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+
+from kesamokki.invoices.dunning import (
+    REMINDER_BATCH_SIZE,
+    REMINDER_INTERVAL_DAYS,
+    REMINDER_MAX_COUNT,
+    send_overdue_reminders,
+)
+
+
+class Command(BaseCommand):
+    help = "Email payment reminders for overdue invoices. Meant to run daily from a scheduler."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=REMINDER_BATCH_SIZE,
+            help="Invoices reminded per query, mail connection and update.",
+        )
+        parser.add_argument(
+            "--interval-days",
+            type=int,
+            default=REMINDER_INTERVAL_DAYS,
+            help="Minimum days between two reminders of the same invoice.",
+        )
+        parser.add_argument(
+            "--max-count",
+            type=int,
+            default=REMINDER_MAX_COUNT,
+            help="Stop reminding an invoice after this many reminders.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Count the reminders without sending or recording them.",
+        )
+
+    def handle(self, *args, **options):
+        reminded, skipped, failed = send_overdue_reminders(
+            batch_size=options["batch_size"],
+            dry_run=options["dry_run"],
+            interval_days=options["interval_days"],
+            max_count=options["max_count"],
+        )
+        verb = "Would remind" if options["dry_run"] else "Reminded"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {reminded} overdue invoices; skipped {skipped} without an email address.",
+        ))
+        if failed:
+            self.stdout.write(self.style.WARNING(
+                f"{failed} reminders could not be sent and will be retried on the next run.",
+            ))
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.8 on 2026-10-18 17:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceNumberCounter',
+            fields=[
+                ('year', models.PositiveIntegerField(primary_key=True, serialize=False, verbose_name='Year')),
+                ('last_number', models.PositiveIntegerField(default=0, verbose_name='Last Number')),
+            ],
+            options={
+                'verbose_name': 'Invoice Number Counter',
+                'verbose_name_plural': 'Invoice Number Counters',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.8 on 2026-10-18 17:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0002_invoicenumbercounter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='artifact_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64, verbose_name='Artifact Hash'),
+        ),
+    ]
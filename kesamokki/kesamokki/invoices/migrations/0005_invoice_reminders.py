@@ -0,0 +1,28 @@
+# Generated by Django 5.1.8 on 2026-10-18 18:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0004_invoice_updated_at'),
+        ('reservations', '0009_reservation_updated_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='last_reminded_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Last Reminded At'),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='reminder_count',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Reminders Sent'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['due_date'], name='invoice_pending_due_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.8 on 2026-10-18 18:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cottages', '0001_initial'),
+        ('invoices', '0005_invoice_reminders'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RevenuePeriod',
+            fields=[
+                ('month', models.DateField(primary_key=True, serialize=False, verbose_name='Month')),
+                ('closed_at', models.DateTimeField(blank=True, null=True, verbose_name='Closed At')),
+            ],
+            options={
+                'verbose_name': 'Revenue Period',
+                'verbose_name_plural': 'Revenue Periods',
+                'ordering': ['month'],
+            },
+        ),
+        migrations.CreateModel(
+            name='MonthlyRevenue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(verbose_name='Month')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('paid', 'Paid'), ('cancelled', 'Cancelled')], max_length=20, verbose_name='Status')),
+                ('total', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Total')),
+                ('invoice_count', models.PositiveIntegerField(verbose_name='Invoices')),
+                ('cottage', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='cottages.cottage', verbose_name='Cottage')),
+            ],
+            options={
+                'verbose_name': 'Monthly Revenue',
+                'verbose_name_plural': 'Monthly Revenue',
+                'constraints': [models.UniqueConstraint(fields=('month', 'cottage', 'status'), name='monthly_revenue_unique')],
+            },
+        ),
+    ]
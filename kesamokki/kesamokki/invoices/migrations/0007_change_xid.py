@@ -0,0 +1,35 @@
+# Generated by Django 5.1.8 on 2026-10-18 18:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0006_revenue_rollup'),
+        ('reservations', '0011_change_xid'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='invoice',
+            name='invoice_updated_idx',
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='change_xid',
+            field=models.BigIntegerField(editable=False, null=True, verbose_name='Change Transaction'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['change_xid', 'id'], name='invoice_change_idx'),
+        ),
+        # stamp_change_xid() comes from reservations 0011
+        migrations.RunSQL(
+            'CREATE TRIGGER invoice_change_xid BEFORE INSERT OR UPDATE ON invoices_invoice '
+            'FOR EACH ROW EXECUTE FUNCTION stamp_change_xid();',
+            'DROP TRIGGER invoice_change_xid ON invoices_invoice;',
+        ),
+        # Existing rows get this migration's transaction id
+        migrations.RunSQL('UPDATE invoices_invoice SET change_xid = NULL;', migrations.RunSQL.noop),
+    ]
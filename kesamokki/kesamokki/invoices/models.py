@@ -1,9 +1,14 @@
-from django.db import models
+from datetime import timedelta
+
+from django.db import connection, models, transaction
+from django.db.models import Count, Sum
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.core.exceptions import ValidationError
 
+from kesamokki.cottages.models import Cottage
 from kesamokki.reservations.models import Reservation
+from kesamokki.utils.cache import bump_version
 
 
 class InvoiceStatus(models.TextChoices):
@@ -13,6 +18,69 @@ class InvoiceStatus(models.TextChoices):
     CANCELLED = 'cancelled', _('Cancelled')
 
 
+INVOICE_NUMBER_PREFIX = 'INV'
+INVOICES_VERSION_KEY = 'invoices:version'
+
+
+def invalidate_invoices():
+    """Bump the invoice cache version once the transaction commits."""
+    transaction.on_commit(lambda: bump_version(INVOICES_VERSION_KEY))
+
+
+def reference_number(base):
+    """Append the Finnish reference number check digit (weights 7, 3, 1) to ``base``."""
+    weights = (7, 3, 1)
+    total = sum(int(digit) * weights[i % 3] for i, digit in enumerate(reversed(base)))
+    return f"{base}{-total % 10}"
+
+
+def invoice_reference(invoice_id):
+    """Reference number customers pay invoice ``invoice_id`` with."""
+    return reference_number(f"{invoice_id:03d}")
+
+
+def format_invoice_number(year, number):
+    """Render an allocated number, e.g. ``INV-2025-00042``."""
+    return f"{INVOICE_NUMBER_PREFIX}-{year}-{number:05d}"
+
+
+class InvoiceNumberCounterManager(models.Manager):
+    def allocate(self, year, count=1):
+        """
+        Reserve ``count`` consecutive invoice numbers for ``year``.
+
+        A single upsert bumps the year's counter and returns its new value, so a
+        whole block costs one round trip. The row stays locked until the
+        surrounding transaction ends, which keeps concurrent runs from handing
+        out the same numbers.
+        """
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} (year, last_number) VALUES (%s, %s) "
+                f"ON CONFLICT (year) DO UPDATE SET last_number = {table}.last_number + EXCLUDED.last_number "
+                f"RETURNING last_number",
+                [year, count],
+            )
+            last = cursor.fetchone()[0]
+        return [format_invoice_number(year, number) for number in range(last - count + 1, last + 1)]
+
+
+class InvoiceNumberCounter(models.Model):
+    """Last invoice number handed out per billing year."""
+    year = models.PositiveIntegerField(_('Year'), primary_key=True)
+    last_number = models.PositiveIntegerField(_('Last Number'), default=0)
+
+    objects = InvoiceNumberCounterManager()
+
+    class Meta:
+        verbose_name = _('Invoice Number Counter')
+        verbose_name_plural = _('Invoice Number Counters')
+
+    def __str__(self):
+        return f"{self.year}: {self.last_number}"
+
+
 class Invoice(models.Model):
     """
     Invoice model for tracking payments related to reservations.
@@ -31,6 +99,9 @@ class Invoice(models.Model):
         blank=True,  # Allow it to be blank initially, will be auto-generated
     )
     created_at = models.DateTimeField(_('Created At'), auto_now_add=True)
+    updated_at = models.DateTimeField(_('Updated At'), auto_now=True)
+    # Id of the transaction that last wrote the row, stamped by a database trigger
+    change_xid = models.BigIntegerField(_('Change Transaction'), null=True, editable=False)
     billed_at = models.DateField(_('Billed At'))
     due_date = models.DateField(_('Due Date'))
     amount = models.DecimalField(
@@ -47,33 +118,78 @@ class Invoice(models.Model):
         default=InvoiceStatus.PENDING
     )
     paid_at = models.DateTimeField(_('Paid At'), null=True, blank=True)
+    reminder_count = models.PositiveSmallIntegerField(_('Reminders Sent'), default=0, editable=False)
+    last_reminded_at = models.DateTimeField(_('Last Reminded At'), null=True, blank=True, editable=False)
     notes = models.TextField(_('Notes'), blank=True)
+    artifact_hash = models.CharField(
+        _('Artifact Hash'),
+        max_length=64,
+        blank=True,
+        editable=False,  # Content hash of the stored print document
+    )
 
     class Meta:
         verbose_name = _('Invoice')
         verbose_name_plural = _('Invoices')
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination of the accounting ledger feed
+            models.Index(fields=['change_xid', 'id'], name='invoice_change_idx'),
+            # Overdue sweep: only open invoices are ever walked by due date
+            models.Index(
+                fields=['due_date', 'id'],
+                condition=models.Q(status=InvoiceStatus.PENDING),
+                name='invoice_pending_due_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"Invoice {self.invoice_number} for {self.reservation}"
 
     def save(self, *args, **kwargs):
-        # Generate invoice number if not provided
-        if not self.invoice_number:
-            last_invoice = Invoice.objects.order_by('-id').first()
-            number = 1 if not last_invoice else int(last_invoice.invoice_number.split('-')[1]) + 1
-            self.invoice_number = f"INV-{number:03d}"
-        
-        # Set amount from reservation if not provided
-        if not self.amount and self.reservation:
-            self.amount = self.reservation.total_price
-        
-        # Check for duplicate invoices for the same reservation
-        if not self.pk and Invoice.objects.filter(reservation=self.reservation).exists():
-            raise ValidationError(_('An invoice already exists for this reservation.'))
-        
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            if not self.pk:
+                # Lock the reservation like generate_invoices does, so the two
+                # never invoice the same booking at once
+                Reservation.objects.select_for_update().filter(pk=self.reservation_id).first()
+                # Check for duplicate invoices for the same reservation
+                if Invoice.objects.filter(reservation_id=self.reservation_id).exists():
+                    raise ValidationError(_('An invoice already exists for this reservation.'))
+            
+            # Generate invoice number if not provided
+            if not self.invoice_number:
+                year = (self.billed_at or timezone.now().date()).year
+                self.invoice_number, = InvoiceNumberCounter.objects.allocate(year)
+            
+            # Set amount from reservation if not provided
+            if not self.amount and self.reservation:
+                self.amount = self.reservation.total_price
+            
+            super().save(*args, **kwargs)
+        invalidate_invoices()
+        refresh_revenue_on_commit({self._loaded_billed_at, self.billed_at})
+        self._loaded_billed_at = self.billed_at
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        invalidate_invoices()
+        refresh_revenue_on_commit({self.billed_at})
+        return result
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored billing month so moving an invoice refreshes both months
+        instance._loaded_billed_at = instance.__dict__.get('billed_at')
+        return instance
     
+    @property
+    def reference_number(self):
+        """Finnish bank reference the customer pays with, derived from the id."""
+        return invoice_reference(self.pk)
+
+    _loaded_billed_at = None
+
     def mark_as_paid(self):
         """Mark the invoice as paid and record the payment date."""
         self.status = InvoiceStatus.PAID
@@ -82,4 +198,87 @@ class Invoice(models.Model):
         
     def is_overdue(self):
         """Check if the invoice is overdue."""
-        return self.status == InvoiceStatus.PENDING and self.due_date < timezone.now().date()
\ No newline at end of file
+        return self.status == InvoiceStatus.PENDING and self.due_date < timezone.now().date()
+
+
+def refresh_revenue_on_commit(dates):
+    """Recompute the revenue rollup of the months of ``dates`` once the transaction commits."""
+    months = {value.replace(day=1) for value in dates if value}
+    if months:
+        transaction.on_commit(lambda: MonthlyRevenue.objects.refresh(months))
+
+
+class RevenuePeriod(models.Model):
+    """A billing month of the revenue rollup; closed months are never recomputed."""
+    month = models.DateField(_('Month'), primary_key=True)
+    closed_at = models.DateTimeField(_('Closed At'), null=True, blank=True)
+
+    class Meta:
+        verbose_name = _('Revenue Period')
+        verbose_name_plural = _('Revenue Periods')
+        ordering = ['month']
+
+    def __str__(self):
+        return f"{self.month:%Y-%m}"
+
+
+class MonthlyRevenueManager(models.Manager):
+    def refresh(self, months):
+        """
+        Recompute the rollup rows of every open month in ``months``.
+
+        Each month is one aggregate over its invoices, written with a single
+        insert. The period row is locked while its month is rebuilt, and months
+        already closed are left untouched.
+        """
+        for month in sorted(months):
+            with transaction.atomic():
+                RevenuePeriod.objects.get_or_create(month=month)
+                period = RevenuePeriod.objects.select_for_update().get(month=month)
+                if period.closed_at:
+                    continue
+                self.filter(month=month).delete()
+                self.bulk_create(self.build(month))
+
+    def build(self, month):
+        """Unsaved rollup rows of ``month``, one per cottage and invoice status."""
+        end = (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+        rows = Invoice.objects.filter(billed_at__gte=month, billed_at__lt=end).values(
+            'reservation__cottage_id', 'status',
+        ).annotate(total=Sum('amount'), invoice_count=Count('id'))
+        return [
+            self.model(
+                month=month,
+                cottage_id=row['reservation__cottage_id'],
+                status=row['status'],
+                total=row['total'] or 0,
+                invoice_count=row['invoice_count'],
+            )
+            for row in rows
+        ]
+
+    def close(self, months):
+        """Rebuild ``months`` one last time and freeze them."""
+        self.refresh(months)
+        RevenuePeriod.objects.filter(month__in=months, closed_at__isnull=True).update(closed_at=timezone.now())
+
+
+class MonthlyRevenue(models.Model):
+    """Invoiced amount per billing month, cottage and invoice status."""
+    month = models.DateField(_('Month'))
+    cottage = models.ForeignKey(Cottage, on_delete=models.CASCADE, related_name='+', verbose_name=_('Cottage'))
+    status = models.CharField(_('Status'), max_length=20, choices=InvoiceStatus.choices)
+    total = models.DecimalField(_('Total'), max_digits=12, decimal_places=2)
+    invoice_count = models.PositiveIntegerField(_('Invoices'))
+
+    objects = MonthlyRevenueManager()
+
+    class Meta:
+        verbose_name = _('Monthly Revenue')
+        verbose_name_plural = _('Monthly Revenue')
+        constraints = [
+            models.UniqueConstraint(fields=['month', 'cottage', 'status'], name='monthly_revenue_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.month:%Y-%m} {self.cottage_id} {self.status}: {self.total}"
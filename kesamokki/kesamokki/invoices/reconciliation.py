@@ -0,0 +1,155 @@
+"""
+Match bank statement payments to open invoices.
+
+Statements come either as CSV exports or as Finnish reference payment files
+(KTL "viitesiirto", fixed 90-character records). Every open invoice is indexed
+in memory by its number and by its reference, so each payment line is matched
+with a dictionary lookup and the whole statement is applied with a handful of
+bulk updates.
+"""
+import csv
+import re
+from collections import defaultdict, namedtuple
+from datetime import date, datetime, time
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Invoice, InvoiceStatus, invalidate_invoices, invoice_reference, refresh_revenue_on_commit
+
+Payment = namedtuple('Payment', 'line reference message amount paid_on')
+Reconciliation = namedtuple('Reconciliation', 'matched mismatched unmatched duplicates')
+
+CSV_COLUMNS = {
+    'reference': ('reference', 'viite', 'viitenumero'),
+    'message': ('message', 'viesti', 'description'),
+    'amount': ('amount', 'summa', 'määrä'),
+    'paid_on': ('date', 'paid_on', 'päivämäärä', 'maksupäivä'),
+}
+INVOICE_NUMBER_RE = re.compile(r'INV-[\d-]+')
+
+
+def normalize_reference(value):
+    """Strip spacing and the leading zeros banks are free to drop."""
+    return re.sub(r'\s', '', value or '').lstrip('0')
+
+
+def _parse_amount(value):
+    return Decimal(value.replace(' ', '').replace(',', '.'))
+
+
+def _parse_date(value):
+    value = value.strip()
+    if '.' in value:
+        return datetime.strptime(value, '%d.%m.%Y').date()
+    return date.fromisoformat(value)
+
+
+def parse_csv(lines):
+    """Yield the payments of a CSV statement with a header row."""
+    reader = csv.DictReader(lines, delimiter=';' if ';' in lines[0] else ',')
+    headers = {name.strip().lower(): name for name in reader.fieldnames or []}
+    columns = {
+        field: next((headers[alias] for alias in aliases if alias in headers), None)
+        for field, aliases in CSV_COLUMNS.items()
+    }
+    if not columns['amount'] or not columns['paid_on']:
+        raise ValueError('The CSV statement needs amount and date columns.')
+
+    for number, row in enumerate(reader, start=2):
+        try:
+            yield Payment(
+                line=number,
+                reference=row.get(columns['reference']) if columns['reference'] else '',
+                message=row.get(columns['message']) if columns['message'] else '',
+                amount=_parse_amount(row[columns['amount']]),
+                paid_on=_parse_date(row[columns['paid_on']]),
+            )
+        except (InvalidOperation, ValueError, TypeError, AttributeError):
+            yield Payment(number, '', '', None, None)
+
+
+def parse_ktl(lines):
+    """Yield the payments (record type 3) of a KTL reference payment file."""
+    for number, record in enumerate(lines, start=1):
+        if not record.startswith('3'):
+            continue
+        try:
+            amount = Decimal(int(record[77:87])) / 100
+            if record[87:88] == '1':
+                # Correction records reverse an earlier payment
+                amount = -amount
+            yield Payment(
+                line=number,
+                reference=record[43:63],
+                message='',
+                amount=amount,
+                paid_on=datetime.strptime(record[21:27], '%y%m%d').date(),
+            )
+        except ValueError:
+            yield Payment(number, '', '', None, None)
+
+
+def parse_statement(lines, fmt='auto'):
+    """Parse statement ``lines`` as ``csv`` or ``ktl``, guessing when ``auto``."""
+    lines = [line.rstrip('\r\n') for line in lines if line.strip()]
+    if not lines:
+        return []
+    if fmt == 'auto':
+        fmt = 'ktl' if lines[0][:1] == '0' and len(lines[0]) >= 90 else 'csv'
+    return list(parse_ktl(lines) if fmt == 'ktl' else parse_csv(lines))
+
+
+def reconcile(payments, dry_run=False):
+    """
+    Mark the pending invoices paid by ``payments``.
+
+    A payment matches by reference, or by an invoice number in its message,
+    and only settles the invoice when the amount is exactly right. Matched
+    invoices are updated with one UPDATE per payment date. Nothing is written
+    when ``dry_run`` is set.
+    """
+    by_number = {}
+    by_reference = {}
+    amounts = {}
+    billed = {}
+    for pk, number, amount, billed_at in Invoice.objects.filter(
+        status=InvoiceStatus.PENDING,
+    ).values_list('id', 'invoice_number', 'amount', 'billed_at').iterator(chunk_size=5000):
+        by_number[number] = pk
+        by_reference[normalize_reference(invoice_reference(pk))] = pk
+        amounts[pk] = amount
+        billed[pk] = billed_at
+
+    matched, mismatched, unmatched, duplicates = {}, [], [], []
+    for payment in payments:
+        pk = by_reference.get(normalize_reference(payment.reference))
+        if pk is None:
+            found = INVOICE_NUMBER_RE.search(payment.message or '')
+            pk = by_number.get(found.group()) if found else None
+
+        if pk is None or payment.amount is None:
+            unmatched.append(payment)
+        elif payment.amount != amounts[pk]:
+            mismatched.append((pk, payment))
+        elif pk in matched:
+            duplicates.append((pk, payment))
+        else:
+            matched[pk] = payment
+
+    if matched and not dry_run:
+        by_date = defaultdict(list)
+        for pk, payment in matched.items():
+            by_date[payment.paid_on].append(pk)
+        with transaction.atomic():
+            for paid_on, ids in by_date.items():
+                Invoice.objects.filter(id__in=ids, status=InvoiceStatus.PENDING).update(
+                    status=InvoiceStatus.PAID,
+                    paid_at=timezone.make_aware(datetime.combine(paid_on, time(12))),
+                    updated_at=timezone.now(),
+                )
+            invalidate_invoices()
+            refresh_revenue_on_commit({billed[pk] for pk in matched})
+
+    return Reconciliation(matched, mismatched, unmatched, duplicates)
@@ -0,0 +1,74 @@
+"""
+Monthly revenue read from the rollup table.
+
+Past months come from pre-aggregated ``MonthlyRevenue`` rows (frozen once a
+month is closed); the current month and later, and past months not rolled up
+yet, are summed live from the invoices.
+"""
+from datetime import timedelta
+
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import Invoice, MonthlyRevenue, RevenuePeriod
+
+# Months are frozen once late payments of the month have had time to arrive
+REVENUE_CLOSE_AFTER_DAYS = 60
+
+
+def _live_totals(months, status=None):
+    """Sum ``months`` straight from the invoices."""
+    end = (max(months).replace(day=28) + timedelta(days=4)).replace(day=1)
+    live = Invoice.objects.filter(billed_at__gte=min(months), billed_at__lt=end)
+    if status:
+        live = live.filter(status=status)
+    totals = live.annotate(month=TruncMonth('billed_at')).values_list('month').annotate(total=Sum('amount')).order_by()
+    return {month: total for month, total in totals if month in months}
+
+
+def monthly_revenue(months, status=None):
+    """
+    Return ``{month: total}`` for the month starts in ``months``, optionally for
+    one invoice status. Never writes: past months without a rollup yet are
+    summed live until ``close_revenue_months`` backfills them.
+    """
+    if not months:
+        return {}
+    current = timezone.now().date().replace(day=1)
+    past = [month for month in months if month < current]
+    live = {month for month in months if month >= current}
+    totals = {}
+
+    if past:
+        known = set(RevenuePeriod.objects.filter(month__in=past).values_list('month', flat=True))
+        live |= set(past) - known
+        if known:
+            rollup = MonthlyRevenue.objects.filter(month__in=known)
+            if status:
+                rollup = rollup.filter(status=status)
+            totals.update(rollup.values_list('month').annotate(total=Sum('total')).order_by())
+
+    if live:
+        totals.update(_live_totals(live, status))
+
+    return totals
+
+
+def months_to_backfill(today=None):
+    """Past billing months with invoices that were never rolled up."""
+    current = (today or timezone.now().date()).replace(day=1)
+    months = set(Invoice.objects.filter(billed_at__lt=current).dates('billed_at', 'month'))
+    known = set(RevenuePeriod.objects.values_list('month', flat=True))
+    return sorted(months - known)
+
+
+def months_to_close(today=None, close_after_days=REVENUE_CLOSE_AFTER_DAYS):
+    """Billing months old enough to be frozen that are still open."""
+    today = today or timezone.now().date()
+    cutoff = (today - timedelta(days=close_after_days)).replace(day=1)
+    months = {month for month in Invoice.objects.filter(billed_at__lt=cutoff).dates('billed_at', 'month')}
+    closed = set(RevenuePeriod.objects.filter(closed_at__isnull=False).values_list('month', flat=True))
+    # Periods refreshed by saves may exist without invoices; close them as well
+    months |= set(RevenuePeriod.objects.filter(month__lt=cutoff).values_list('month', flat=True))
+    return sorted(months - closed)
@@ -0,0 +1,70 @@
+"""
+Set-based invoice operations that work on many invoices per query.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from kesamokki.reservations.models import Reservation, ReservationStatus
+from .models import Invoice, InvoiceNumberCounter, invalidate_invoices, refresh_revenue_on_commit
+
+INVOICE_DUE_DAYS = 14
+INVOICE_BATCH_SIZE = 1000
+
+
+def uninvoiced_reservations(queryset=None):
+    """Confirmed reservations of ``queryset`` that have no invoice yet."""
+    queryset = Reservation.objects.all() if queryset is None else queryset
+    return queryset.filter(status=ReservationStatus.CONFIRMED, invoice__isnull=True)
+
+
+def generate_invoices(queryset=None, billed_at=None, due_days=INVOICE_DUE_DAYS, batch_size=INVOICE_BATCH_SIZE):
+    """
+    Invoice every confirmed reservation of ``queryset`` that lacks an invoice.
+
+    The reservations are found with one anti-join and locked; rows another
+    transaction holds (for example a single invoice being created) are
+    skipped and left for the next run. They are invoiced in chunks of
+    ``batch_size``: each chunk reserves a block of numbers and is written with
+    a single ``bulk_create``. Returns the number of invoices created.
+    """
+    billed_at = billed_at or timezone.now().date()
+    due_date = billed_at + timedelta(days=due_days)
+    created = 0
+
+    with transaction.atomic():
+        # Lock the year's counter first so a concurrent run waits for us
+        # instead of invoicing the same reservations
+        InvoiceNumberCounter.objects.allocate(billed_at.year, count=0)
+        rows = list(
+            uninvoiced_reservations(queryset)
+            .select_for_update(skip_locked=True, of=('self',))
+            .order_by('id')
+            .values_list('id', 'total_price')
+        )
+        # Invoices committed between the anti-join's snapshot and our locks
+        invoiced = set(Invoice.objects.filter(
+            reservation_id__in=[pk for pk, _total in rows],
+        ).values_list('reservation_id', flat=True))
+        rows = [row for row in rows if row[0] not in invoiced]
+
+        for offset in range(0, len(rows), batch_size):
+            batch = rows[offset:offset + batch_size]
+            numbers = InvoiceNumberCounter.objects.allocate(billed_at.year, count=len(batch))
+            Invoice.objects.bulk_create([
+                Invoice(
+                    reservation_id=reservation_id,
+                    invoice_number=number,
+                    billed_at=billed_at,
+                    due_date=due_date,
+                    amount=total_price,
+                )
+                for (reservation_id, total_price), number in zip(batch, numbers, strict=True)
+            ])
+            created += len(batch)
+
+    if created:
+        invalidate_invoices()
+        refresh_revenue_on_commit({billed_at})
+    return created
@@ -1,13 +1,33 @@
-from django.test import TestCase
+from django.conf import settings
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection, connections
+from django.core.cache import cache
+from django.core import mail
+from django.core.mail.backends import locmem
 from django.utils import timezone
 from django.core.exceptions import ValidationError
 from django.urls import reverse
+from django.contrib.admin import site
+from django.core.management import call_command
+from io import StringIO
+import os
+import smtplib
+import shutil
+import tempfile
+import zipfile
+from io import BytesIO
+from unittest import mock
 from datetime import timedelta, date
 
 from kesamokki.users.models import User, Customer
 from kesamokki.cottages.models import Cottage
 from kesamokki.reservations.models import Reservation, ReservationStatus
-from .models import Invoice
+from .models import Invoice, InvoiceNumberCounter, format_invoice_number, reference_number
+from .reconciliation import parse_statement, reconcile
+from .services import generate_invoices
+from .dunning import send_overdue_reminders
+from .artifacts import artifact_path, get_artifact
 
 class InvoiceModelTests(TestCase):
     """Test suite for the Invoice model."""
@@ -90,6 +110,149 @@ class InvoiceModelTests(TestCase):
         self.assertIsNotNone(invoice.invoice_number)
         self.assertTrue(invoice.invoice_number.startswith('INV-'))
     
+    def test_invoice_number_allocation(self):
+        """Test that numbers are handed out in blocks and restart every year."""
+        with self.assertNumQueries(1):
+            block = InvoiceNumberCounter.objects.allocate(2025, count=3)
+        self.assertEqual(block, ['INV-2025-00001', 'INV-2025-00002', 'INV-2025-00003'])
+        self.assertEqual(InvoiceNumberCounter.objects.allocate(2025), ['INV-2025-00004'])
+        self.assertEqual(InvoiceNumberCounter.objects.allocate(2026), ['INV-2026-00001'])
+        
+        invoice = Invoice.objects.create(
+            reservation=self.reservation,
+            billed_at=date(2025, 6, 1),
+            due_date=date(2025, 6, 15)
+        )
+        self.assertEqual(invoice.invoice_number, 'INV-2025-00005')
+    
+    def test_generate_invoices_command(self):
+        """Test that the bulk run invoices only confirmed, uninvoiced reservations."""
+        today = timezone.now().date()
+        stays = [
+            Reservation.objects.create(
+                cottage=self.cottage, user=self.user, customer=self.customer,
+                start_date=today + timedelta(days=10 + 3 * n), end_date=today + timedelta(days=12 + 3 * n),
+                guests=2, total_price=200 + n, status=status
+            )
+            for n, status in enumerate([ReservationStatus.CONFIRMED, ReservationStatus.PENDING])
+        ]
+        existing = Invoice.objects.create(
+            reservation=self.reservation, billed_at=today, due_date=today + timedelta(days=14)
+        )
+        
+        call_command('generate_invoices', '--billed-at=2025-03-01', '--batch-size=1', stdout=StringIO())
+        
+        invoice = Invoice.objects.exclude(pk=existing.pk).get()
+        self.assertEqual(invoice.reservation, stays[0])
+        self.assertEqual(invoice.amount, stays[0].total_price)
+        self.assertEqual(invoice.invoice_number, 'INV-2025-00001')
+        self.assertEqual(invoice.due_date, date(2025, 3, 15))
+        
+        # A second run finds nothing left to invoice
+        call_command('generate_invoices', stdout=StringIO())
+        self.assertEqual(Invoice.objects.count(), 2)
+    
+    def test_reference_number_check_digit(self):
+        """Test the Finnish reference number check digit."""
+        self.assertEqual(reference_number('123'), '1232')
+        self.assertEqual(reference_number('1234561'), '12345614')
+    
+    def test_bank_statement_reconciliation(self):
+        """Test that statement lines mark the matching invoices paid in bulk."""
+        invoice = Invoice.objects.create(
+            reservation=self.reservation, billed_at=date(2025, 5, 1), due_date=date(2025, 5, 15)
+        )
+        csv_lines = [
+            'Date;Amount;Reference;Message\n',
+            f'2.5.2025;250,00;{invoice.reference_number};\n',
+            f'3.5.2025;250,00;;Payment for {invoice.invoice_number}\n',
+            '3.5.2025;99,00;9999;\n',
+        ]
+        payments = parse_statement(csv_lines)
+        
+        result = reconcile(payments, dry_run=True)
+        self.assertEqual(list(result.matched), [invoice.pk])
+        self.assertEqual(len(result.duplicates), 1)
+        self.assertEqual([p.line for p in result.unmatched], [4])
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.status, 'pending')
+        
+        # The same payment as a KTL reference payment record
+        record = (
+            '3' + '0' * 14 + '250502' + '250502' + 'A' * 16
+            + invoice.reference_number.rjust(20, '0') + 'PAYER'.ljust(12) + '1' + ' '
+            + '0000025000' + '0' + ' ' + ' '
+        )
+        self.assertEqual(len(record), 90)
+        # Index read, one UPDATE and the savepoint around it
+        with self.assertNumQueries(4):
+            result = reconcile(parse_statement(['0' * 90, record], 'ktl'))
+        self.assertEqual(len(result.matched), 1)
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.status, 'paid')
+        self.assertEqual(timezone.localtime(invoice.paid_at).date(), date(2025, 5, 2))
+    
+    def test_send_overdue_reminders(self):
+        """Test that overdue invoices are reminded once per interval."""
+        today = timezone.now().date()
+        overdue = Invoice.objects.create(
+            reservation=self.reservation, billed_at=today - timedelta(days=30), due_date=today - timedelta(days=2)
+        )
+        other = Reservation.objects.create(
+            cottage=self.cottage, user=self.user, customer=self.customer,
+            start_date=today + timedelta(days=20), end_date=today + timedelta(days=22),
+            guests=2, total_price=250.00, status=ReservationStatus.CONFIRMED
+        )
+        Invoice.objects.create(reservation=other, billed_at=today, due_date=today + timedelta(days=14))
+        Customer.objects.filter(pk=self.customer.pk).update(full_name="O'Neill & Sons")
+        
+        call_command('send_invoice_reminders', stdout=StringIO())
+        
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['customer@example.com'])
+        self.assertIn(overdue.reference_number, mail.outbox[0].body)
+        # Plain-text mail is not HTML-escaped
+        self.assertIn("Hello O'Neill & Sons,", mail.outbox[0].body)
+        overdue.refresh_from_db()
+        self.assertEqual(overdue.reminder_count, 1)
+        self.assertIsNotNone(overdue.last_reminded_at)
+        
+        # Reminded invoices wait for the next interval
+        call_command('send_invoice_reminders', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+    
+    def test_failed_reminder_does_not_stop_the_batch(self):
+        """Test that one undeliverable reminder is retried later while the rest are sent and stamped."""
+        today = timezone.now().date()
+        other = Reservation.objects.create(
+            cottage=self.cottage, user=self.user, customer=Customer.objects.create(
+                full_name='Bounce', email='bounce@example.com', address_line1='1 Test St'
+            ),
+            start_date=today + timedelta(days=20), end_date=today + timedelta(days=22),
+            guests=2, total_price=250.00, status=ReservationStatus.CONFIRMED
+        )
+        bounced = Invoice.objects.create(
+            reservation=other, billed_at=today - timedelta(days=30), due_date=today - timedelta(days=5)
+        )
+        delivered = Invoice.objects.create(
+            reservation=self.reservation, billed_at=today - timedelta(days=30), due_date=today - timedelta(days=2)
+        )
+        original = locmem.EmailBackend.send_messages
+
+        def send_messages(backend, messages):
+            if messages[0].to == ['bounce@example.com']:
+                raise smtplib.SMTPRecipientsRefused({'bounce@example.com': (550, b'No such user')})
+            return original(backend, messages)
+
+        with mock.patch.object(locmem.EmailBackend, 'send_messages', send_messages), \
+                self.assertLogs('kesamokki.invoices.dunning', 'ERROR'):
+            self.assertEqual(send_overdue_reminders(batch_size=1), (1, 0, 1))
+
+        self.assertEqual([message.to for message in mail.outbox], [['customer@example.com']])
+        bounced.refresh_from_db()
+        delivered.refresh_from_db()
+        self.assertEqual((bounced.reminder_count, delivered.reminder_count), (0, 1))
+    
     def test_invoice_amount_auto_from_reservation(self):
         """Test that invoice amount is automatically set from reservation."""
         invoice = Invoice.objects.create(
@@ -187,6 +350,38 @@ class InvoiceViewTests(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertContains(response, 'INV-001')
     
+    def test_invoice_list_counters_are_cached(self):
+        """Test that the status counters cost one aggregate and are invalidated by saves."""
+        cache.clear()
+        url = reverse('invoices:list')
+        
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        counts = [q['sql'] for q in queries.captured_queries if 'COUNT(' in q['sql']]
+        self.assertEqual(len(counts), 1)
+        self.assertEqual(response.context['pending_count'], 1)
+        
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'status': 'pending'})
+        self.assertFalse([q for q in queries.captured_queries if 'COUNT(' in q['sql']])
+        self.assertEqual(response.context['paginator'].count, 1)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.invoice.mark_as_paid()
+        response = self.client.get(url)
+        self.assertEqual(response.context['pending_count'], 0)
+        self.assertEqual(response.context['paid_count'], 1)
+
+    def test_admin_bulk_delete_invalidates_counters(self):
+        """Test that deleting through the admin's delete_selected action refreshes the counters."""
+        cache.clear()
+        url = reverse('invoices:list')
+        self.assertEqual(self.client.get(url).context['pending_count'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            site.get_model_admin(Invoice).delete_queryset(None, Invoice.objects.all())
+        self.assertEqual(self.client.get(url).context['pending_count'], 0)
+
     def test_invoice_detail_view(self):
         """Test accessing the invoice detail view."""
         response = self.client.get(
@@ -195,3 +390,250 @@ class InvoiceViewTests(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertContains(response, 'INV-001')
         self.assertContains(response, str(self.reservation.total_price))
+    
+    def test_invoice_print_artifact(self):
+        """Test that the print page is rendered once and served with an ETag."""
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        url = reverse('invoices:print', kwargs={'pk': self.invoice.pk})
+        
+        storage = {'BACKEND': 'django.core.files.storage.FileSystemStorage', 'OPTIONS': {'location': media_root}}
+        
+        with override_settings(STORAGES={**settings.STORAGES, 'invoices': storage}):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn(b'INV-001', b''.join(response.streaming_content))
+            etag = response['ETag']
+            stale = Invoice.objects.select_related('reservation__customer', 'reservation__cottage').get(pk=self.invoice.pk)
+            
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            
+            # Changing a printed field produces a new artifact and drops the old one
+            invoice = Invoice.objects.get(pk=self.invoice.pk)
+            invoice.notes = 'Late check-out'
+            invoice.save()
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+            self.assertIn(b'Late check-out', b''.join(response.streaming_content))
+            
+            invoice = Invoice.objects.get(pk=self.invoice.pk)
+            self.assertEqual(f'"{invoice.artifact_hash}"', response['ETag'])
+            self.assertEqual(len(os.listdir(os.path.join(media_root, 'invoices', str(invoice.pk)))), 1)
+            
+            # A request rendering from stale data never deletes the newer file
+            stale.notes = 'Outdated'
+            get_artifact(stale)
+            self.assertTrue(os.path.exists(os.path.join(media_root, artifact_path(invoice, invoice.artifact_hash))))
+            self.assertEqual(Invoice.objects.get(pk=invoice.pk).artifact_hash, invoice.artifact_hash)
+            
+            # A lost file is rendered again instead of served as missing
+            shutil.rmtree(os.path.join(media_root, 'invoices'))
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn(b'Late check-out', b''.join(response.streaming_content))
+    
+    def test_export_invoices_zip(self):
+        """Test that staff can stream a ZIP of the filtered invoices."""
+        url = reverse('invoices:export-zip')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 302)
+        
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(url, {'status': 'pending', 'billed_from': timezone.now().date().isoformat()})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        archive = zipfile.ZipFile(BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(archive.namelist(), ['INV-001.html'])
+        self.assertIn(b'INV-001', archive.read('INV-001.html'))
+        # The archive holds the stored document the print view serves
+        printed = self.client.get(reverse('invoices:print', kwargs={'pk': self.invoice.pk}))
+        self.assertEqual(archive.read('INV-001.html'), b''.join(printed.streaming_content))
+        
+        response = self.client.get(url, {'status': 'paid'})
+        self.assertEqual(zipfile.ZipFile(BytesIO(b''.join(response.streaming_content))).namelist(), [])
+    
+    def test_export_invoices_csv(self):
+        """Test that staff can stream the filtered invoices as CSV."""
+        self.user.is_staff = True
+        self.user.save()
+        url = reverse('invoices:export-csv')
+        
+        response = self.client.get(url, {'status': 'pending'})
+        self.assertEqual(response.status_code, 200)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'Invoice number,Reservation,Customer,Cottage,Amount,Billed at,Due date,Status,Paid at')
+        self.assertTrue(lines[1].startswith(f'INV-001,{self.reservation.pk},Test Customer,Test Cottage,250.00,'))
+        
+        response = self.client.get(url, {'status': 'paid'})
+        self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 1)
+    
+    def test_create_invoice_number_collision_is_reported(self):
+        """Test that an integrity error other than a duplicate invoice re-renders the form."""
+        today = timezone.now().date()
+        reservation = Reservation.objects.create(
+            cottage=self.cottage,
+            user=self.user,
+            customer=self.customer,
+            start_date=today + timedelta(days=5),
+            end_date=today + timedelta(days=7),
+            guests=2,
+            total_price=250.00,
+            status=ReservationStatus.CONFIRMED
+        )
+        # The next allocated number is already taken by a hand-numbered invoice
+        Invoice.objects.filter(pk=self.invoice.pk).update(invoice_number=format_invoice_number(today.year, 1))
+        
+        response = self.client.post(reverse('invoices:create', kwargs={'reservation_id': reservation.pk}), {
+            'reservation': reservation.pk,
+            'billed_at': today,
+            'due_date': today + timedelta(days=14),
+            'notes': '',
+        })
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'The invoice could not be saved.')
+        self.assertFalse(Invoice.objects.filter(reservation=reservation).exists())
+    
+    def test_create_invoice_idempotent_submit(self):
+        """Test that a double-submitted invoice form is processed once."""
+        cache.clear()
+        reservation = Reservation.objects.create(
+            cottage=self.cottage,
+            user=self.user,
+            customer=self.customer,
+            start_date=timezone.now().date() + timedelta(days=5),
+            end_date=timezone.now().date() + timedelta(days=7),
+            guests=2,
+            total_price=250.00,
+            status=ReservationStatus.CONFIRMED
+        )
+        data = {
+            'reservation': reservation.pk,
+            'billed_at': timezone.now().date(),
+            'due_date': timezone.now().date() + timedelta(days=14),
+            'notes': '',
+            'idempotency_key': 'same-form',
+        }
+        url = reverse('invoices:create', kwargs={'reservation_id': reservation.pk})
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.client.post(url, data)
+        second = self.client.post(url, data)
+        
+        self.assertEqual(second.status_code, 302)
+        self.assertEqual(second['Location'], first['Location'])
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(Invoice.objects.filter(reservation=reservation).count(), 1)
+
+
+class LedgerFeedTests(TransactionTestCase):
+    """Ledger feed tests; they need real commits because the cursor follows transaction ids."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.user = User.objects.create_user(
+            email='staff@example.com', password='testpass123', name='Staff User', is_staff=True
+        )
+        self.client.login(email='staff@example.com', password='testpass123')
+        customer = Customer.objects.create(full_name='Test Customer', address_line1='123 Test St')
+        cottage = Cottage.objects.create(
+            name='Test Cottage', description='A test cottage', location='Kuopio',
+            beds=4, base_price=100.00, cleaning_fee=50.00
+        )
+        today = timezone.now().date()
+        self.reservation = Reservation.objects.create(
+            cottage=cottage, user=self.user, customer=customer,
+            start_date=today + timedelta(days=1), end_date=today + timedelta(days=3),
+            guests=2, total_price=250.00, status=ReservationStatus.CONFIRMED
+        )
+        self.invoice = Invoice.objects.create(
+            reservation=self.reservation, billed_at=today, due_date=today + timedelta(days=14)
+        )
+        self.url = reverse('invoices:ledger')
+
+    def test_ledger_feed_pages_with_cursor(self):
+        """Test that the ledger feed returns each change once, in keyset order."""
+        first = self.client.get(self.url, {'limit': 1}).json()
+        self.assertEqual([row['id'] for row in first['invoices']], [self.invoice.pk])
+        self.assertEqual([row['id'] for row in first['reservations']], [self.reservation.pk])
+        self.assertFalse(first['has_more'])
+
+        # Nothing changed since the cursor
+        second = self.client.get(self.url, {'cursor': first['cursor']}).json()
+        self.assertEqual((second['invoices'], second['reservations']), ([], []))
+
+        Invoice.objects.filter(pk=self.invoice.pk).update(status='paid')
+        third = self.client.get(self.url, {'cursor': second['cursor']}).json()
+        self.assertEqual([row['status'] for row in third['invoices']], ['paid'])
+        self.assertEqual(third['reservations'], [])
+
+        self.assertEqual(self.client.get(self.url, {'cursor': 'not-a-cursor'}).status_code, 400)
+
+    def test_slow_transaction_is_not_skipped(self):
+        """Test that a change committed after later ones still reaches a consumer."""
+        cursor = self.client.get(self.url).json()['cursor']
+
+        # A long transaction writes first but commits last
+        slow = connections.create_connection('default')
+        try:
+            with slow.cursor() as sql:
+                sql.execute('BEGIN')
+                sql.execute("UPDATE invoices_invoice SET status = 'cancelled' WHERE id = %s", [self.invoice.pk])
+                Reservation.objects.filter(pk=self.reservation.pk).update(guests=3)
+
+                # Nothing at or after the open transaction is handed out yet
+                waiting = self.client.get(self.url, {'cursor': cursor}).json()
+                self.assertEqual((waiting['invoices'], waiting['reservations']), ([], []))
+                self.assertEqual(waiting['cursor'], cursor)
+                sql.execute('COMMIT')
+        finally:
+            slow.close()
+
+        caught_up = self.client.get(self.url, {'cursor': cursor}).json()
+        self.assertEqual([row['status'] for row in caught_up['invoices']], ['cancelled'])
+        self.assertEqual([row['guests'] for row in caught_up['reservations']], [3])
+
+
+class GenerateInvoicesLockingTests(TransactionTestCase):
+    """Bulk invoicing next to other transactions holding reservations."""
+
+    def setUp(self):
+        """Set up test data."""
+        user = User.objects.create_user(email='staff@example.com', password='testpass123', name='Staff User')
+        customer = Customer.objects.create(full_name='Test Customer', address_line1='123 Test St')
+        cottages = [
+            Cottage.objects.create(
+                name=f'Cottage {n}', description='A test cottage', location='Kuopio',
+                beds=4, base_price=100.00, cleaning_fee=50.00
+            )
+            for n in range(2)
+        ]
+        start = timezone.now().date() + timedelta(days=1)
+        self.reservations = [
+            Reservation.objects.create(
+                cottage=cottage, user=user, customer=customer,
+                start_date=start, end_date=start + timedelta(days=2),
+                guests=2, total_price=250.00, status=ReservationStatus.CONFIRMED
+            )
+            for cottage in cottages
+        ]
+
+    def test_reservations_held_elsewhere_are_skipped(self):
+        """Test that a reservation locked by a concurrent invoice creation doesn't abort the batch."""
+        held, free = self.reservations
+        other = connections.create_connection('default')
+        try:
+            with other.cursor() as sql:
+                sql.execute('BEGIN')
+                sql.execute('SELECT id FROM reservations_reservation WHERE id = %s FOR UPDATE', [held.pk])
+                self.assertEqual(generate_invoices(), 1)
+                sql.execute('ROLLBACK')
+        finally:
+            other.close()
+
+        self.assertTrue(Invoice.objects.filter(reservation=free).exists())
+        self.assertEqual(generate_invoices(), 1)
+        self.assertTrue(Invoice.objects.filter(reservation=held).exists())
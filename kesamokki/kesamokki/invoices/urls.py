@@ -6,6 +6,9 @@ app_name = 'invoices'
 urlpatterns = [
     path('', views.InvoiceListView.as_view(), name='list'),
     path('<int:pk>/', views.InvoiceDetailView.as_view(), name='detail'),
+    path('export/zip/', views.export_invoices_zip, name='export-zip'),
+    path('export/csv/', views.export_invoices_csv, name='export-csv'),
+    path('ledger/', views.ledger_feed, name='ledger'),
     path('create/<int:reservation_id>/', views.create_invoice_view, name='create'),
     path('<int:pk>/mark-paid/', views.mark_invoice_paid, name='mark_paid'),
     path('<int:pk>/print/', views.invoice_print_view, name='print'),
@@ -5,11 +5,37 @@ from django.views.generic import ListView, DetailView, CreateView
 from django.urls import reverse_lazy, reverse
 from django.utils import timezone
 from django.contrib import messages
+from django.core.exceptions import ValidationError
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Q
+from django.http import FileResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
 from datetime import timedelta
+import uuid
 
-from .models import Invoice
+from .artifacts import get_artifact, open_artifact
+from .ledger import LEDGER_MAX_PAGE_SIZE, LEDGER_PAGE_SIZE, InvalidCursor, ledger_changes
+from .export import INVOICE_EXPORT_COLUMNS, filter_invoices, iter_invoice_zip, parse_filter_date
+from .models import INVOICES_VERSION_KEY, Invoice, InvoiceStatus
 from .forms import InvoiceForm
 from kesamokki.reservations.models import Reservation
+from kesamokki.utils.cache import get_version
+from kesamokki.utils.csv_export import csv_response
+from kesamokki.utils.idempotency import idempotent
+
+
+INVOICE_SUMMARY_TIMEOUT = 60 * 60
+
+
+def invoice_summary(queryset, today):
+    """Count the invoices of ``queryset`` per status with one conditional aggregate."""
+    return queryset.aggregate(
+        total=Count('id'),
+        pending=Count('id', filter=Q(status=InvoiceStatus.PENDING)),
+        paid=Count('id', filter=Q(status=InvoiceStatus.PAID)),
+        cancelled=Count('id', filter=Q(status=InvoiceStatus.CANCELLED)),
+        overdue=Count('id', filter=Q(status=InvoiceStatus.PENDING, due_date__lt=today)),
+    )
 
 
 class InvoiceListView(LoginRequiredMixin, ListView):
@@ -19,38 +45,47 @@ class InvoiceListView(LoginRequiredMixin, ListView):
     context_object_name = 'invoices'
     paginate_by = 20  # Show 20 invoices per page
     
+    def get_base_queryset(self):
+        """Invoices the user may see: all for staff, their own for customers."""
+        if self.request.user.is_staff:
+            return Invoice.objects.all()
+        return Invoice.objects.filter(reservation__user=self.request.user)
+    
     def get_queryset(self):
         """Filter invoices by user if not staff and apply status filters."""
-        queryset = Invoice.objects.all() if self.request.user.is_staff else Invoice.objects.filter(reservation__user=self.request.user)
-        
-        # Filter by status if provided in GET parameters
+        return filter_invoices(self.get_base_queryset(), self.request.GET.get('status'))
+    
+    def get_summary(self):
+        """Status counters, cached until an invoice changes or the day ends."""
+        if not hasattr(self, '_summary'):
+            today = timezone.now().date()
+            scope = 'staff' if self.request.user.is_staff else f'user-{self.request.user.pk}'
+            cache_key = f'invoices:summary:{scope}:{today.isoformat()}'
+            version = get_version(INVOICES_VERSION_KEY)
+            self._summary = cache.get(cache_key, version=version)
+            if self._summary is None:
+                self._summary = invoice_summary(self.get_base_queryset(), today)
+                cache.set(cache_key, self._summary, INVOICE_SUMMARY_TIMEOUT, version=version)
+        return self._summary
+    
+    def get_paginator(self, queryset, per_page, **kwargs):
+        # The counters already know how many rows match, so skip the COUNT query
+        paginator = super().get_paginator(queryset, per_page, **kwargs)
         status_filter = self.request.GET.get('status')
-        if status_filter in ['pending', 'paid', 'cancelled']:
-            queryset = queryset.filter(status=status_filter)
-        
-        # Filter overdue invoices if requested
-        if status_filter == 'overdue':
-            queryset = queryset.filter(
-                status='pending',
-                due_date__lt=timezone.now().date()
-            )
-        
-        return queryset
+        key = status_filter if status_filter in ['pending', 'paid', 'cancelled', 'overdue'] else 'total'
+        paginator.count = self.get_summary()[key]
+        return paginator
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        base_queryset = Invoice.objects.all() if self.request.user.is_staff else Invoice.objects.filter(reservation__user=self.request.user)
+        summary = self.get_summary()
         
         # Add counts for different statuses
-        context['pending_count'] = base_queryset.filter(status='pending').count()
-        context['paid_count'] = base_queryset.filter(status='paid').count()
-        context['cancelled_count'] = base_queryset.filter(status='cancelled').count()
-        
-        # Count overdue invoices
-        context['overdue_count'] = base_queryset.filter(
-            status='pending',
-            due_date__lt=timezone.now().date()
-        ).count()
+        context['total_count'] = summary['total']
+        context['pending_count'] = summary['pending']
+        context['paid_count'] = summary['paid']
+        context['cancelled_count'] = summary['cancelled']
+        context['overdue_count'] = summary['overdue']
         
         # Get current filter
         context['current_status'] = self.request.GET.get('status', 'all')
@@ -72,6 +107,7 @@ class InvoiceDetailView(LoginRequiredMixin, DetailView):
 
 
 @login_required
+@idempotent
 def create_invoice_view(request, reservation_id):
     """View for creating a new invoice from a reservation."""
     reservation = get_object_or_404(Reservation, id=reservation_id)
@@ -97,15 +133,31 @@ def create_invoice_view(request, reservation_id):
     if request.method == 'POST':
         form = InvoiceForm(request.POST)
         if form.is_valid():
-            invoice = form.save()
-            messages.success(request, "Invoice created successfully!")
-            return redirect('invoices:detail', pk=invoice.pk)
+            try:
+                with transaction.atomic():
+                    invoice = form.save()
+            except (ValidationError, IntegrityError) as e:
+                existing = Invoice.objects.filter(reservation=reservation).first()
+                if existing:
+                    # A concurrent request created the invoice after our check above
+                    messages.warning(request, "An invoice already exists for this reservation.")
+                    return redirect('invoices:detail', pk=existing.pk)
+                # Some other check failed, e.g. an invoice number collision
+                if isinstance(e, ValidationError):
+                    form.add_error(None, e)
+                else:
+                    form.add_error(None, "The invoice could not be saved. Please try again.")
+            else:
+                messages.success(request, "Invoice created successfully!")
+                return redirect('invoices:detail', pk=invoice.pk)
     else:
         form = InvoiceForm(initial=initial_data)
     
     return render(request, 'pages/create_invoice.html', {
         'form': form,
         'reservation': reservation,
+        # Fresh key per rendered form so a double submit is only processed once
+        'idempotency_key': uuid.uuid4().hex,
     })
 
 
@@ -127,14 +179,72 @@ def mark_invoice_paid(request, pk):
 
 @login_required
 def invoice_print_view(request, pk):
-    """Display a print-friendly version of the invoice."""
-    invoice = get_object_or_404(Invoice, pk=pk)
+    """Serve the stored print-friendly version of the invoice."""
+    invoice = get_object_or_404(
+        Invoice.objects.select_related('reservation__customer', 'reservation__cottage'), pk=pk,
+    )
     
     # Check if user is authorized to view this invoice
-    if not request.user.is_staff and invoice.reservation.user != request.user:
+    if not request.user.is_staff and invoice.reservation.user_id != request.user.pk:
         messages.error(request, "You don't have permission to access this invoice.")
         return redirect('invoices:list')
     
-    return render(request, 'pages/invoice_print.html', {
-        'invoice': invoice
-    })
\ No newline at end of file
+    digest = get_artifact(invoice)
+    etag = f'"{digest}"'
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponseNotModified()
+    else:
+        response = FileResponse(open_artifact(invoice, digest), content_type='text/html; charset=utf-8')
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def _export_queryset(request):
+    """All invoices narrowed by the list filters in the query string."""
+    return filter_invoices(
+        Invoice.objects.all(),
+        request.GET.get('status'),
+        billed_from=parse_filter_date(request.GET.get('billed_from')),
+        billed_to=parse_filter_date(request.GET.get('billed_to')),
+    )
+
+
+@login_required
+def export_invoices_zip(request):
+    """Stream a ZIP of the print pages of every invoice matching the list filters."""
+    if not request.user.is_staff:
+        messages.error(request, "You don't have permission to export invoices.")
+        return redirect('invoices:list')
+    
+    response = StreamingHttpResponse(iter_invoice_zip(_export_queryset(request)), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="invoices-{timezone.now():%Y%m%d-%H%M%S}.zip"'
+    return response
+
+
+@login_required
+def export_invoices_csv(request):
+    """Stream the invoices matching the list filters as CSV."""
+    if not request.user.is_staff:
+        messages.error(request, "You don't have permission to export invoices.")
+        return redirect('invoices:list')
+    
+    return csv_response(_export_queryset(request).order_by('billed_at', 'id'), INVOICE_EXPORT_COLUMNS, 'invoices')
+
+
+@login_required
+def ledger_feed(request):
+    """Invoice and reservation changes since the ``cursor`` of the previous sync."""
+    if not request.user.is_staff:
+        return JsonResponse({'success': False, 'error': 'Permission denied.'}, status=403)
+    
+    try:
+        limit = min(int(request.GET.get('limit', LEDGER_PAGE_SIZE)), LEDGER_MAX_PAGE_SIZE)
+    except ValueError:
+        limit = LEDGER_PAGE_SIZE
+    try:
+        changes = ledger_changes(request.GET.get('cursor'), max(limit, 1))
+    except InvalidCursor as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    
+    return JsonResponse({'success': True, **changes})
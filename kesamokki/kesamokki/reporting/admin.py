@@ -1,3 +1,14 @@
 from django.contrib import admin
+from .models import ReportJob
 
-# Register your models here.
+
+@admin.register(ReportJob)
+class ReportJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'status', 'progress', 'requested_by', 'created_at', 'finished_at')
+    list_filter = ('status', 'created_at')
+    readonly_fields = (
+        'id', 'params', 'status', 'progress', 'error', 'requested_by',
+        'created_at', 'started_at', 'heartbeat_at', 'finished_at',
+    )
+    # Results can be large; they are served by the polling endpoint
+    exclude = ('result',)
@@ -0,0 +1,78 @@
+"""
+Background execution of queued report jobs.
+
+Long reports are queued as ``ReportJob`` rows by the reporting API. The
+``run_report_worker`` command runs next to the web server, claims jobs one at
+a time, stores the result on the job and in the report cache, and records
+failures on the job so the polling client gets an answer either way.
+"""
+import threading
+import time
+from datetime import timedelta
+
+from django.db import close_old_connections, connection
+
+from .models import ReportJob
+from .reports import get_report, load_filters
+
+# A running job without a heartbeat for this long lost its worker and is queued again
+REPORT_JOB_STALE_AFTER = timedelta(minutes=30)
+# How often a running job reports that its worker is alive, whatever it is computing
+REPORT_JOB_HEARTBEAT_EVERY = timedelta(minutes=1)
+# Finished jobs are kept this long for clients that poll late
+REPORT_JOB_KEEP = timedelta(days=7)
+
+
+def _heartbeat(job, stop, interval):
+    """Mark ``job`` alive every ``interval`` seconds until ``stop`` is set."""
+    try:
+        while not stop.wait(interval):
+            job.heartbeat()
+    finally:
+        # The thread has its own database connection
+        connection.close()
+
+
+def run_job(job):
+    """Compute ``job`` and store its result or error. Returns whether it was stored."""
+    # Sections of a multi-year report can run longer than REPORT_JOB_STALE_AFTER,
+    # so liveness doesn't wait for the next progress step
+    stop = threading.Event()
+    beat = threading.Thread(
+        target=_heartbeat, args=(job, stop, REPORT_JOB_HEARTBEAT_EVERY.total_seconds()), daemon=True,
+    )
+    beat.start()
+    try:
+        result = get_report(load_filters(job.params), progress=job.set_progress)
+    except Exception as e:
+        return job.finish(error=f'{type(e).__name__}: {e}')
+    finally:
+        stop.set()
+        beat.join()
+    return job.finish(result=result)
+
+
+def run_pending(limit=None):
+    """Run queued jobs until the queue is empty or ``limit`` jobs ran. Returns the count."""
+    count = 0
+    while limit is None or count < limit:
+        job = ReportJob.objects.claim()
+        if job is None:
+            break
+        run_job(job)
+        count += 1
+    return count
+
+
+def work(poll_interval=2.0, once=False):
+    """Worker loop: housekeeping, then drain the queue, then sleep."""
+    while True:
+        ReportJob.objects.requeue_stale(REPORT_JOB_STALE_AFTER)
+        ReportJob.objects.purge(REPORT_JOB_KEEP)
+        ran = run_pending()
+        if once:
+            return ran
+        # A long-lived process must not hold on to broken or expired connections
+        close_old_connections()
+        if not ran:
+            time.sleep(poll_interval)
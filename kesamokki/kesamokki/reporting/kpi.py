@@ -0,0 +1,134 @@
+"""
+Vectorized hospitality KPIs for the reporting dashboard.
+
+Reservations of the window (with their invoice amount) are loaded once into
+columnar NumPy arrays. Nights sold and room revenue per cottage and day come
+from difference arrays, so a multi-year, many-cottage report costs one query
+and a handful of array operations. Like the occupancy engine, every stay that
+is not cancelled counts, and a night of a cottage is sold at most once even
+when stays overlap. Room revenue leaves out the cleaning fee:
+
+* occupancy - nights sold / nights available
+* ADR - room revenue / nights sold
+* RevPAR - room revenue / nights available
+* ALOS - average nights of the stays arriving in the period
+* lead time - average days between booking and arrival
+"""
+import numpy as np
+from django.db.models import F
+from django.db.models.functions import Coalesce
+
+from kesamokki.reservations.models import Reservation, ReservationStatus
+
+GRANULARITIES = ('day', 'week', 'month')
+KPI_KEYS = ('periods', 'occupancy', 'adr', 'revpar', 'alos', 'lead_time', 'nights_sold', 'revenue')
+
+
+def _load(cottage_ids, start, end):
+    """One query: the non-cancelled stays touching [start, end) as column arrays."""
+    rows = Reservation.objects.filter(
+        cottage_id__in=cottage_ids,
+        start_date__lt=end,
+        end_date__gt=start,
+    ).exclude(
+        status=ReservationStatus.CANCELLED,
+    ).values_list(
+        'cottage_id', 'start_date', 'end_date', 'created_at__date',
+        # The invoiced amount wins over the booked price once an invoice exists;
+        # the cleaning fee is not room revenue
+        Coalesce('invoice__amount', F('total_price')) - F('cottage__cleaning_fee'),
+    )
+    rows = list(rows)
+    if not rows:
+        empty = np.array([], dtype='datetime64[D]')
+        return np.array([], dtype=np.int64), empty, empty, empty, np.array([], dtype=float)
+    cottages, arrivals, departures, booked, amounts = zip(*rows)
+    position = {pk: index for index, pk in enumerate(cottage_ids)}
+    return (
+        np.array([position[pk] for pk in cottages], dtype=np.int64),
+        np.array(arrivals, dtype='datetime64[D]'),
+        np.array(departures, dtype='datetime64[D]'),
+        np.array(booked, dtype='datetime64[D]'),
+        np.maximum(np.array(amounts, dtype=float), 0),
+    )
+
+
+def _bucket_starts(days, granularity):
+    """Index of the first day of every period in ``days``."""
+    if granularity == 'day':
+        return np.arange(len(days))
+    if granularity == 'week':
+        # NumPy's day 0 (1970-01-01) was a Thursday; shift so weeks start on Monday
+        keys = (days.astype(np.int64) + 3) // 7
+    else:
+        keys = days.astype('datetime64[M]').astype(np.int64)
+    return np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+
+
+def _ratio(numerator, denominator):
+    out = np.zeros_like(numerator, dtype=float)
+    np.divide(numerator, denominator, out=out, where=denominator > 0)
+    return np.round(out, 2).tolist()
+
+
+def compute_kpis(cottage_ids, start, end, granularity='month'):
+    """
+    KPIs per day, week or month of [start, end) for ``cottage_ids``.
+
+    Returns ``{'periods': [...], 'occupancy': [...], 'adr': [...], ...}``
+    with one value per period; periods are labelled by their first day.
+    """
+    cottage_ids = list(cottage_ids)
+    days = np.arange(np.datetime64(start, 'D'), np.datetime64(end, 'D'))
+    n_days = len(days)
+    if not n_days:
+        return {key: [] for key in KPI_KEYS}
+    starts = _bucket_starts(days, granularity)
+
+    cottages, arrivals, departures, booked, amounts = _load(cottage_ids, start, end)
+    nights = (departures - arrivals).astype(np.int64)
+
+    # Difference arrays per cottage: +1 stay / +rate from arrival, -1 / -rate from departure
+    first = np.clip((arrivals - days[0]).astype(np.int64), 0, n_days)
+    last = np.clip((departures - days[0]).astype(np.int64), 0, n_days)
+    rate = amounts / np.maximum(nights, 1)
+    stays_diff = np.zeros((len(cottage_ids), n_days + 1))
+    revenue_diff = np.zeros((len(cottage_ids), n_days + 1))
+    np.add.at(stays_diff, (cottages, first), 1)
+    np.add.at(stays_diff, (cottages, last), -1)
+    np.add.at(revenue_diff, (cottages, first), rate)
+    np.add.at(revenue_diff, (cottages, last), -rate)
+    stays = np.cumsum(stays_diff, axis=1)[:, :n_days]
+    rates = np.cumsum(revenue_diff, axis=1)[:, :n_days]
+    occupied = stays > 0.5
+    # Overlapping stays share the night: it is sold once, at their average rate
+    night_revenue = np.zeros_like(rates)
+    np.divide(rates, stays, out=night_revenue, where=occupied)
+    sold_per_day = occupied.sum(axis=0)
+    revenue_per_day = night_revenue.sum(axis=0)
+
+    sold = np.add.reduceat(sold_per_day, starts)
+    room_revenue = np.add.reduceat(revenue_per_day, starts)
+    available = np.diff(np.r_[starts, n_days]) * len(cottage_ids)
+
+    # Stay-level KPIs belong to the period of arrival
+    arriving = (arrivals >= days[0]) & (arrivals <= days[-1])
+    arrival_bucket = np.searchsorted(starts, (arrivals[arriving] - days[0]).astype(np.int64), side='right') - 1
+    counts = np.bincount(arrival_bucket, minlength=len(starts))
+    stay_nights = np.bincount(arrival_bucket, weights=nights[arriving], minlength=len(starts))
+    lead_days = np.bincount(
+        arrival_bucket,
+        weights=np.maximum((arrivals[arriving] - booked[arriving]).astype(np.int64), 0),
+        minlength=len(starts),
+    )
+
+    return {
+        'periods': [str(day) for day in days[starts]],
+        'occupancy': _ratio(sold * 100, available),
+        'adr': _ratio(room_revenue, sold),
+        'revpar': _ratio(room_revenue, available),
+        'alos': _ratio(stay_nights, counts),
+        'lead_time': _ratio(lead_days, counts),
+        'nights_sold': sold.astype(int).tolist(),
+        'revenue': np.round(room_revenue, 2).tolist(),
+    }
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from kesamokki.reporting.jobs import work
+
+
+class Command(BaseCommand):
+    help = "Run queued report jobs. Keep one or more of these running next to the web server."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=2.0,
+            help="Seconds to sleep when the queue is empty.",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Drain the queue once and exit instead of polling forever.",
+        )
+
+    def handle(self, *args, **options):
+        ran = work(poll_interval=options["poll_interval"], once=options["once"])
+        self.stdout.write(self.style.SUCCESS(f"Ran {ran} report jobs."))
@@ -1,3 +1,154 @@
-from django.db import models
+import uuid
 
-# Create your models here.
+from django.conf import settings
+from django.db import IntegrityError, models, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+
+class ReportJobStatus(models.TextChoices):
+    QUEUED = 'queued', _('Queued')
+    RUNNING = 'running', _('Running')
+    DONE = 'done', _('Done')
+    FAILED = 'failed', _('Failed')
+
+
+# Jobs that have not produced a result yet
+OPEN_JOB_STATUSES = [ReportJobStatus.QUEUED, ReportJobStatus.RUNNING]
+
+
+class ReportJobManager(models.Manager):
+    """Database-backed queue of report computations."""
+
+    def enqueue(self, params, user=None):
+        """Queue a report for ``params``, reusing an identical job that is still open."""
+        job = self.filter(params=params, status__in=OPEN_JOB_STATUSES).first()
+        if job:
+            return job
+        try:
+            # Savepoint so losing the race doesn't break the outer transaction
+            with transaction.atomic():
+                return self.create(params=params, requested_by=user)
+        except IntegrityError:
+            # A concurrent request queued the same report first; the
+            # unique constraint on open jobs made this insert wait for it
+            return self.filter(params=params).order_by('-created_at').first()
+
+    def claim(self):
+        """
+        Take the oldest queued job and mark it running, or return ``None``.
+
+        ``SKIP LOCKED`` lets several workers poll the same table without
+        handing out a job twice.
+        """
+        with transaction.atomic():
+            job = self.select_for_update(skip_locked=True).filter(
+                status=ReportJobStatus.QUEUED,
+            ).order_by('created_at').first()
+            if job is None:
+                return None
+            job.status = ReportJobStatus.RUNNING
+            job.started_at = job.heartbeat_at = timezone.now()
+            job.save(update_fields=['status', 'started_at', 'heartbeat_at'])
+        return job
+
+    def requeue_stale(self, silent_for):
+        """
+        Put back running jobs whose worker has not reported progress for
+        ``silent_for``; a slow job that keeps reporting stays with its worker.
+        """
+        return self.filter(
+            status=ReportJobStatus.RUNNING,
+            heartbeat_at__lt=timezone.now() - silent_for,
+        ).update(status=ReportJobStatus.QUEUED, started_at=None, heartbeat_at=None, progress=0)
+
+    def purge(self, older_than):
+        """Delete finished jobs older than ``older_than``."""
+        return self.exclude(status__in=OPEN_JOB_STATUSES).filter(
+            created_at__lt=timezone.now() - older_than,
+        ).delete()[0]
+
+
+class ReportJob(models.Model):
+    """
+    A report computed by the ``run_report_worker`` process instead of a web
+    worker. Clients poll it by id until the result is stored.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    params = models.JSONField(_('Parameters'))
+    status = models.CharField(
+        _('Status'),
+        max_length=20,
+        choices=ReportJobStatus.choices,
+        default=ReportJobStatus.QUEUED
+    )
+    progress = models.PositiveSmallIntegerField(_('Progress'), default=0)
+    result = models.JSONField(_('Result'), null=True, blank=True)
+    error = models.TextField(_('Error'), blank=True)
+    requested_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='report_jobs',
+        verbose_name=_('Requested by')
+    )
+    created_at = models.DateTimeField(_('Created At'), auto_now_add=True)
+    started_at = models.DateTimeField(_('Started At'), null=True, blank=True)
+    heartbeat_at = models.DateTimeField(_('Heartbeat At'), null=True, blank=True)
+    finished_at = models.DateTimeField(_('Finished At'), null=True, blank=True)
+
+    objects = ReportJobManager()
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = _('Report job')
+        verbose_name_plural = _('Report jobs')
+        indexes = [
+            # Workers pick the oldest queued job
+            models.Index(fields=['status', 'created_at'], name='report_job_queue_idx'),
+        ]
+        constraints = [
+            # At most one open job per report, even between concurrent requests
+            models.UniqueConstraint(
+                fields=['params'],
+                condition=Q(status__in=OPEN_JOB_STATUSES),
+                name='report_job_one_open_per_params',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.id} ({self.status})"
+
+    def _owned(self):
+        """This job as long as it is still running under the claim held by this instance."""
+        return ReportJob.objects.filter(pk=self.pk, status=ReportJobStatus.RUNNING, started_at=self.started_at)
+
+    def heartbeat(self):
+        """Record that the worker running this job is alive."""
+        self._owned().update(heartbeat_at=timezone.now())
+
+    def set_progress(self, progress):
+        """Record how far the computation is, in percent, and that the worker is alive."""
+        self.progress = progress
+        self._owned().update(progress=progress, heartbeat_at=timezone.now())
+
+    def finish(self, result=None, error=''):
+        """
+        Store the outcome. Returns ``False`` without writing anything when the
+        job was requeued in the meantime, so a late worker can't overwrite the
+        run that took over.
+        """
+        self.result = result
+        self.error = error
+        self.status = ReportJobStatus.FAILED if error else ReportJobStatus.DONE
+        self.progress = 100 if not error else self.progress
+        self.finished_at = timezone.now()
+        return bool(self._owned().update(
+            result=self.result,
+            error=self.error,
+            status=self.status,
+            progress=self.progress,
+            finished_at=self.finished_at,
+        ))
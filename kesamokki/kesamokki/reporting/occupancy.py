@@ -0,0 +1,96 @@
+"""
+Occupancy engine shared by the reporting views.
+
+Occupied nights are read from the denormalized ``ReservationNight`` table with
+one indexed range scan and aggregated per cottage and month in the database,
+so the cost grows with the number of booked nights in the window instead of
+cottages x months.
+"""
+import calendar
+from datetime import timedelta
+
+from django.db.models import Count
+from django.db.models.functions import TruncMonth
+
+from kesamokki.reservations.models import ReservationNight, ReservationStatus
+
+
+def next_month(day):
+    """Return the first day of the month following ``day``."""
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def month_starts(start_date, end_date):
+    """Return the first day of every month touching ``[start_date, end_date)``."""
+    months = []
+    current = start_date.replace(day=1)
+    while current < end_date:
+        months.append(current)
+        current = next_month(current)
+    return months
+
+
+def month_index(day, first_month):
+    """Position of the month containing ``day`` relative to ``first_month``."""
+    return (day.year - first_month.year) * 12 + day.month - first_month.month
+
+
+def occupied_nights_by_month(months, cottage_ids=None):
+    """
+    Count occupied nights per cottage for each month in ``months``.
+
+    ``months`` is the ordered list of month starts returned by
+    :func:`month_starts`. Overlapping reservations of the same cottage are
+    counted once per night. Cancelled reservations are ignored. Returns
+    ``{cottage_id: [nights, ...]}`` for cottages that have at least one booked
+    night in the window.
+    """
+    if not months:
+        return {}
+
+    window_start = months[0]
+    window_end = next_month(months[-1])
+
+    booked = ReservationNight.objects.filter(
+        night__gte=window_start,
+        night__lt=window_end,
+    ).exclude(
+        status=ReservationStatus.CANCELLED,
+    )
+    if cottage_ids is not None:
+        booked = booked.filter(cottage_id__in=cottage_ids)
+
+    rows = booked.annotate(
+        month=TruncMonth('night')
+    ).values('cottage_id', 'month').annotate(
+        nights=Count('night', distinct=True)
+    ).order_by()
+
+    nights = {}
+    for row in rows:
+        buckets = nights.setdefault(row['cottage_id'], [0] * len(months))
+        buckets[month_index(row['month'], window_start)] = row['nights']
+    return nights
+
+
+def occupancy_rates(months, nights):
+    """Convert monthly night counts into occupancy percentages."""
+    return [
+        round(count / calendar.monthrange(month.year, month.month)[1] * 100, 1)
+        for month, count in zip(months, nights)
+    ]
+
+
+def cottage_occupancy(cottages, months):
+    """
+    Build the per-cottage occupancy series used by the reporting charts.
+
+    Returns a list of ``(cottage, rates)`` tuples in the order of ``cottages``.
+    """
+    cottages = list(cottages)
+    nights = occupied_nights_by_month(months, [cottage.id for cottage in cottages])
+    empty = [0] * len(months)
+    return [
+        (cottage, occupancy_rates(months, nights.get(cottage.id, empty)))
+        for cottage in cottages
+    ]
@@ -0,0 +1,143 @@
+"""
+Booking pace: what was on the books for a stay month as of N days before it.
+
+Answers come from the append-only ``ReservationHistory``. Each version of a
+reservation is valid from its change date until the next version, so it adds
+its nights (and pro-rated price) to every as-of day inside that interval.
+Those intervals map to contiguous ranges of "days before the month", which
+difference arrays accumulate; one ordered pass over the history builds the
+curves of every cottage and stay month at once.
+"""
+from itertools import groupby
+
+import numpy as np
+from django.utils import timezone
+
+from kesamokki.reservations.models import ReservationHistory, ReservationStatus
+from .occupancy import month_starts, next_month
+
+PACE_DEFAULT_DAYS = 90
+PACE_MAX_DAYS = 730
+
+
+def _history(window_start, window_end, cottage_ids):
+    """Every version of the reservations that touched the window in any version."""
+    touching = ReservationHistory.objects.filter(
+        start_date__lt=window_end,
+        end_date__gt=window_start,
+    )
+    if cottage_ids is not None:
+        touching = touching.filter(cottage_id__in=cottage_ids)
+    # Later versions that moved away still matter: they end the earlier ones
+    return ReservationHistory.objects.filter(
+        reservation_id__in=touching.values('reservation_id'),
+    ).order_by('reservation_id', 'changed_at', 'id').values_list(
+        'reservation_id', 'cottage_id', 'start_date', 'end_date', 'total_price', 'status', 'changed_at',
+    )
+
+
+def booking_curves(months, days_before=PACE_DEFAULT_DAYS, cottage_ids=None):
+    """
+    On-the-books nights and revenue per cottage and stay month.
+
+    ``months`` are month starts as returned by :func:`month_starts`. Returns
+    ``{(cottage_id, month): (nights, revenue)}`` where both are arrays of
+    ``days_before + 1`` values; index ``d`` is the state at the end of the day
+    ``d`` days before the month's first night. As-of days that are still in
+    the future show the current books. Cottages with nothing booked in a
+    month are left out.
+    """
+    if not months:
+        return {}
+    months = sorted(months)
+    wanted = set(months)
+    window_start, window_end = months[0], next_month(months[-1])
+    size = days_before + 2
+
+    nights_diff = {}
+    revenue_diff = {}
+
+    def add(key, first, last, nights, revenue):
+        if key not in nights_diff:
+            nights_diff[key] = np.zeros(size)
+            revenue_diff[key] = np.zeros(size)
+        nights_diff[key][first] += nights
+        nights_diff[key][last + 1] -= nights
+        revenue_diff[key][first] += revenue
+        revenue_diff[key][last + 1] -= revenue
+
+    rows = _history(window_start, window_end, cottage_ids).iterator(chunk_size=5000)
+    for _reservation_id, versions in groupby(rows, key=lambda row: row[0]):
+        versions = list(versions)
+        for index, (_pk, cottage_id, start, end, price, status, changed_at) in enumerate(versions):
+            stay_nights = (end - start).days
+            if status == ReservationStatus.CANCELLED or stay_nights <= 0:
+                continue
+            if cottage_ids is not None and cottage_id not in cottage_ids:
+                continue
+            valid_from = timezone.localdate(changed_at)
+            valid_to = timezone.localdate(versions[index + 1][6]) if index + 1 < len(versions) else None
+            for month in month_starts(max(start, window_start), min(end, window_end)):
+                if month not in wanted:
+                    continue
+                nights = (min(end, next_month(month)) - max(start, month)).days
+                # The version covers as-of days month - d within [valid_from, valid_to)
+                first = 0 if valid_to is None else max((month - valid_to).days + 1, 0)
+                last = min((month - valid_from).days, days_before)
+                if first <= last:
+                    add((cottage_id, month), first, last, nights, float(price) * nights / stay_nights)
+
+    return {
+        key: (np.cumsum(nights_diff[key])[:-1], np.cumsum(revenue_diff[key])[:-1])
+        for key in nights_diff
+    }
+
+
+def pace_report(months, cottages, days_before=PACE_DEFAULT_DAYS, compare=False, today=None):
+    """
+    Booking curves for ``months`` in a JSON-ready shape, oldest as-of day
+    first, optionally next to the same months a year earlier. ``cottages``
+    maps the ids to report on to their names. Points after ``today`` are
+    ``None`` since they have not happened yet.
+    """
+    today = today or timezone.localdate()
+    last_year = {month: month.replace(year=month.year - 1) for month in months} if compare else {}
+    curves = booking_curves(list(months) + list(last_year.values()), days_before, set(cottages))
+    empty = np.zeros(days_before + 1)
+
+    def series(values, month):
+        # Index d lies in the future while month - d > today
+        future = min(max((month - today).days, 0), days_before + 1)
+        known = values[::-1][:days_before + 1 - future]
+        return np.round(known, 2).tolist() + [None] * (days_before + 1 - len(known))
+
+    def totals(month):
+        keys = [key for key in curves if key[1] == month]
+        return {
+            'nights': series(sum((curves[key][0] for key in keys), empty), month),
+            'revenue': series(sum((curves[key][1] for key in keys), empty), month),
+        }
+
+    report = []
+    for month in months:
+        entry = {
+            'month': month.isoformat(),
+            'total': totals(month),
+            'cottages': [
+                {
+                    'id': cottage_id,
+                    'name': cottages[cottage_id],
+                    'nights': series(curves[(cottage_id, month)][0], month),
+                    'revenue': series(curves[(cottage_id, month)][1], month),
+                }
+                for cottage_id in sorted(key[0] for key in curves if key[1] == month)
+            ],
+        }
+        if compare:
+            entry['last_year'] = {'month': last_year[month].isoformat(), **totals(last_year[month])}
+        report.append(entry)
+
+    return {
+        'days_before': list(range(days_before, -1, -1)),
+        'months': report,
+    }
@@ -0,0 +1,232 @@
+"""
+Report building shared by the reporting views and the report worker.
+
+Filters are normalized first so that equal reports share one cache entry;
+results are cached under the global reservation and invoice versions.
+"""
+import hashlib
+from datetime import date, timedelta
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from kesamokki.cottages.models import Cottage
+from kesamokki.invoices import revenue
+from kesamokki.invoices.models import INVOICES_VERSION_KEY, InvoiceStatus
+from kesamokki.reservations.models import RESERVATIONS_VERSION_KEY
+from kesamokki.utils.cache import get_or_compute, get_version
+from . import kpi, occupancy, pace
+from .models import ReportJob
+
+REPORT_CACHE_TIMEOUT = 15 * 60
+
+# Longer ranges are computed by the report worker instead of the web worker
+REPORT_SYNC_MAX_DAYS = 2 * 366
+
+
+def parse_filters(params):
+    """Normalize the report filters so equal reports share one cache entry."""
+    # Default to showing the last 12 months
+    end_date = timezone.now().date().replace(day=1)
+    start_date = (end_date - timedelta(days=365)).replace(day=1)
+
+    filter_start = params.get('start')
+    filter_end = params.get('end')
+    filter_status = params.get('status', 'all')
+    filter_cottage = params.get('cottage', 'all')
+    granularity = params.get('granularity', 'month')
+
+    try:
+        if filter_start:
+            start_date = date.fromisoformat(filter_start)
+        if filter_end:
+            # Set to first day of the month
+            end_date = date.fromisoformat(filter_end).replace(day=1)
+            # Add a month to include the entire month in the filter
+            end_date = (end_date.replace(day=28) + timedelta(days=4)).replace(day=1)
+    except ValueError:
+        # If date parsing fails, use defaults
+        pass
+
+    return {
+        'start': start_date,
+        'end': end_date,
+        'status': filter_status if filter_status in InvoiceStatus.values else 'all',
+        'cottage': filter_cottage if filter_cottage == 'all' or filter_cottage.isdigit() else 'none',
+        'granularity': granularity if granularity in kpi.GRANULARITIES else 'month',
+    }
+
+
+def dump_filters(filters):
+    """JSON form of normalized filters, stored on report jobs."""
+    return {**filters, 'start': filters['start'].isoformat(), 'end': filters['end'].isoformat()}
+
+
+def load_filters(params):
+    """Inverse of ``dump_filters``."""
+    return {**params, 'start': date.fromisoformat(params['start']), 'end': date.fromisoformat(params['end'])}
+
+
+def is_large_report(filters):
+    """Whether the report is too long to compute within a web request."""
+    return (filters['end'] - filters['start']).days > REPORT_SYNC_MAX_DAYS
+
+
+def _get_random_color(seed):
+    """Generate a consistent color based on a seed value."""
+    # Create a hash from the seed
+    hash_obj = hashlib.md5(str(seed).encode())
+    hash_hex = hash_obj.hexdigest()
+
+    # Use portions of the hash for R, G, B
+    r = int(hash_hex[0:2], 16) % 200 + 25  # 25-224 range
+    g = int(hash_hex[2:4], 16) % 200 + 25
+    b = int(hash_hex[4:6], 16) % 200 + 25
+
+    return f'rgb({r}, {g}, {b})'
+
+
+def compute_report(filters, progress=None):
+    """
+    Revenue and occupancy series for normalized ``filters``. ``progress``, if
+    given, is called with the completed percentage after each section.
+    """
+    # Get all months in the range for consistency
+    month_list = occupancy.month_starts(filters['start'], filters['end'])
+
+    # ====== REVENUE DATA ======
+    # Closed months come from the rollup; only the current month is summed live
+    status = None if filters['status'] == 'all' else filters['status']
+    revenue_by_month = revenue.monthly_revenue(month_list, status)
+
+    # Fill in revenue data with 0 for months with no data
+    months = [month.strftime('%B %Y') for month in month_list]
+    revenue_data = [float(revenue_by_month.get(month, 0)) for month in month_list]
+    if progress:
+        progress(30)
+
+    # ====== OCCUPANCY DATA ======
+    # Apply the cottage filter in SQL instead of skipping rows in Python
+    cottages = Cottage.objects.all()
+    if filters['cottage'] == 'all':
+        selected_cottages = cottages
+    elif filters['cottage'] == 'none':
+        selected_cottages = cottages.none()
+    else:
+        selected_cottages = cottages.filter(id=filters['cottage'])
+
+    # Distinct booked nights per cottage and month, aggregated from ReservationNight
+    cottage_occupancy = [
+        {
+            'name': cottage.name,
+            'data': rates,
+            'color': _get_random_color(cottage.id)  # Generate consistent color based on cottage ID
+        }
+        for cottage, rates in occupancy.cottage_occupancy(selected_cottages, month_list)
+    ]
+    if progress:
+        progress(60)
+
+    # ====== KPIs ======
+    kpis = kpi.compute_kpis(
+        selected_cottages.values_list('id', flat=True),
+        filters['start'],
+        filters['end'],
+        filters['granularity'],
+    )
+
+    if progress:
+        progress(90)
+
+    return {
+        'months': months,
+        'revenue': revenue_data,
+        'occupancy': cottage_occupancy,
+        'total_revenue': sum(revenue_data),
+        'kpis': {'granularity': filters['granularity'], **kpis},
+    }
+
+
+def report_cache_key(filters):
+    """
+    Cache key of a report. It carries the global reservation and invoice
+    versions, so any booking or invoice change starts a fresh entry.
+    """
+    versions = f'{get_version(RESERVATIONS_VERSION_KEY)}:{get_version(INVOICES_VERSION_KEY)}'
+    return (
+        f"reporting:report:{versions}:{filters['start'].isoformat()}:{filters['end'].isoformat()}"
+        f":{filters['status']}:{filters['cottage']}:{filters['granularity']}"
+    )
+
+
+def get_report(filters, progress=None):
+    """Cached ``compute_report``."""
+    return get_or_compute(
+        report_cache_key(filters), lambda: compute_report(filters, progress), REPORT_CACHE_TIMEOUT,
+    )
+
+
+def get_report_or_job(filters, user):
+    """
+    The report for ``filters``, or ``(None, job)`` with a queued report job
+    when it is too long to compute here and nothing is cached yet.
+    """
+    if is_large_report(filters):
+        report = cache.get(report_cache_key(filters))
+        if report is None:
+            return None, ReportJob.objects.enqueue(dump_filters(filters), user)
+        return report, None
+    return get_report(filters), None
+
+
+def parse_pace_filters(params):
+    """Normalize the booking pace filters: stay months, horizon, cottage and comparison."""
+    first_month = occupancy.next_month(timezone.now().date())
+    start_month, end_month = first_month, occupancy.next_month(occupancy.next_month(first_month))
+    try:
+        if params.get('start'):
+            start_month = date.fromisoformat(params['start']).replace(day=1)
+        if params.get('end'):
+            end_month = occupancy.next_month(date.fromisoformat(params['end']))
+    except ValueError:
+        # If date parsing fails, use defaults
+        pass
+
+    try:
+        days_before = int(params.get('days', pace.PACE_DEFAULT_DAYS))
+    except ValueError:
+        days_before = pace.PACE_DEFAULT_DAYS
+    filter_cottage = params.get('cottage', 'all')
+
+    return {
+        'months': occupancy.month_starts(start_month, end_month)[:24],
+        'days_before': min(max(days_before, 0), pace.PACE_MAX_DAYS),
+        'cottage': filter_cottage if filter_cottage == 'all' or filter_cottage.isdigit() else 'none',
+        'compare': params.get('compare') in ('1', 'true', 'yes'),
+    }
+
+
+def get_pace_report(filters):
+    """Cached booking curves; as-of points move with the date, so the day is part of the key."""
+    today = timezone.localdate()
+    cottages = Cottage.objects.all()
+    if filters['cottage'] == 'none':
+        cottages = cottages.none()
+    elif filters['cottage'] != 'all':
+        cottages = cottages.filter(id=filters['cottage'])
+    months = ','.join(month.isoformat() for month in filters['months'])
+    cache_key = (
+        f"reporting:pace:{get_version(RESERVATIONS_VERSION_KEY)}:{today.isoformat()}:{months}"
+        f":{filters['days_before']}:{filters['cottage']}:{int(filters['compare'])}"
+    )
+    return get_or_compute(
+        cache_key,
+        lambda: pace.pace_report(
+            filters['months'],
+            dict(cottages.values_list('id', 'name')),
+            filters['days_before'],
+            filters['compare'],
+            today,
+        ),
+        REPORT_CACHE_TIMEOUT,
+    )
@@ -1,3 +1,566 @@
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.core.cache import cache
+from django.contrib.admin.sites import AdminSite
+from django.db import IntegrityError, connection, transaction
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from io import StringIO
+import json
+from time import sleep
+from unittest import mock
 
-# Create your tests here.
+from kesamokki.users.models import User, Customer
+from kesamokki.cottages.models import Cottage
+from kesamokki.reservations.admin import ReservationAdmin
+from kesamokki.reservations.models import Reservation, ReservationHistory, ReservationStatus
+from kesamokki.invoices import revenue
+from kesamokki.invoices.models import Invoice, MonthlyRevenue, RevenuePeriod
+from kesamokki.utils.cache import get_or_compute
+from . import jobs, kpi, occupancy, pace
+from .models import ReportJob, ReportJobStatus
+
+
+class OccupancyEngineTests(TestCase):
+    """Tests for the sweep-line occupancy engine."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.user = User.objects.create_user(
+            email='staff@example.com',
+            password='testpass123',
+            name='Staff User'
+        )
+        self.customer = Customer.objects.create(
+            full_name='Test Customer',
+            address_line1='123 Test St',
+            postal_code='00100',
+            city='Helsinki'
+        )
+        self.cottage = Cottage.objects.create(
+            name='Lakeside',
+            description='A test cottage',
+            location='Kuopio',
+            beds=4,
+            base_price=Decimal('100.00'),
+            cleaning_fee=Decimal('50.00')
+        )
+        self.other_cottage = Cottage.objects.create(
+            name='Forest',
+            description='Another test cottage',
+            location='Joensuu',
+            beds=2,
+            base_price=Decimal('80.00')
+        )
+        # Work in the month after next so every stay starts in the future
+        self.first_month = occupancy.next_month(occupancy.next_month(timezone.now().date()))
+        self.months = occupancy.month_starts(
+            self.first_month,
+            occupancy.next_month(occupancy.next_month(self.first_month))
+        )
+
+    def _reserve(self, cottage, start_offset, nights, status=ReservationStatus.CONFIRMED):
+        start = self.first_month + timedelta(days=start_offset)
+        return Reservation.objects.create(
+            cottage=cottage,
+            user=self.user,
+            customer=self.customer,
+            start_date=start,
+            end_date=start + timedelta(days=nights),
+            guests=2,
+            total_price=Decimal('100.00'),
+            status=status
+        )
+
+    def test_month_starts(self):
+        """Test that every month touching the range is listed once."""
+        months = occupancy.month_starts(
+            self.first_month + timedelta(days=10),
+            occupancy.next_month(self.first_month) + timedelta(days=1)
+        )
+        self.assertEqual(months, [self.first_month, occupancy.next_month(self.first_month)])
+
+    def test_nights_split_across_months(self):
+        """Test that a stay crossing a month boundary is split by night."""
+        days_in_first = (self.months[1] - self.months[0]).days
+        self._reserve(self.cottage, days_in_first - 2, 5)
+
+        nights = occupancy.occupied_nights_by_month(self.months)
+
+        self.assertEqual(nights[self.cottage.id], [2, 3])
+        self.assertNotIn(self.other_cottage.id, nights)
+
+    def test_cancelled_and_other_cottages_are_ignored(self):
+        """Test that cancelled stays and unselected cottages are not counted."""
+        self._reserve(self.cottage, 0, 3)
+        cancelled = self._reserve(self.cottage, 5, 3)
+        cancelled.status = ReservationStatus.CANCELLED
+        cancelled.save()
+        self._reserve(self.other_cottage, 0, 10)
+
+        nights = occupancy.occupied_nights_by_month(self.months, [self.cottage.id])
+
+        self.assertEqual(nights, {self.cottage.id: [3, 0]})
+
+    def test_overlapping_nights_counted_once(self):
+        """Test that overlapping stays are merged before counting."""
+        self._reserve(self.cottage, 0, 4)
+        self._reserve(self.cottage, 4, 2, status=ReservationStatus.COMPLETED)
+        # Bulk updates bypass validation, so overlaps can exist in the table;
+        # completed stays are outside the exclusion constraint
+        overlap = self._reserve(self.cottage, 10, 4, status=ReservationStatus.COMPLETED)
+        Reservation.objects.filter(pk=overlap.pk).update(
+            start_date=self.first_month + timedelta(days=2)
+        )
+
+        nights = occupancy.occupied_nights_by_month(self.months)
+
+        self.assertEqual(nights[self.cottage.id][0], 14)
+
+    def test_single_query_for_all_cottages(self):
+        """Test that the engine costs one query regardless of cottage count."""
+        self._reserve(self.cottage, 0, 3)
+        self._reserve(self.other_cottage, 3, 3)
+
+        with self.assertNumQueries(2):
+            result = occupancy.cottage_occupancy(Cottage.objects.all(), self.months)
+
+        rates = dict((cottage.id, data) for cottage, data in result)
+        self.assertGreater(rates[self.cottage.id][0], 0)
+        self.assertGreater(rates[self.other_cottage.id][0], 0)
+        self.assertEqual(rates[self.cottage.id][1], 0)
+
+    def test_kpi_engine(self):
+        """Test occupancy, ADR, RevPAR, ALOS and lead time per period."""
+        self._reserve(self.cottage, 0, 4)
+        self._reserve(self.other_cottage, 1, 2, status=ReservationStatus.CANCELLED)
+        ids = [self.cottage.id, self.other_cottage.id]
+        week_end = self.first_month + timedelta(days=7)
+
+        with self.assertNumQueries(1):
+            daily = kpi.compute_kpis(ids, self.first_month, week_end, 'day')
+
+        self.assertEqual(daily['periods'][0], self.first_month.isoformat())
+        self.assertEqual(daily['nights_sold'], [1, 1, 1, 1, 0, 0, 0])
+        self.assertEqual(daily['occupancy'][:2], [50.0, 50.0])
+        # Room revenue excludes the 50.00 cleaning fee
+        self.assertEqual(daily['adr'][0], 12.5)
+        self.assertEqual(daily['revpar'][0], 6.25)
+        self.assertEqual(daily['alos'][0], 4.0)
+        lead = (self.first_month - timezone.localdate()).days
+        self.assertEqual(daily['lead_time'][0], lead)
+
+        monthly = kpi.compute_kpis(ids, self.months[0], self.months[-1] + timedelta(days=1), 'month')
+        self.assertEqual(monthly['periods'], [month.isoformat() for month in self.months])
+        self.assertEqual(monthly['nights_sold'], [4, 0])
+        self.assertEqual(monthly['revenue'], [50.0, 0.0])
+
+        weekly = kpi.compute_kpis(ids, self.first_month, week_end, 'week')
+        self.assertEqual(sum(weekly['nights_sold']), 4)
+        self.assertTrue(all(date.fromisoformat(p).weekday() == 0 for p in weekly['periods'][1:]))
+
+    def test_kpi_nights_match_the_occupancy_engine(self):
+        """Test that a completed stay overlapping a booking sells its nights only once."""
+        self._reserve(self.cottage, 0, 4)
+        overlap = self._reserve(self.cottage, 10, 4, status=ReservationStatus.COMPLETED)
+        Reservation.objects.filter(pk=overlap.pk).update(
+            start_date=self.first_month, end_date=self.first_month + timedelta(days=2)
+        )
+
+        kpis = kpi.compute_kpis([self.cottage.id], self.months[0], self.months[1], 'month')
+        nights = occupancy.occupied_nights_by_month(self.months[:1], [self.cottage.id])
+
+        self.assertEqual(kpis['nights_sold'], nights[self.cottage.id])
+        # Shared nights earn the average of 12.50 and 25.00, the others 12.50
+        self.assertEqual(kpis['revenue'], [62.5])
+
+    def test_api_applies_cottage_filter(self):
+        """Test that the reporting API only returns the selected cottage."""
+        self.user.is_staff = True
+        self.user.save()
+        self.client.login(email='staff@example.com', password='testpass123')
+        self._reserve(self.cottage, 0, 3)
+
+        response = self.client.get(reverse('reporting:api_data'), {
+            'start': self.months[0].isoformat(),
+            'end': self.months[-1].isoformat(),
+            'cottage': str(self.cottage.id),
+        })
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(len(data['months']), 2)
+        self.assertEqual([series['name'] for series in data['occupancy']], ['Lakeside'])
+
+        response = self.client.get(reverse('reporting:api_data'), {
+            'start': self.months[0].isoformat(),
+            'end': self.months[-1].isoformat(),
+            'cottage': str(self.cottage.id),
+            'granularity': 'week',
+        })
+        kpis = response.json()['kpis']
+        self.assertEqual(kpis['granularity'], 'week')
+        self.assertEqual(sum(kpis['nights_sold']), 3)
+
+
+class RevenueRollupTests(TestCase):
+    """Tests for the monthly revenue rollup."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.user = User.objects.create_user(email='staff@example.com', password='testpass123', name='Staff User')
+        self.customer = Customer.objects.create(full_name='Test Customer', address_line1='123 Test St')
+        self.cottage = Cottage.objects.create(
+            name='Lakeside', description='A test cottage', location='Kuopio',
+            beds=4, base_price=Decimal('100.00'), cleaning_fee=Decimal('50.00')
+        )
+        self.current = timezone.now().date().replace(day=1)
+        self.past = (self.current - timedelta(days=100)).replace(day=1)
+
+    def _invoice(self, billed_at, amount, offset):
+        start = timezone.now().date() + timedelta(days=10 + 3 * offset)
+        reservation = Reservation.objects.create(
+            cottage=self.cottage, user=self.user, customer=self.customer,
+            start_date=start, end_date=start + timedelta(days=2),
+            guests=2, total_price=Decimal(amount), status=ReservationStatus.CONFIRMED
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            return Invoice.objects.create(
+                reservation=reservation, billed_at=billed_at, due_date=billed_at + timedelta(days=14)
+            )
+
+    def test_rollup_follows_saves_until_closed(self):
+        """Test that saves refresh open months and closed months stay frozen."""
+        invoice = self._invoice(self.past, '200.00', 0)
+        self._invoice(self.current, '300.00', 1)
+
+        self.assertEqual(
+            list(MonthlyRevenue.objects.order_by('month').values_list('month', 'status', 'total')),
+            [(self.past, 'pending', Decimal('200.00')), (self.current, 'pending', Decimal('300.00'))]
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            invoice.mark_as_paid()
+        self.assertEqual(MonthlyRevenue.objects.get(month=self.past).status, 'paid')
+
+        call_command('close_revenue_months', stdout=StringIO())
+        self.assertIsNotNone(RevenuePeriod.objects.get(month=self.past).closed_at)
+
+        # Closed months are snapshots; later edits don't touch them
+        with self.captureOnCommitCallbacks(execute=True):
+            invoice.amount = Decimal('999.00')
+            invoice.save()
+        self.assertEqual(MonthlyRevenue.objects.get(month=self.past).total, Decimal('200.00'))
+
+        months = occupancy.month_starts(self.past, occupancy.next_month(self.current))
+        totals = revenue.monthly_revenue(months)
+        self.assertEqual(totals[self.past], Decimal('200.00'))
+        self.assertEqual(totals[self.current], Decimal('300.00'))
+        self.assertEqual(revenue.monthly_revenue(months, 'pending'), {self.current: Decimal('300.00')})
+
+    def test_missing_months_are_summed_live_until_backfilled(self):
+        """Test that reads of months without a rollup write nothing and the monthly command builds them."""
+        self._invoice(self.past, '200.00', 0)
+        recent = (self.current - timedelta(days=1)).replace(day=1)
+        self._invoice(recent, '150.00', 1)
+        MonthlyRevenue.objects.all().delete()
+        RevenuePeriod.objects.all().delete()
+
+        with CaptureQueriesContext(connection) as queries:
+            totals = revenue.monthly_revenue([self.past, recent])
+        self.assertEqual(totals, {self.past: Decimal('200.00'), recent: Decimal('150.00')})
+        self.assertFalse([q for q in queries.captured_queries if not q['sql'].startswith('SELECT')])
+        self.assertFalse(RevenuePeriod.objects.exists())
+
+        call_command('close_revenue_months', stdout=StringIO())
+        self.assertIsNotNone(RevenuePeriod.objects.get(month=self.past).closed_at)
+        self.assertIsNone(RevenuePeriod.objects.get(month=recent).closed_at)
+        self.assertEqual(MonthlyRevenue.objects.get(month=recent).total, Decimal('150.00'))
+        with self.assertNumQueries(2):
+            revenue.monthly_revenue([self.past, recent])
+
+
+class ReportCacheTests(TestCase):
+    """Tests for the versioned reporting result cache."""
+
+    def setUp(self):
+        """Set up test data."""
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='staff@example.com', password='testpass123', name='Staff User', is_staff=True
+        )
+        self.customer = Customer.objects.create(full_name='Test Customer', address_line1='123 Test St')
+        self.cottage = Cottage.objects.create(
+            name='Lakeside', description='A test cottage', location='Kuopio',
+            beds=4, base_price=Decimal('100.00'), cleaning_fee=Decimal('50.00')
+        )
+        self.client.login(email='staff@example.com', password='testpass123')
+        self.month = occupancy.next_month(timezone.now().date())
+        self.params = {'start': self.month.isoformat(), 'end': self.month.isoformat()}
+
+    def _report_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get(reverse('reporting:api_data'), self.params).json()
+        sql = [q['sql'] for q in queries.captured_queries]
+        return data, [q for q in sql if 'reservations_reservationnight' in q or 'invoices_' in q]
+
+    def test_report_is_cached_until_a_reservation_changes(self):
+        """Test that identical filters reuse the cached report and writes invalidate it."""
+        data, report_queries = self._report_queries()
+        self.assertTrue(report_queries)
+        self.assertEqual(data['occupancy'][0]['data'], [0])
+
+        data, report_queries = self._report_queries()
+        self.assertEqual(report_queries, [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Reservation.objects.create(
+                cottage=self.cottage, user=self.user, customer=self.customer,
+                start_date=self.month, end_date=self.month + timedelta(days=3),
+                guests=2, total_price=Decimal('350.00'), status=ReservationStatus.CONFIRMED
+            )
+        data, report_queries = self._report_queries()
+        self.assertTrue(report_queries)
+        self.assertGreater(data['occupancy'][0]['data'][0], 0)
+
+        # The dashboard renders from the same cached report
+        response = self.client.get(reverse('reporting:dashboard'), self.params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.context['cottage_occupancy']), data['occupancy'])
+
+    def test_waiting_caller_leaves_the_lock_alone(self):
+        """Test that a caller that gave up waiting computes without releasing another worker's lock."""
+        cache.set('reporting:test:lock', 'other-worker', 30)
+
+        self.assertEqual(get_or_compute('reporting:test', lambda: 42, 60, wait=0), 42)
+        self.assertEqual(cache.get('reporting:test:lock'), 'other-worker')
+
+        cache.delete_many(['reporting:test', 'reporting:test:lock'])
+        get_or_compute('reporting:test', lambda: 42, 60)
+        self.assertIsNone(cache.get('reporting:test:lock'))
+
+
+class BookingPaceTests(TestCase):
+    """Tests for the reservation history and the as-of booking curves."""
+
+    def setUp(self):
+        """Set up test data."""
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='staff@example.com', password='testpass123', name='Staff User', is_staff=True
+        )
+        self.customer = Customer.objects.create(full_name='Test Customer', address_line1='123 Test St')
+        self.cottage = Cottage.objects.create(
+            name='Lakeside', description='A test cottage', location='Kuopio',
+            beds=4, base_price=Decimal('100.00'), cleaning_fee=Decimal('50.00')
+        )
+        self.month = occupancy.next_month(timezone.now().date())
+        self.client.login(email='staff@example.com', password='testpass123')
+
+    def _reserve(self, start_offset, nights, price):
+        start = self.month + timedelta(days=start_offset)
+        return Reservation.objects.create(
+            cottage=self.cottage, user=self.user, customer=self.customer,
+            start_date=start, end_date=start + timedelta(days=nights),
+            guests=2, total_price=Decimal(price), status=ReservationStatus.CONFIRMED
+        )
+
+    def _backdate(self, reservation, *days_before):
+        """Move the reservation's history versions to the given days before the month."""
+        versions = ReservationHistory.objects.filter(reservation=reservation).order_by('changed_at', 'id')
+        for version, days in zip(list(versions), days_before):
+            changed_at = timezone.make_aware(datetime.combine(self.month - timedelta(days=days), time(12)))
+            ReservationHistory.objects.filter(pk=version.pk).update(changed_at=changed_at)
+
+    def test_history_is_appended_on_changes_only(self):
+        """Test that saves, admin bulk actions and no-op saves write the expected versions."""
+        reservation = self._reserve(0, 3, '300.00')
+        reservation.guests = 3
+        reservation.save()
+        self.assertEqual(reservation.history.count(), 1)
+
+        reservation = Reservation.objects.get(pk=reservation.pk)
+        reservation.save()
+        self.assertEqual(reservation.history.count(), 1)
+
+        ReservationAdmin(Reservation, AdminSite())._set_status(
+            Reservation.objects.filter(pk=reservation.pk), ReservationStatus.CANCELLED
+        )
+        self.assertEqual(
+            list(reservation.history.values_list('status', flat=True)),
+            [ReservationStatus.CONFIRMED, ReservationStatus.CANCELLED],
+        )
+
+    def test_history_outlives_deleted_reservations(self):
+        """Test that deleting a booking keeps its versions and closes them with a cancellation."""
+        reservation = self._reserve(0, 3, '300.00')
+        pk = reservation.pk
+        reservation.delete()
+        self.assertEqual(
+            list(ReservationHistory.objects.filter(reservation_id=pk).values_list('status', flat=True)),
+            [ReservationStatus.CONFIRMED, ReservationStatus.CANCELLED],
+        )
+
+        other = self._reserve(5, 2, '200.00')
+        ReservationAdmin(Reservation, AdminSite()).delete_queryset(None, Reservation.objects.filter(pk=other.pk))
+        self.assertEqual(
+            list(ReservationHistory.objects.filter(reservation_id=other.pk).values_list('status', flat=True)),
+            [ReservationStatus.CONFIRMED, ReservationStatus.CANCELLED],
+        )
+
+    def test_curves_replay_the_history(self):
+        """Test that each version counts only while it was the current one."""
+        cancelled = self._reserve(0, 3, '300.00')
+        cancelled.status = ReservationStatus.CANCELLED
+        cancelled.save()
+        self._backdate(cancelled, 30, 10)
+
+        # Booked 20 days out, then moved to straddle the month end 5 days out
+        moved = self._reserve(5, 2, '200.00')
+        moved.start_date = occupancy.next_month(self.month) - timedelta(days=1)
+        moved.end_date = moved.start_date + timedelta(days=2)
+        moved.save()
+        self._backdate(moved, 20, 5)
+
+        with self.assertNumQueries(1):
+            curves = pace.booking_curves([self.month], days_before=40)
+        nights, revenue = curves[(self.cottage.id, self.month)]
+        self.assertEqual(nights[31:].tolist(), [0] * 10)
+        self.assertEqual(nights[21:31].tolist(), [3] * 10)
+        self.assertEqual(nights[11:21].tolist(), [5] * 10)
+        self.assertEqual(nights[6:11].tolist(), [2] * 5)
+        self.assertEqual(nights[:6].tolist(), [1] * 6)
+        self.assertEqual(revenue[0], 100.0)
+        self.assertEqual(revenue[15], 500.0)
+
+    def test_api_hides_future_points_and_compares_last_year(self):
+        """Test the pace endpoint shape, the not-yet-known tail and the comparison."""
+        reservation = self._reserve(0, 3, '300.00')
+        self._backdate(reservation, 60)
+        response = self.client.get(reverse('reporting:api_pace'), {
+            'start': self.month.isoformat(), 'end': self.month.isoformat(), 'days': '60', 'compare': '1',
+        })
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['days_before'][0], 60)
+        self.assertEqual(len(data['months']), 1)
+
+        entry = data['months'][0]
+        known = 61 - (self.month - timezone.localdate()).days
+        self.assertEqual(entry['total']['nights'][:known], [3] * known)
+        self.assertEqual(entry['total']['nights'][known:], [None] * (61 - known))
+        self.assertEqual(entry['cottages'][0]['name'], 'Lakeside')
+        self.assertEqual(entry['last_year']['month'], self.month.replace(year=self.month.year - 1).isoformat())
+        self.assertEqual(entry['last_year']['nights'][0], 0)
+
+
+class ReportJobTests(TestCase):
+    """Tests for queued long-range reports and the polling endpoint."""
+
+    def setUp(self):
+        """Set up test data."""
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='staff@example.com', password='testpass123', name='Staff User', is_staff=True
+        )
+        Cottage.objects.create(
+            name='Lakeside', description='A test cottage', location='Kuopio',
+            beds=4, base_price=Decimal('100.00'), cleaning_fee=Decimal('50.00')
+        )
+        self.client.login(email='staff@example.com', password='testpass123')
+        self.params = {'start': '2016-01-01', 'end': '2025-12-01', 'granularity': 'month'}
+
+    def test_long_range_is_queued_and_polled(self):
+        """Test that a long report returns a job at once and is served once the worker ran it."""
+        response = self.client.get(reverse('reporting:api_data'), self.params)
+        self.assertEqual(response.status_code, 202)
+        queued = response.json()
+        self.assertEqual(queued['status'], ReportJobStatus.QUEUED)
+
+        # Identical requests share the open job
+        again = self.client.get(reverse('reporting:api_data'), self.params).json()
+        self.assertEqual(again['job'], queued['job'])
+        self.assertEqual(ReportJob.objects.count(), 1)
+
+        # The dashboard renders without computing or queueing anything; charts.js polls the job
+        response = self.client.get(reverse('reporting:dashboard'), self.params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['months_json'], '[]')
+        self.assertEqual(ReportJob.objects.count(), 1)
+
+        out = StringIO()
+        call_command('run_report_worker', '--once', stdout=out)
+        self.assertIn('Ran 1 report jobs.', out.getvalue())
+
+        polled = self.client.get(queued['status_url']).json()
+        self.assertEqual(polled['status'], ReportJobStatus.DONE)
+        self.assertEqual(polled['progress'], 100)
+        self.assertEqual(len(polled['report']['months']), 120)
+
+        # The worker also filled the cache, so the same request is now answered directly
+        response = self.client.get(reverse('reporting:api_data'), self.params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), polled['report'])
+
+    def test_short_range_stays_synchronous(self):
+        """Test that ordinary ranges are still computed inside the request."""
+        response = self.client.get(reverse('reporting:api_data'), {'start': '2025-01-01', 'end': '2025-06-01'})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(ReportJob.objects.exists())
+
+    def test_failures_are_recorded_and_stale_jobs_requeued(self):
+        """Test that a failing job reports its error and a dead worker's job is picked up again."""
+        broken = ReportJob.objects.create(params={'start': 'not a date'})
+        self.assertEqual(jobs.run_pending(), 1)
+        broken.refresh_from_db()
+        self.assertEqual(broken.status, ReportJobStatus.FAILED)
+        self.assertIn('ValueError', broken.error)
+        self.assertIsNone(ReportJob.objects.claim())
+
+        # Only jobs whose worker stopped reporting are requeued
+        silent = timezone.now() - jobs.REPORT_JOB_STALE_AFTER - timedelta(minutes=1)
+        slow = ReportJob.objects.create(
+            params={'slow': True}, status=ReportJobStatus.RUNNING, started_at=silent, heartbeat_at=timezone.now(),
+        )
+        stale = ReportJob.objects.create(
+            params={'stale': True}, status=ReportJobStatus.RUNNING, started_at=silent, heartbeat_at=silent,
+        )
+        self.assertEqual(ReportJob.objects.requeue_stale(jobs.REPORT_JOB_STALE_AFTER), 1)
+
+        # The first worker's late result must not overwrite the run that took over
+        late = ReportJob.objects.get(pk=stale.pk)
+        late.started_at = silent
+        rerun = ReportJob.objects.claim()
+        self.assertEqual(rerun, stale)
+        self.assertFalse(late.finish(result={'late': True}))
+        self.assertTrue(rerun.finish(result={'fresh': True}))
+        stale.refresh_from_db()
+        self.assertEqual(stale.result, {'fresh': True})
+        slow.refresh_from_db()
+        self.assertEqual(slow.status, ReportJobStatus.RUNNING)
+
+    def test_long_sections_keep_the_heartbeat(self):
+        """Test that a running job reports liveness while a single section computes."""
+        job = ReportJob.objects.create(params=self.params)
+        beats = []
+
+        def slow_report(filters, progress=None):
+            sleep(0.3)
+            return {}
+
+        with mock.patch.object(jobs, 'REPORT_JOB_HEARTBEAT_EVERY', timedelta(seconds=0.05)), \
+                mock.patch.object(jobs, 'get_report', slow_report), \
+                mock.patch.object(ReportJob, 'heartbeat', lambda self: beats.append(self.pk)):
+            self.assertTrue(jobs.run_job(ReportJob.objects.claim()))
+        self.assertGreater(len(beats), 1)
+        self.assertEqual(set(beats), {job.pk})
+
+    def test_one_open_job_per_report(self):
+        """Test that the database refuses a second open job for the same parameters."""
+        ReportJob.objects.create(params=self.params)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            ReportJob.objects.create(params=self.params)
+        ReportJob.objects.update(status=ReportJobStatus.DONE)
+        self.assertNotEqual(ReportJob.objects.enqueue(self.params).status, ReportJobStatus.DONE)
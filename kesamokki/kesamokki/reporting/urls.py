@@ -7,4 +7,6 @@ app_name = 'reporting'
 urlpatterns = [
     path('', views.ReportingDashboardView.as_view(), name='dashboard'),
     path('api/data/', views.ReportingDataAPIView.as_view(), name='api_data'),
+    path('api/jobs/<uuid:job_id>/', views.ReportJobAPIView.as_view(), name='api_job'),
+    path('api/pace/', views.BookingPaceAPIView.as_view(), name='api_pace'),
 ]
\ No newline at end of file
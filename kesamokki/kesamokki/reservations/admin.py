@@ -1,7 +1,12 @@
 from django.contrib import admin
-from .models import Reservation, ReservationStatus
+from .models import HISTORY_FIELDS, Reservation, ReservationHistory, ReservationStatus, invalidate_calendars
 from django.utils.translation import gettext_lazy as _
 from django.utils import timezone
+from django.contrib import messages
+from django.db import transaction
+from .services import confirm_pending
+from kesamokki.invoices.services import generate_invoices
+from kesamokki.utils.csv_export import export_as_csv
 
 @admin.register(Reservation)
 class ReservationAdmin(admin.ModelAdmin):
@@ -37,24 +42,66 @@ class ReservationAdmin(admin.ModelAdmin):
     guest_name.short_description = _('Guest')
     guest_name.admin_order_field = 'full_name'
     
-    actions = ['confirm_reservations', 'mark_as_completed', 'cancel_reservations']
+    actions = ['confirm_reservations', 'mark_as_completed', 'cancel_reservations', 'create_invoices', export_as_csv]
+    export_columns = (
+        ('ID', 'id'),
+        ('Cottage', 'cottage__name'),
+        ('Customer', 'customer__full_name'),
+        ('Start date', 'start_date'),
+        ('End date', 'end_date'),
+        ('Guests', 'guests'),
+        ('Total price', 'total_price'),
+        ('Status', 'status'),
+        ('Created at', 'created_at'),
+    )
+    
+    def _set_status(self, queryset, status):
+        """Bulk update the status and record it in the history."""
+        reservations = list(queryset.only(*HISTORY_FIELDS))
+        ids = [reservation.pk for reservation in reservations]
+        now = timezone.now()
+        updated = Reservation.objects.filter(id__in=ids).update(status=status, updated_at=now)
+        changed = [reservation for reservation in reservations if reservation.status != status]
+        for reservation in changed:
+            reservation.status = status
+        ReservationHistory.objects.record(changed, changed_at=now)
+        invalidate_calendars(reservation.cottage_id for reservation in reservations)
+        return updated
     
     def confirm_reservations(self, request, queryset):
-        updated = queryset.filter(status=ReservationStatus.PENDING).update(status=ReservationStatus.CONFIRMED)
-        self.message_user(request, _(f'{updated} reservations were confirmed.'))
+        confirmed, conflicts = confirm_pending(queryset)
+        self.message_user(request, _(f'{len(confirmed)} reservations were confirmed.'))
+        if conflicts:
+            pairs = ', '.join(f'#{pk} overlaps #{other}' for pk, other in conflicts)
+            self.message_user(request, _(f'{len(conflicts)} conflicts were left pending: {pairs}'), messages.WARNING)
     confirm_reservations.short_description = _('Confirm selected reservations')
     
     def mark_as_completed(self, request, queryset):
         today = timezone.now().date()
-        updated = queryset.filter(end_date__lt=today).update(status=ReservationStatus.COMPLETED)
+        updated = self._set_status(queryset.filter(end_date__lt=today), ReservationStatus.COMPLETED)
         self.message_user(request, _(f'{updated} reservations were marked as completed.'))
     mark_as_completed.short_description = _('Mark selected reservations as completed')
     
     def cancel_reservations(self, request, queryset):
-        updated = queryset.update(status=ReservationStatus.CANCELLED)
+        updated = self._set_status(queryset, ReservationStatus.CANCELLED)
         self.message_user(request, _(f'{updated} reservations were cancelled.'))
     cancel_reservations.short_description = _('Cancel selected reservations')
     
+    def create_invoices(self, request, queryset):
+        created = generate_invoices(queryset)
+        self.message_user(request, _(f'{created} invoices were created.'))
+    create_invoices.short_description = _('Create invoices for selected confirmed reservations')
+
+    def delete_queryset(self, request, queryset):
+        """Bulk delete (the delete_selected action) skips Reservation.delete, so close the history and invalidate here."""
+        reservations = list(queryset.only(*HISTORY_FIELDS))
+        with transaction.atomic():
+            ReservationHistory.objects.record_deleted(reservations)
+            super().delete_queryset(request, queryset)
+        cottage_ids = {reservation.cottage_id for reservation in reservations}
+        # Also bumps the reservations version the reports are keyed on
+        invalidate_calendars(cottage_ids)
+
     def save_model(self, request, obj, form, change):
         # Skip validation if admin changes the status to cancelled
         if change and 'status' in form.changed_data and obj.status == ReservationStatus.CANCELLED:
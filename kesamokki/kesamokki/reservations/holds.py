@@ -0,0 +1,74 @@
+"""
+Short-lived booking holds kept in the cache (Redis in production).
+
+Every held night is its own key, claimed with an atomic add (SET NX), so two
+guests racing for the same dates are settled in memory before either of them
+reaches the database.
+"""
+import secrets
+from datetime import timedelta
+
+from django.core.cache import cache
+
+HOLD_SECONDS = 10 * 60
+HOLD_MAX_NIGHTS = 60
+
+
+def _night_keys(cottage_id, start, end):
+    nights = (end - start).days
+    return [
+        f'reservations:hold:{cottage_id}:{(start + timedelta(days=offset)).isoformat()}'
+        for offset in range(nights)
+    ]
+
+
+def _range_key(token):
+    """Where the range currently held with ``token`` is remembered."""
+    return f'reservations:hold-range:{token}'
+
+
+def acquire_hold(cottage_id, start, end, token=None):
+    """
+    Hold every night of [start, end) for the caller.
+
+    Passing an existing ``token`` moves the caller's hold to the new range:
+    nights of the previous range that are not part of the new one are given
+    back, so changing dates never holds more than one range. Returns the hold
+    token, or None if another guest holds any of the nights; the previous
+    hold is then left as it was.
+    """
+    token = token or secrets.token_urlsafe(16)
+    keys = _night_keys(cottage_id, start, end)
+    acquired = []
+    for key in keys:
+        if cache.add(key, token, HOLD_SECONDS):
+            acquired.append(key)
+        elif cache.get(key) == token:
+            cache.touch(key, HOLD_SECONDS)
+        else:
+            # Give back the nights claimed so far so the hold is all or nothing
+            cache.delete_many(acquired)
+            return None
+
+    previous = cache.get(_range_key(token))
+    if previous and previous != (cottage_id, start, end):
+        stale = set(_night_keys(*previous)) - set(keys)
+        owned = [key for key, value in cache.get_many(list(stale)).items() if value == token]
+        cache.delete_many(owned)
+    cache.set(_range_key(token), (cottage_id, start, end), HOLD_SECONDS)
+    return token
+
+
+def release_hold(cottage_id, start, end, token):
+    """Drop the nights of [start, end) that are held with ``token``."""
+    keys = _night_keys(cottage_id, start, end)
+    owned = [key for key, value in cache.get_many(keys).items() if value == token]
+    cache.delete_many(owned)
+    if cache.get(_range_key(token)) == (cottage_id, start, end):
+        cache.delete(_range_key(token))
+
+
+def is_held_by_other(cottage_id, start, end, token=None):
+    """Whether another guest currently holds any night of [start, end)."""
+    held = cache.get_many(_night_keys(cottage_id, start, end))
+    return any(value != token for value in held.values())
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from kesamokki.reservations.models import Reservation, ReservationNight
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-night occupancy table from the reservations table. A database trigger keeps it in sync; use this to repair it."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--cottage",
+            type=int,
+            help="Only rebuild the nights of this cottage id.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=2000,
+            help="Number of reservations expanded per insert batch.",
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+        reservations = Reservation.objects.only(
+            "id", "cottage_id", "start_date", "end_date", "status",
+        ).order_by("id")
+        nights = ReservationNight.objects.all()
+        if options["cottage"]:
+            reservations = reservations.filter(cottage_id=options["cottage"])
+            nights = nights.filter(cottage_id=options["cottage"])
+
+        total = 0
+        with transaction.atomic():
+            nights.delete()
+            batch = []
+            for reservation in reservations.iterator(chunk_size=chunk_size):
+                batch.append(reservation)
+                if len(batch) >= chunk_size:
+                    total += len(ReservationNight.objects.bulk_create(ReservationNight.objects.build(batch)))
+                    batch = []
+            if batch:
+                total += len(ReservationNight.objects.bulk_create(ReservationNight.objects.build(batch)))
+
+        self.stdout.write(self.style.SUCCESS(f"Stored {total} reservation nights."))
@@ -0,0 +1,92 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.db.models import F, Q
+from django.utils import timezone
+
+from kesamokki.invoices.models import Invoice
+from kesamokki.reservations.models import ACTIVE_STATUSES, Reservation, ReservationStatus
+
+
+class Command(BaseCommand):
+    help = (
+        "Scan reservations for overlapping stays, active bookings left behind in the past "
+        "and invoices whose amount no longer matches the reservation price."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output",
+            help="Write one JSON issue per line to this file instead of stdout.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=5000,
+            help="Rows fetched per round trip from the server-side cursor.",
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+        counts = {"overlap": 0, "stale_status": 0, "invoice_amount": 0}
+
+        out = open(options["output"], "w") if options["output"] else self.stdout  # noqa: SIM115, PTH123
+        try:
+            for issue in self.scan_reservations(chunk_size):
+                counts[issue["type"]] += 1
+                out.write(json.dumps(issue) + "\n")
+            for issue in self.scan_invoices(chunk_size):
+                counts[issue["type"]] += 1
+                out.write(json.dumps(issue) + "\n")
+        finally:
+            if out is not self.stdout:
+                out.close()
+
+        summary = ", ".join(f"{count} {name}" for name, count in counts.items())
+        style = self.style.WARNING if any(counts.values()) else self.style.SUCCESS
+        self.stderr.write(style(f"Integrity scan finished: {summary}."))
+
+    def scan_reservations(self, chunk_size):
+        """
+        One ordered pass over every non-cancelled reservation.
+
+        Rows arrive sorted by (cottage, start), so a sweep that remembers the
+        stay reaching furthest so far finds each overlapping booking in O(1).
+        """
+        today = timezone.now().date()
+        rows = Reservation.objects.exclude(
+            status=ReservationStatus.CANCELLED,
+        ).order_by("cottage_id", "start_date", "id").values_list(
+            "id", "cottage_id", "start_date", "end_date", "status",
+        )
+
+        current_cottage = None
+        furthest_id = furthest_end = None
+        for pk, cottage_id, start_date, end_date, status in rows.iterator(chunk_size=chunk_size):
+            if status in ACTIVE_STATUSES and end_date < today:
+                yield {"type": "stale_status", "reservation": pk, "status": status, "end_date": end_date.isoformat()}
+
+            if cottage_id != current_cottage:
+                current_cottage = cottage_id
+                furthest_id, furthest_end = pk, end_date
+                continue
+
+            if start_date < furthest_end:
+                yield {"type": "overlap", "cottage": cottage_id, "reservation": pk, "overlaps": furthest_id}
+            if end_date > furthest_end:
+                furthest_id, furthest_end = pk, end_date
+
+    def scan_invoices(self, chunk_size):
+        """Invoices whose amount differs from the current reservation total."""
+        rows = Invoice.objects.filter(
+            ~Q(amount=F("reservation__total_price")) | Q(amount__isnull=True),
+        ).order_by("id").values_list("id", "invoice_number", "amount", "reservation__total_price")
+
+        for pk, number, amount, total_price in rows.iterator(chunk_size=chunk_size):
+            yield {
+                "type": "invoice_amount",
+                "invoice": pk,
+                "number": number,
+                "amount": str(amount) if amount is not None else None,
+                "total_price": str(total_price),
+            }
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.8 on 2026-10-18 17:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cottages', '0001_initial'),
+        ('reservations', '0005_remove_reservation_address'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReservationNight',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('night', models.DateField(verbose_name='Night')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('confirmed', 'Confirmed'), ('cancelled', 'Cancelled'), ('completed', 'Completed')], max_length=20, verbose_name='Status')),
+                ('cottage', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='booked_nights', to='cottages.cottage', verbose_name='Cottage')),
+                ('reservation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='nights', to='reservations.reservation', verbose_name='Reservation')),
+            ],
+            options={
+                'verbose_name': 'Reservation night',
+                'verbose_name_plural': 'Reservation nights',
+                'ordering': ['cottage', 'night'],
+                'indexes': [models.Index(fields=['cottage', 'night'], name='reservation_night_cottage_idx'), models.Index(fields=['night', 'status'], name='reservation_night_status_idx')],
+                'constraints': [models.UniqueConstraint(fields=('reservation', 'night'), name='unique_reservation_night')],
+            },
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.1.8 on 2026-10-18 17:47
+
+import django.contrib.postgres.constraints
+import django.contrib.postgres.operations
+import django.contrib.postgres.fields.ranges
+import kesamokki.reservations.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+def check_overlapping_stays(apps, schema_editor):
+    # Adding the constraint fails on a bare IntegrityError if any active
+    # bookings already overlap, so name them up front. Resolve them (cancel
+    # the duplicate or move its dates) and run the migration again;
+    # `manage.py scan_reservation_integrity` lists the same overlaps.
+    Reservation = apps.get_model('reservations', 'Reservation')
+    rows = Reservation.objects.filter(
+        status__in=['pending', 'confirmed'],
+    ).order_by('cottage_id', 'start_date', 'id').values_list('id', 'cottage_id', 'start_date', 'end_date')
+
+    overlaps = []
+    current_cottage = furthest_id = furthest_end = None
+    for pk, cottage_id, start_date, end_date in rows.iterator(chunk_size=2000):
+        if cottage_id != current_cottage:
+            current_cottage = cottage_id
+            furthest_id, furthest_end = pk, end_date
+            continue
+        if start_date < furthest_end:
+            overlaps.append(f'#{pk} overlaps #{furthest_id} (cottage {cottage_id})')
+        if end_date > furthest_end:
+            furthest_id, furthest_end = pk, end_date
+
+    if overlaps:
+        shown = ', '.join(overlaps[:20])
+        more = f' and {len(overlaps) - 20} more' if len(overlaps) > 20 else ''
+        raise RuntimeError(
+            f'Cannot add reservation_no_overlapping_stays: {len(overlaps)} active reservations '
+            f'overlap another booking of the same cottage: {shown}{more}. Cancel or move them '
+            f'(see manage.py scan_reservation_integrity) and migrate again.'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cottages', '0001_initial'),
+        ('reservations', '0006_reservationnight'),
+        ('users', '0003_customer_email_alter_customer_user'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        django.contrib.postgres.operations.BtreeGistExtension(),
+        migrations.RunPython(check_overlapping_stays, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='reservation',
+            name='stay',
+            field=models.GeneratedField(db_persist=True, expression=kesamokki.reservations.models.DateRange(models.F('start_date'), models.F('end_date')), output_field=django.contrib.postgres.fields.ranges.DateRangeField(), verbose_name='Stay'),
+        ),
+        migrations.AddConstraint(
+            model_name='reservation',
+            constraint=django.contrib.postgres.constraints.ExclusionConstraint(condition=models.Q(('status__in', ['pending', 'confirmed'])), expressions=[('cottage', '='), ('stay', '&&')], name='reservation_no_overlapping_stays', violation_error_message='The cottage is already booked for this period.'),
+        ),
+    ]
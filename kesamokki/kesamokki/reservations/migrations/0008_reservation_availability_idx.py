@@ -0,0 +1,21 @@
+# Generated by Django 5.1.8 on 2026-10-18 17:48
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cottages', '0001_initial'),
+        ('reservations', '0007_reservation_stay_exclusion'),
+        ('users', '0003_customer_email_alter_customer_user'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['cottage', 'status', 'start_date', 'end_date'], name='reservation_availability_idx'),
+        ),
+    ]
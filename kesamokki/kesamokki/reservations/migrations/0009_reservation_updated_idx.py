@@ -0,0 +1,21 @@
+# Generated by Django 5.1.8 on 2026-10-18 18:01
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cottages', '0001_initial'),
+        ('reservations', '0008_reservation_availability_idx'),
+        ('users', '0003_customer_email_alter_customer_user'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['updated_at', 'id'], name='reservation_updated_idx'),
+        ),
+    ]
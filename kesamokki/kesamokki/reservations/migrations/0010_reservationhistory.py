@@ -0,0 +1,60 @@
+# Generated by Django 5.1.8 on 2026-10-18 18:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_history(apps, schema_editor):
+    # Seed one version per existing booking from its creation time; cancelled
+    # bookings also get their cancellation, dated by the last update
+    Reservation = apps.get_model('reservations', 'Reservation')
+    ReservationHistory = apps.get_model('reservations', 'ReservationHistory')
+    rows = []
+    for reservation in Reservation.objects.order_by('id').iterator(chunk_size=2000):
+        state = {
+            'reservation_id': reservation.id,
+            'cottage_id': reservation.cottage_id,
+            'start_date': reservation.start_date,
+            'end_date': reservation.end_date,
+            'total_price': reservation.total_price,
+        }
+        if reservation.status == 'cancelled':
+            rows.append(ReservationHistory(status='pending', changed_at=reservation.created_at, **state))
+            rows.append(ReservationHistory(status='cancelled', changed_at=reservation.updated_at, **state))
+        else:
+            rows.append(ReservationHistory(status=reservation.status, changed_at=reservation.created_at, **state))
+        if len(rows) >= 2000:
+            ReservationHistory.objects.bulk_create(rows)
+            rows = []
+    ReservationHistory.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cottages', '0001_initial'),
+        ('reservations', '0009_reservation_updated_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReservationHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_date', models.DateField(verbose_name='Start Date')),
+                ('end_date', models.DateField(verbose_name='End Date')),
+                ('total_price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Total Price')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('confirmed', 'Confirmed'), ('cancelled', 'Cancelled'), ('completed', 'Completed')], max_length=20, verbose_name='Status')),
+                ('changed_at', models.DateTimeField(verbose_name='Changed At')),
+                ('cottage', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservation_history', to='cottages.cottage', verbose_name='Cottage')),
+                ('reservation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='history', to='reservations.reservation', verbose_name='Reservation')),
+            ],
+            options={
+                'verbose_name': 'Reservation history',
+                'verbose_name_plural': 'Reservation history',
+                'ordering': ['reservation', 'changed_at', 'id'],
+                'indexes': [models.Index(fields=['reservation', 'changed_at', 'id'], name='reservation_history_idx'), models.Index(fields=['start_date', 'end_date'], name='reservation_history_stay_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_history, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.1.8 on 2026-10-18 18:22
+
+from django.conf import settings
+from django.db import migrations, models
+
+# Stamps every written row with the id of the writing transaction. The ledger
+# feed pages by this id and only up to the oldest transaction still running,
+# so rows of long transactions can't commit behind a cursor.
+STAMP_FUNCTION = """
+CREATE OR REPLACE FUNCTION stamp_change_xid() RETURNS trigger AS $$
+BEGIN
+    NEW.change_xid := pg_current_xact_id()::text::bigint;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cottages', '0001_initial'),
+        ('reservations', '0010_reservationhistory'),
+        ('users', '0003_customer_email_alter_customer_user'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='reservation',
+            name='reservation_updated_idx',
+        ),
+        migrations.AddField(
+            model_name='reservation',
+            name='change_xid',
+            field=models.BigIntegerField(editable=False, null=True, verbose_name='Change Transaction'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['change_xid', 'id'], name='reservation_change_idx'),
+        ),
+        migrations.RunSQL(STAMP_FUNCTION, 'DROP FUNCTION stamp_change_xid();'),
+        migrations.RunSQL(
+            'CREATE TRIGGER reservation_change_xid BEFORE INSERT OR UPDATE ON reservations_reservation '
+            'FOR EACH ROW EXECUTE FUNCTION stamp_change_xid();',
+            'DROP TRIGGER reservation_change_xid ON reservations_reservation;',
+        ),
+        # Existing rows get this migration's transaction id
+        migrations.RunSQL('UPDATE reservations_reservation SET change_xid = NULL;', migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.1.8 on 2026-10-18 18:40
+
+from django.db import migrations
+
+# Keeps reservations_reservationnight in step with every reservation write,
+# including QuerySet.update() and bulk_create() that skip Reservation.save()
+SYNC_FUNCTION = """
+CREATE OR REPLACE FUNCTION sync_reservation_nights() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'UPDATE'
+            AND NEW.cottage_id = OLD.cottage_id
+            AND NEW.start_date = OLD.start_date
+            AND NEW.end_date = OLD.end_date THEN
+        IF NEW.status IS DISTINCT FROM OLD.status THEN
+            UPDATE reservations_reservationnight SET status = NEW.status WHERE reservation_id = NEW.id;
+        END IF;
+        RETURN NULL;
+    END IF;
+    IF TG_OP = 'UPDATE' THEN
+        DELETE FROM reservations_reservationnight WHERE reservation_id = NEW.id;
+    END IF;
+    INSERT INTO reservations_reservationnight (cottage_id, reservation_id, night, status)
+    SELECT NEW.cottage_id, NEW.id, night::date, NEW.status
+    FROM generate_series(NEW.start_date, NEW.end_date - 1, interval '1 day') AS night;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+# Rows written before the trigger may have drifted through bulk updates
+RESYNC = """
+DELETE FROM reservations_reservationnight;
+INSERT INTO reservations_reservationnight (cottage_id, reservation_id, night, status)
+SELECT r.cottage_id, r.id, night::date, r.status
+FROM reservations_reservation r,
+     generate_series(r.start_date, r.end_date - 1, interval '1 day') AS night;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservations', '0011_change_xid'),
+    ]
+
+    operations = [
+        migrations.RunSQL(SYNC_FUNCTION, 'DROP FUNCTION sync_reservation_nights();'),
+        migrations.RunSQL(
+            'CREATE TRIGGER reservation_sync_nights '
+            'AFTER INSERT OR UPDATE OF cottage_id, start_date, end_date, status ON reservations_reservation '
+            'FOR EACH ROW EXECUTE FUNCTION sync_reservation_nights();',
+            'DROP TRIGGER reservation_sync_nights ON reservations_reservation;',
+        ),
+        migrations.RunSQL(RESYNC, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.8 on 2026-10-18 18:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservations', '0012_reservation_sync_nights'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='reservationhistory',
+            options={'ordering': ['reservation_id', 'changed_at', 'id'], 'verbose_name': 'Reservation history', 'verbose_name_plural': 'Reservation history'},
+        ),
+        migrations.AlterField(
+            model_name='reservationhistory',
+            name='reservation',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='history', to='reservations.reservation', verbose_name='Reservation'),
+        ),
+    ]
@@ -1,9 +1,14 @@
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.db.models import F, Func, Q
+from django.contrib.postgres.constraints import ExclusionConstraint
+from django.contrib.postgres.fields import DateRangeField, RangeOperators
 from django.conf import settings
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from kesamokki.cottages.models import Cottage
 from kesamokki.users.models import Customer
+from kesamokki.utils.cache import bump_version
 import datetime
 from django.core.validators import EmailValidator, RegexValidator
 
@@ -13,6 +18,44 @@ class ReservationStatus(models.TextChoices):
     CANCELLED = 'cancelled', _('Cancelled')
     COMPLETED = 'completed', _('Completed')
 
+# Statuses that occupy the cottage and take part in the overlap constraint
+ACTIVE_STATUSES = [ReservationStatus.PENDING, ReservationStatus.CONFIRMED]
+
+OVERLAP_CONSTRAINT = 'reservation_no_overlapping_stays'
+
+# Cache version counter bumped by every reservation change
+RESERVATIONS_VERSION_KEY = 'reservations:version'
+
+# Fields whose changes are appended to the reservation history
+HISTORY_FIELDS = ('cottage_id', 'start_date', 'end_date', 'total_price', 'status')
+
+
+def calendar_version_key(cottage_id):
+    """Cache version counter for a cottage's availability calendar."""
+    return f'reservations:calendar-version:{cottage_id}'
+
+
+def invalidate_calendars(cottage_ids):
+    """
+    Bump the calendar versions of the given cottages, and the global
+    reservations version, once the transaction commits.
+    """
+    cottage_ids = set(cottage_ids)
+
+    def bump():
+        for pk in cottage_ids:
+            bump_version(calendar_version_key(pk))
+        bump_version(RESERVATIONS_VERSION_KEY)
+
+    transaction.on_commit(bump)
+
+
+class DateRange(Func):
+    """SQL ``daterange(start, end)`` with the default ``[)`` bounds."""
+    function = 'daterange'
+    output_field = DateRangeField()
+
+
 class Reservation(models.Model):
     cottage = models.ForeignKey(
         Cottage, 
@@ -36,6 +79,12 @@ class Reservation(models.Model):
     )
     start_date = models.DateField(_('Start Date'))
     end_date = models.DateField(_('End Date'))
+    stay = models.GeneratedField(
+        expression=DateRange(F('start_date'), F('end_date')),
+        output_field=DateRangeField(),
+        db_persist=True,
+        verbose_name=_('Stay'),
+    )
     guests = models.PositiveSmallIntegerField(_('Number of Guests'))
     total_price = models.DecimalField(_('Total Price'), max_digits=10, decimal_places=2)
     status = models.CharField(
@@ -46,11 +95,34 @@ class Reservation(models.Model):
     )
     created_at = models.DateTimeField(_('Created At'), auto_now_add=True)
     updated_at = models.DateTimeField(_('Updated At'), auto_now=True)
+    # Id of the transaction that last wrote the row, stamped by a database trigger
+    change_xid = models.BigIntegerField(_('Change Transaction'), null=True, editable=False)
     
     class Meta:
         ordering = ['-start_date']
         verbose_name = _('Reservation')
         verbose_name_plural = _('Reservations')
+        indexes = [
+            # Serves the availability anti-join used by the cottage search
+            models.Index(
+                fields=['cottage', 'status', 'start_date', 'end_date'],
+                name='reservation_availability_idx',
+            ),
+            # Keyset pagination of the accounting ledger feed
+            models.Index(fields=['change_xid', 'id'], name='reservation_change_idx'),
+        ]
+        constraints = [
+            # Lets the database reject double bookings, even between concurrent requests
+            ExclusionConstraint(
+                name=OVERLAP_CONSTRAINT,
+                expressions=[
+                    ('cottage', RangeOperators.EQUAL),
+                    ('stay', RangeOperators.OVERLAPS),
+                ],
+                condition=Q(status__in=ACTIVE_STATUSES),
+                violation_error_message=_('The cottage is already booked for this period.'),
+            ),
+        ]
     
     def __str__(self):
         return f"{self.cottage.name} - {self.user.username} ({self.start_date} to {self.end_date})"
@@ -64,25 +136,52 @@ class Reservation(models.Model):
         if self.start_date and self.start_date < datetime.date.today():
             raise ValidationError({'start_date': _('Reservations cannot start in the past.')})
         
-        # Check for overlapping reservations for the same cottage
-        overlapping = Reservation.objects.filter(
-            cottage=self.cottage,
-            status__in=[ReservationStatus.PENDING, ReservationStatus.CONFIRMED],
-            start_date__lt=self.end_date,
-            end_date__gt=self.start_date
-        ).exclude(id=self.id)
-        
-        if overlapping.exists():
-            raise ValidationError(_('The cottage is already booked for this period.'))
+        # Overlapping reservations are rejected by the exclusion constraint
         
         # Check that guests don't exceed cottage capacity
         if self.guests and self.cottage and self.guests > self.cottage.beds:
             raise ValidationError({'guests': _('Number of guests exceeds cottage capacity.')})
     
     def save(self, *args, **kwargs):
-        self.full_clean()  # Run validation before saving
-        super().save(*args, **kwargs)
+        # Run validation before saving; overlaps are left to the database
+        self.full_clean(validate_constraints=False)
+        try:
+            # Savepoint so a rejected booking doesn't break the outer transaction
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+        except IntegrityError as e:
+            if OVERLAP_CONSTRAINT in str(e):
+                raise ValidationError(_('The cottage is already booked for this period.')) from e
+            raise
+        state = self._history_state()
+        if state != self._loaded_state:
+            ReservationHistory.objects.record([self])
+        cottage_ids = {self.cottage_id}
+        if self._loaded_state:
+            # A stay moved to another cottage frees the calendar it left
+            cottage_ids.add(self._loaded_state[0])
+        self._loaded_state = state
+        invalidate_calendars(cottage_ids)
     
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            ReservationHistory.objects.record_deleted([self])
+            result = super().delete(*args, **kwargs)
+        invalidate_calendars([self.cottage_id])
+        return result
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored state so saves that change nothing add no history
+        instance._loaded_state = instance._history_state()
+        return instance
+
+    def _history_state(self):
+        return tuple(self.__dict__.get(field) for field in HISTORY_FIELDS)
+
+    _loaded_state = None
+
     def get_nights(self):
         """Calculate the number of nights for this reservation"""
         if self.start_date and self.end_date:
@@ -98,4 +197,158 @@ class Reservation(models.Model):
     
     def get_base_price_total(self):
         """Calculate the base price total (excluding cleaning fee)"""
-        return self.total_price - self.cottage.cleaning_fee
\ No newline at end of file
+        return self.total_price - self.cottage.cleaning_fee
+
+
+class ReservationNightManager(models.Manager):
+    """
+    Builds the denormalized per-night rows for backfills. Day to day they are
+    kept in sync by the ``reservation_sync_nights`` database trigger, which
+    also covers ``QuerySet.update()`` and ``bulk_create()``.
+    """
+
+    def build(self, reservations):
+        """Return unsaved night rows for the given reservations."""
+        return [
+            self.model(
+                cottage_id=reservation.cottage_id,
+                reservation_id=reservation.pk,
+                night=reservation.start_date + datetime.timedelta(days=offset),
+                status=reservation.status,
+            )
+            for reservation in reservations
+            for offset in range(reservation.get_nights())
+        ]
+
+
+class ReservationNight(models.Model):
+    """
+    One row per booked night, maintained by a database trigger on every
+    reservation insert and update.
+    Reporting and availability queries read this table with indexed range scans
+    instead of expanding reservations in Python.
+    """
+    cottage = models.ForeignKey(
+        Cottage,
+        on_delete=models.CASCADE,
+        related_name='booked_nights',
+        verbose_name=_('Cottage')
+    )
+    night = models.DateField(_('Night'))
+    reservation = models.ForeignKey(
+        Reservation,
+        on_delete=models.CASCADE,
+        related_name='nights',
+        verbose_name=_('Reservation')
+    )
+    status = models.CharField(
+        _('Status'),
+        max_length=20,
+        choices=ReservationStatus.choices,
+    )
+
+    objects = ReservationNightManager()
+
+    class Meta:
+        ordering = ['cottage', 'night']
+        verbose_name = _('Reservation night')
+        verbose_name_plural = _('Reservation nights')
+        constraints = [
+            models.UniqueConstraint(fields=['reservation', 'night'], name='unique_reservation_night'),
+        ]
+        indexes = [
+            models.Index(fields=['cottage', 'night'], name='reservation_night_cottage_idx'),
+            models.Index(fields=['night', 'status'], name='reservation_night_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.cottage_id} {self.night} ({self.status})"
+
+
+class ReservationHistoryManager(models.Manager):
+    """Appends snapshots of reservations; rows are never updated or deleted."""
+
+    def build(self, reservations, changed_at=None):
+        """Return unsaved history rows capturing the current state of ``reservations``."""
+        changed_at = changed_at or timezone.now()
+        return [
+            self.model(
+                reservation_id=reservation.pk,
+                cottage_id=reservation.cottage_id,
+                start_date=reservation.start_date,
+                end_date=reservation.end_date,
+                total_price=reservation.total_price,
+                status=reservation.status,
+                changed_at=changed_at,
+            )
+            for reservation in reservations
+        ]
+
+    def record(self, reservations, changed_at=None, batch_size=1000):
+        """Append one history row per reservation instance."""
+        rows = self.build(reservations, changed_at)
+        self.bulk_create(rows, batch_size=batch_size)
+        return len(rows)
+
+    def record_deleted(self, reservations, changed_at=None, batch_size=1000):
+        """
+        Close the history of reservations about to be deleted with a cancelled
+        version, so they leave the books from now on but not in the past.
+        """
+        rows = self.build(
+            [reservation for reservation in reservations if reservation.status != ReservationStatus.CANCELLED],
+            changed_at,
+        )
+        for row in rows:
+            row.status = ReservationStatus.CANCELLED
+        self.bulk_create(rows, batch_size=batch_size)
+        return len(rows)
+
+
+class ReservationHistory(models.Model):
+    """
+    Append-only log of reservation states, one row per booking, status or
+    date change. Booking pace reports replay it to see what was on the books
+    on any past day. Rows outlive their reservation, so the foreign key is
+    not enforced and deleting a booking keeps its past.
+    """
+    reservation = models.ForeignKey(
+        Reservation,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='history',
+        verbose_name=_('Reservation')
+    )
+    cottage = models.ForeignKey(
+        Cottage,
+        on_delete=models.CASCADE,
+        related_name='reservation_history',
+        verbose_name=_('Cottage')
+    )
+    start_date = models.DateField(_('Start Date'))
+    end_date = models.DateField(_('End Date'))
+    total_price = models.DecimalField(_('Total Price'), max_digits=10, decimal_places=2)
+    status = models.CharField(
+        _('Status'),
+        max_length=20,
+        choices=ReservationStatus.choices,
+    )
+    changed_at = models.DateTimeField(_('Changed At'))
+
+    objects = ReservationHistoryManager()
+
+    class Meta:
+        # By the column: ordering by the relation would join the reservation
+        # and hide the versions of deleted ones
+        ordering = ['reservation_id', 'changed_at', 'id']
+        verbose_name = _('Reservation history')
+        verbose_name_plural = _('Reservation history')
+        indexes = [
+            # Replaying a reservation's versions in order
+            models.Index(fields=['reservation', 'changed_at', 'id'], name='reservation_history_idx'),
+            # Finding the versions whose stay touches a reporting window
+            models.Index(fields=['start_date', 'end_date'], name='reservation_history_stay_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.reservation_id} {self.status} at {self.changed_at}"
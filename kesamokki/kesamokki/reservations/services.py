@@ -0,0 +1,164 @@
+"""
+Set-based reservation operations that work on many bookings per query.
+"""
+from collections import defaultdict
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.translation import gettext as _
+
+from kesamokki.cottages.models import Cottage
+from .models import (
+    ACTIVE_STATUSES,
+    HISTORY_FIELDS,
+    OVERLAP_CONSTRAINT,
+    Reservation,
+    ReservationHistory,
+    ReservationStatus,
+    invalidate_calendars,
+)
+from .holds import is_held_by_other, release_hold
+
+GROUP_BOOKING_MAX_ITEMS = 50
+
+
+def _overlaps(first, second):
+    return first['start_date'] < second['end_date'] and second['start_date'] < first['end_date']
+
+
+def book_group(user, customer, items):
+    """
+    Create pending reservations for several cottages in one transaction.
+
+    ``items`` are dicts with ``cottage_id``, ``start_date``, ``end_date``,
+    ``guests`` and optionally the ``hold_token`` the guest holds the dates
+    with; dates held by another guest are rejected. Returns ``(reservations, errors)`` where ``errors`` maps the
+    index of each rejected item to a message. Nothing is created unless every
+    item is valid.
+    """
+    errors = {}
+    today = timezone.now().date()
+    cottages = Cottage.objects.filter(active=True).in_bulk({item['cottage_id'] for item in items})
+
+    for index, item in enumerate(items):
+        cottage = cottages.get(item['cottage_id'])
+        if cottage is None:
+            errors[index] = _('Cottage not found.')
+        elif item['start_date'] >= item['end_date']:
+            errors[index] = _('End date must be after start date.')
+        elif item['start_date'] < today:
+            errors[index] = _('Reservations cannot start in the past.')
+        elif not 0 < item['guests'] <= cottage.beds:
+            errors[index] = _('Number of guests exceeds cottage capacity.')
+        elif is_held_by_other(cottage.pk, item['start_date'], item['end_date'], item.get('hold_token')):
+            errors[index] = _('These dates are on hold for another guest.')
+
+    valid = [(index, item) for index, item in enumerate(items) if index not in errors]
+
+    # Items of the same group must not overlap each other
+    by_cottage = defaultdict(list)
+    for index, item in valid:
+        by_cottage[item['cottage_id']].append((index, item))
+    for group in by_cottage.values():
+        group.sort(key=lambda entry: entry[1]['start_date'])
+        for previous, (index, item) in zip(group, group[1:], strict=False):
+            if _overlaps(previous[1], item):
+                errors[index] = _('This item overlaps another item of the booking.')
+
+    # One query finds every existing booking that collides with any item
+    if valid:
+        collisions = Q()
+        for _index, item in valid:
+            collisions |= Q(
+                cottage_id=item['cottage_id'],
+                start_date__lt=item['end_date'],
+                end_date__gt=item['start_date'],
+            )
+        booked = defaultdict(list)
+        for cottage_id, start_date, end_date in Reservation.objects.filter(
+            collisions, status__in=ACTIVE_STATUSES,
+        ).values_list('cottage_id', 'start_date', 'end_date'):
+            booked[cottage_id].append({'start_date': start_date, 'end_date': end_date})
+        for index, item in valid:
+            if any(_overlaps(item, existing) for existing in booked[item['cottage_id']]):
+                errors[index] = _('The cottage is already booked for this period.')
+
+    if errors:
+        return [], errors
+
+    reservations = []
+    for item in items:
+        cottage = cottages[item['cottage_id']]
+        nights = (item['end_date'] - item['start_date']).days
+        reservations.append(Reservation(
+            cottage=cottage,
+            user=user,
+            customer=customer,
+            start_date=item['start_date'],
+            end_date=item['end_date'],
+            guests=item['guests'],
+            total_price=nights * cottage.base_price + cottage.cleaning_fee,
+            status=ReservationStatus.PENDING,
+        ))
+
+    try:
+        with transaction.atomic():
+            Reservation.objects.bulk_create(reservations)
+            ReservationHistory.objects.record(reservations)
+    except IntegrityError as e:
+        # Another request booked one of the cottages after our check
+        if OVERLAP_CONSTRAINT not in str(e):
+            raise
+        message = _('The cottage is already booked for this period.')
+        return [], {index: message for index in range(len(items))}
+
+    for item in items:
+        if item.get('hold_token'):
+            release_hold(item['cottage_id'], item['start_date'], item['end_date'], item['hold_token'])
+    invalidate_calendars(reservation.cottage_id for reservation in reservations)
+    return reservations, {}
+
+
+def confirm_pending(queryset):
+    """
+    Confirm the pending reservations of ``queryset`` that collide with nothing.
+
+    Pending and confirmed stays already exclude each other through the
+    database constraint, but completed stays do not, so one self-join finds
+    every selected booking that overlaps a confirmed or completed stay of the
+    same cottage. The rest are confirmed with a single UPDATE whose
+    RETURNING rows feed the history. Returns
+    ``(confirmed_ids, conflicts)`` where ``conflicts`` lists
+    ``(reservation_id, conflicting_reservation_id)`` pairs.
+    """
+    pending = queryset.filter(status=ReservationStatus.PENDING)
+
+    conflicts = list(pending.filter(
+        cottage__reservations__status__in=[ReservationStatus.CONFIRMED, ReservationStatus.COMPLETED],
+        cottage__reservations__start_date__lt=F('end_date'),
+        cottage__reservations__end_date__gt=F('start_date'),
+    ).values_list('id', 'cottage__reservations__id').order_by('id'))
+    conflicting_ids = {reservation_id for reservation_id, _other in conflicts}
+
+    candidate_ids = list(pending.exclude(id__in=conflicting_ids).values_list('id', flat=True))
+    # RETURNING hands back only the rows this UPDATE changed, so a booking a
+    # concurrent request confirmed or cancelled meanwhile gets no history row
+    table = connection.ops.quote_name(Reservation._meta.db_table)
+    now = timezone.now()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {table} SET status = %s, updated_at = %s "
+            f"WHERE id = ANY(%s) AND status = %s "
+            f"RETURNING id, {', '.join(HISTORY_FIELDS)}",
+            [ReservationStatus.CONFIRMED, now, candidate_ids, ReservationStatus.PENDING],
+        )
+        confirmed = [
+            Reservation(id=row[0], **dict(zip(HISTORY_FIELDS, row[1:], strict=True)))
+            for row in sorted(cursor.fetchall())
+        ]
+    ReservationHistory.objects.record(confirmed, changed_at=now)
+    invalidate_calendars(reservation.cottage_id for reservation in confirmed)
+    confirmed_ids = [reservation.pk for reservation in confirmed]
+
+    return confirmed_ids, conflicts
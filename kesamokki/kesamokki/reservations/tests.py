@@ -6,9 +6,19 @@ import datetime
 import json
 from decimal import Decimal
 from django.core.exceptions import ValidationError
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.contrib.admin.sites import site
+from io import StringIO
 
 from kesamokki.cottages.models import Cottage
-from .models import Reservation, ReservationStatus
+from .models import Reservation, ReservationNight, ReservationStatus
+from .admin import ReservationAdmin
+from .views import free_start_dates
+from .services import confirm_pending
+from .holds import acquire_hold, is_held_by_other, release_hold
 from kesamokki.users.models import Customer
 
 User = get_user_model()
@@ -152,4 +162,548 @@ class ReservationModelTests(TestCase):
                 status=ReservationStatus.PENDING
             )
             overlap_res.save()
-            
\ No newline at end of file
+            
+    
+    def test_overlap_rejected_by_database(self):
+        """Test that the exclusion constraint blocks overlaps that skip clean()"""
+        first = Reservation.objects.create(
+            cottage=self.cottage,
+            user=self.user,
+            customer=self.customer,
+            start_date=self.tomorrow,
+            end_date=self.day_after,
+            guests=2,
+            total_price=Decimal('150.00'),
+            status=ReservationStatus.PENDING
+        )
+        second = Reservation.objects.create(
+            cottage=self.cottage,
+            user=self.user,
+            customer=self.customer,
+            start_date=self.day_after,  # Back-to-back stays don't overlap
+            end_date=self.next_week,
+            guests=2,
+            total_price=Decimal('550.00'),
+            status=ReservationStatus.CANCELLED
+        )
+        
+        # Re-activating a cancelled booking through a bulk update is still checked
+        Reservation.objects.filter(pk=second.pk).update(start_date=self.tomorrow)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Reservation.objects.filter(pk=second.pk).update(status=ReservationStatus.CONFIRMED)
+        
+        # Cancelling the first booking frees the dates
+        first.status = ReservationStatus.CANCELLED
+        first.save()
+        Reservation.objects.filter(pk=second.pk).update(status=ReservationStatus.CONFIRMED)
+
+
+class ReservationNightTests(TestCase):
+    """Tests for the per-night occupancy rows"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            password='testpassword123'
+        )
+        self.customer = Customer.objects.create(
+            full_name='Test User',
+            phone='+358401234567',
+            address_line1='Test Address 123'
+        )
+        self.cottage = Cottage.objects.create(
+            name='Test Cottage',
+            slug='test-cottage',
+            description='A test cottage',
+            location='Test Location',
+            beds=4,
+            base_price=Decimal('100.00'),
+            cleaning_fee=Decimal('50.00')
+        )
+        self.tomorrow = timezone.now().date() + datetime.timedelta(days=1)
+        self.reservation = Reservation.objects.create(
+            cottage=self.cottage,
+            user=self.user,
+            customer=self.customer,
+            start_date=self.tomorrow,
+            end_date=self.tomorrow + datetime.timedelta(days=3),
+            guests=2,
+            total_price=Decimal('350.00'),
+            status=ReservationStatus.PENDING
+        )
+    
+    def test_save_writes_one_row_per_night(self):
+        """Test that saving a reservation stores each booked night"""
+        nights = list(self.reservation.nights.values_list('night', flat=True))
+        self.assertEqual(nights, [self.tomorrow + datetime.timedelta(days=i) for i in range(3)])
+        
+        # Moving the stay replaces the stored nights
+        self.reservation.end_date = self.tomorrow + datetime.timedelta(days=1)
+        self.reservation.save()
+        self.assertEqual(self.reservation.nights.count(), 1)
+    
+    def test_admin_bulk_status_is_mirrored(self):
+        """Test that admin bulk actions update the stored night status"""
+        model_admin = ReservationAdmin(Reservation, site)
+        updated = model_admin._set_status(Reservation.objects.all(), ReservationStatus.CANCELLED)
+        
+        self.assertEqual(updated, 1)
+        self.assertEqual(
+            set(self.reservation.nights.values_list('status', flat=True)),
+            {ReservationStatus.CANCELLED}
+        )
+    
+    def test_rebuild_command(self):
+        """Test that the rebuild command backfills missing nights"""
+        ReservationNight.objects.all().delete()
+        call_command('rebuild_reservation_nights', stdout=StringIO())
+        
+        self.assertEqual(ReservationNight.objects.filter(reservation=self.reservation).count(), 3)
+
+
+class AvailabilityCalendarTests(TestCase):
+    """Tests for the cached availability calendar endpoint"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            password='testpassword123'
+        )
+        self.customer = Customer.objects.create(
+            full_name='Test User',
+            address_line1='Test Address 123'
+        )
+        self.cottage = Cottage.objects.create(
+            name='Test Cottage',
+            slug='test-cottage',
+            description='A test cottage',
+            location='Test Location',
+            beds=4,
+            base_price=Decimal('100.00'),
+            cleaning_fee=Decimal('50.00')
+        )
+        self.start = timezone.now().date() + datetime.timedelta(days=3)
+        self.url = reverse('reservations:calendar', kwargs={'cottage_id': self.cottage.pk})
+    
+    def _reserve(self, start, end):
+        return Reservation.objects.create(
+            cottage=self.cottage,
+            user=self.user,
+            customer=self.customer,
+            start_date=start,
+            end_date=end,
+            guests=2,
+            total_price=Decimal('150.00'),
+            status=ReservationStatus.PENDING
+        )
+    
+    def test_adjacent_stays_are_merged(self):
+        """Test that back-to-back stays are returned as one blocked range"""
+        with self.captureOnCommitCallbacks(execute=True):
+            self._reserve(self.start, self.start + datetime.timedelta(days=2))
+            self._reserve(self.start + datetime.timedelta(days=2), self.start + datetime.timedelta(days=5))
+        
+        data = self.client.get(self.url, {'months': 2}).json()
+        
+        self.assertEqual(data['blocked'], [
+            [self.start.isoformat(), (self.start + datetime.timedelta(days=5)).isoformat()]
+        ])
+    
+    def test_cached_until_a_booking_changes(self):
+        """Test that repeated reads skip the database until a save bumps the version"""
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(self.url).json()['blocked'], [])
+        # Only the request's transaction savepoint touches the database
+        self.assertFalse([q for q in queries.captured_queries if 'SELECT' in q['sql']])
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            reservation = self._reserve(self.start, self.start + datetime.timedelta(days=1))
+        self.assertEqual(len(self.client.get(self.url).json()['blocked']), 1)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            reservation.delete()
+        self.assertEqual(self.client.get(self.url).json()['blocked'], [])
+
+    def test_admin_bulk_delete_invalidates(self):
+        """Test that the admin's delete_selected action frees the cached calendar"""
+        with self.captureOnCommitCallbacks(execute=True):
+            self._reserve(self.start, self.start + datetime.timedelta(days=1))
+        self.assertEqual(len(self.client.get(self.url).json()['blocked']), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ReservationAdmin(Reservation, site).delete_queryset(None, Reservation.objects.all())
+        self.assertEqual(self.client.get(self.url).json()['blocked'], [])
+
+    def test_moving_to_another_cottage_invalidates_both(self):
+        """Test that a stay moved to another cottage frees the calendar it left"""
+        other = Cottage.objects.create(
+            name='Other Cottage', slug='other-cottage', description='Another cottage',
+            location='Test Location', beds=4, base_price=Decimal('100.00'), cleaning_fee=Decimal('50.00')
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            reservation = self._reserve(self.start, self.start + datetime.timedelta(days=1))
+        self.assertEqual(len(self.client.get(self.url).json()['blocked']), 1)
+
+        reservation = Reservation.objects.get(pk=reservation.pk)
+        reservation.cottage = other
+        with self.captureOnCommitCallbacks(execute=True):
+            reservation.save()
+        self.assertEqual(self.client.get(self.url).json()['blocked'], [])
+
+
+class FlexibleSearchTests(TestCase):
+    """Tests for the flexible-date search"""
+    
+    def test_free_start_dates_walks_gaps(self):
+        """Test that start dates are found in every gap long enough for the stay"""
+        day = datetime.date(2030, 7, 1)
+        bookings = [
+            (day + datetime.timedelta(days=3), day + datetime.timedelta(days=5)),
+            (day + datetime.timedelta(days=6), day + datetime.timedelta(days=8)),
+        ]
+        
+        dates = free_start_dates(bookings, day, day + datetime.timedelta(days=12), 2)
+        
+        self.assertEqual(dates, [day + datetime.timedelta(days=n) for n in (0, 1, 8, 9, 10)])
+    
+    def test_search_quotes_price_per_cottage(self):
+        """Test that the endpoint lists free cottages with their price"""
+        user = User.objects.create_user(email='test@example.com', password='testpassword123')
+        customer = Customer.objects.create(full_name='Test User', address_line1='Test Address 123')
+        free = Cottage.objects.create(
+            name='Free Cottage', description='Free', location='Kuopio', beds=4,
+            base_price=Decimal('100.00'), cleaning_fee=Decimal('50.00')
+        )
+        busy = Cottage.objects.create(
+            name='Busy Cottage', description='Busy', location='Kuopio', beds=4,
+            base_price=Decimal('100.00')
+        )
+        start = timezone.now().date() + datetime.timedelta(days=10)
+        Reservation.objects.create(
+            cottage=busy, user=user, customer=customer,
+            start_date=start, end_date=start + datetime.timedelta(days=7),
+            guests=2, total_price=Decimal('700.00'), status=ReservationStatus.CONFIRMED
+        )
+        
+        response = self.client.get(reverse('reservations:flexible-search'), {
+            'start': start.isoformat(),
+            'end': (start + datetime.timedelta(days=7)).isoformat(),
+            'nights': 5,
+        })
+        
+        data = response.json()
+        self.assertEqual([cottage['id'] for cottage in data['cottages']], [free.id])
+        self.assertEqual(data['cottages'][0]['total_price'], 550.0)
+        self.assertEqual(len(data['cottages'][0]['start_dates']), 3)
+
+    def test_search_offers_today(self):
+        """Test that a same-day stay is offered, like the booking form allows, but no earlier day"""
+        Cottage.objects.create(
+            name='Free Cottage', description='Free', location='Kuopio', beds=4,
+            base_price=Decimal('100.00'), cleaning_fee=Decimal('50.00')
+        )
+        today = timezone.localdate()
+        response = self.client.get(reverse('reservations:flexible-search'), {
+            'start': (today - datetime.timedelta(days=1)).isoformat(),
+            'end': (today + datetime.timedelta(days=2)).isoformat(),
+            'nights': 1,
+        })
+
+        self.assertEqual(response.json()['cottages'][0]['start_dates'][0], today.isoformat())
+
+    def test_search_requires_parameters(self):
+        """Test that a malformed search is rejected"""
+        response = self.client.get(reverse('reservations:flexible-search'), {'nights': 'x'})
+        self.assertEqual(response.status_code, 400)
+
+
+class BookingHoldTests(TestCase):
+    """Tests for the short-lived booking holds"""
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='test@example.com', password='testpassword123')
+        self.customer = Customer.objects.create(full_name='Test User', address_line1='Test Address 123')
+        self.cottage = Cottage.objects.create(
+            name='Test Cottage', slug='test-cottage', description='A test cottage',
+            location='Test Location', beds=4,
+            base_price=Decimal('100.00'), cleaning_fee=Decimal('50.00')
+        )
+        self.start = timezone.now().date() + datetime.timedelta(days=5)
+        self.end = self.start + datetime.timedelta(days=3)
+    
+    def test_hold_is_all_or_nothing(self):
+        """Test that an overlapping hold fails without keeping any nights"""
+        token = acquire_hold(self.cottage.pk, self.start, self.end)
+        self.assertIsNotNone(token)
+        self.assertEqual(acquire_hold(self.cottage.pk, self.start, self.end, token), token)
+        
+        later = self.end + datetime.timedelta(days=2)
+        self.assertIsNone(acquire_hold(self.cottage.pk, self.end - datetime.timedelta(days=1), later))
+        self.assertFalse(is_held_by_other(self.cottage.pk, self.end, later))
+        
+        release_hold(self.cottage.pk, self.start, self.end, token)
+        self.assertFalse(is_held_by_other(self.cottage.pk, self.start, self.end))
+    
+    def test_changing_dates_moves_the_hold(self):
+        """Test that re-holding with the same token gives back the nights of the previous range"""
+        token = acquire_hold(self.cottage.pk, self.start, self.end)
+        later_start = self.start + datetime.timedelta(days=2)
+        later_end = later_start + datetime.timedelta(days=3)
+        self.assertEqual(acquire_hold(self.cottage.pk, later_start, later_end, token), token)
+        
+        self.assertFalse(is_held_by_other(self.cottage.pk, self.start, later_start))
+        self.assertTrue(is_held_by_other(self.cottage.pk, later_start, later_end))
+    
+    def test_held_dates_are_unavailable_to_other_guests(self):
+        """Test that check_availability and create_reservation_ajax respect holds"""
+        self.client.login(email='test@example.com', password='testpassword123')
+        params = {
+            'cottage_id': self.cottage.pk,
+            'start_date': self.start.isoformat(),
+            'end_date': self.end.isoformat(),
+        }
+        token = self.client.post(reverse('reservations:hold'), params).json()['hold_token']
+        
+        self.assertFalse(self.client.get(reverse('reservations:check-availability'), params).json()['available'])
+        self.assertTrue(self.client.get(
+            reverse('reservations:check-availability'), {**params, 'hold_token': token}
+        ).json()['available'])
+        
+        booking = {**params, 'guests': 2, 'customer_id': self.customer.pk}
+        self.assertFalse(self.client.post(reverse('reservations:create-ajax'), booking).json()['success'])
+        response = self.client.post(reverse('reservations:create-ajax'), {**booking, 'hold_token': token})
+        self.assertTrue(response.json()['success'])
+        
+        # The hold is released once the booking exists
+        self.assertFalse(is_held_by_other(self.cottage.pk, self.start, self.end))
+    
+    def test_retried_booking_is_replayed(self):
+        """Test that a retry with the same Idempotency-Key creates one reservation"""
+        self.client.login(email='test@example.com', password='testpassword123')
+        booking = {
+            'cottage_id': self.cottage.pk,
+            'start_date': self.start.isoformat(),
+            'end_date': self.end.isoformat(),
+            'guests': 2,
+            'customer_id': self.customer.pk,
+        }
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.client.post(reverse('reservations:create-ajax'), booking, headers={'Idempotency-Key': 'abc'})
+        second = self.client.post(reverse('reservations:create-ajax'), booking, headers={'Idempotency-Key': 'abc'})
+        
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(Reservation.objects.count(), 1)
+        
+        # Reusing the key for a different booking is refused, not replayed
+        changed = self.client.post(
+            reverse('reservations:create-ajax'), {**booking, 'guests': 3}, headers={'Idempotency-Key': 'abc'}
+        )
+        self.assertEqual(changed.status_code, 422)
+        self.assertEqual(Reservation.objects.count(), 1)
+
+
+class GroupBookingTests(TestCase):
+    """Tests for the atomic group booking endpoint"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(email='test@example.com', password='testpassword123')
+        self.customer = Customer.objects.create(full_name='Corporate Customer', address_line1='Test Address 123')
+        self.cottages = [
+            Cottage.objects.create(
+                name=f'Cottage {n}', slug=f'cottage-{n}', description='A test cottage',
+                location='Test Location', beds=4,
+                base_price=Decimal('100.00'), cleaning_fee=Decimal('50.00')
+            )
+            for n in range(3)
+        ]
+        self.start = timezone.now().date() + datetime.timedelta(days=14)
+        self.end = self.start + datetime.timedelta(days=2)
+        self.client.login(email='test@example.com', password='testpassword123')
+    
+    def _post(self, items):
+        return self.client.post(
+            reverse('reservations:create-group'),
+            data=json.dumps({'customer_id': self.customer.pk, 'items': items}),
+            content_type='application/json',
+        ).json()
+    
+    def _item(self, cottage, start=None, end=None):
+        return {
+            'cottage_id': cottage.pk,
+            'start_date': (start or self.start).isoformat(),
+            'end_date': (end or self.end).isoformat(),
+            'guests': 2,
+        }
+    
+    def test_books_all_cottages(self):
+        """Test that every item is booked and priced"""
+        data = self._post([self._item(cottage) for cottage in self.cottages])
+        
+        self.assertTrue(data['success'])
+        self.assertEqual([item['total_price'] for item in data['items']], [250.0] * 3)
+        self.assertEqual(Reservation.objects.filter(customer=self.customer).count(), 3)
+        self.assertEqual(ReservationNight.objects.count(), 6)
+    
+    def test_one_conflict_books_nothing(self):
+        """Test that a single conflicting item rejects the whole group"""
+        Reservation.objects.create(
+            cottage=self.cottages[1], user=self.user, customer=self.customer,
+            start_date=self.start + datetime.timedelta(days=1), end_date=self.end,
+            guests=2, total_price=Decimal('150.00'), status=ReservationStatus.CONFIRMED
+        )
+        
+        data = self._post([self._item(cottage) for cottage in self.cottages])
+        
+        self.assertFalse(data['success'])
+        self.assertEqual(data['items'][1]['error'], 'The cottage is already booked for this period.')
+        self.assertFalse(data['items'][0]['success'])
+        self.assertEqual(Reservation.objects.count(), 1)
+    
+    def test_items_overlapping_each_other_are_rejected(self):
+        """Test that the same cottage cannot be booked twice in one group"""
+        data = self._post([
+            self._item(self.cottages[0]),
+            self._item(self.cottages[0], start=self.start + datetime.timedelta(days=1), end=self.end + datetime.timedelta(days=1)),
+        ])
+        
+        self.assertFalse(data['success'])
+        self.assertEqual(data['items'][1]['error'], 'This item overlaps another item of the booking.')
+        self.assertEqual(Reservation.objects.count(), 0)
+
+    def test_dates_held_by_another_guest_are_rejected(self):
+        """Test that items respect holds like single bookings do, and the group's own holds are released"""
+        cache.clear()
+        acquire_hold(self.cottages[1].pk, self.start, self.end)
+        data = self._post([self._item(cottage) for cottage in self.cottages])
+
+        self.assertFalse(data['success'])
+        self.assertEqual(data['items'][1]['error'], 'These dates are on hold for another guest.')
+        self.assertEqual(Reservation.objects.count(), 0)
+
+        cache.clear()
+        token = acquire_hold(self.cottages[1].pk, self.start, self.end)
+        items = [self._item(cottage) for cottage in self.cottages]
+        items[1]['hold_token'] = token
+        self.assertTrue(self._post(items)['success'])
+        self.assertFalse(is_held_by_other(self.cottages[1].pk, self.start, self.end))
+
+
+class BulkConfirmTests(TestCase):
+    """Tests for confirming many pending reservations at once"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(email='test@example.com', password='testpassword123')
+        self.customer = Customer.objects.create(full_name='Corporate Customer', address_line1='Test Address 123')
+        self.cottages = [
+            Cottage.objects.create(
+                name=f'Cottage {n}', slug=f'cottage-{n}', description='A test cottage',
+                location='Test Location', beds=4,
+                base_price=Decimal('100.00'), cleaning_fee=Decimal('50.00')
+            )
+            for n in range(3)
+        ]
+        self.start = timezone.now().date() + datetime.timedelta(days=14)
+        self.end = self.start + datetime.timedelta(days=2)
+    
+    def test_confirm_pending_skips_conflicts(self):
+        """Test that bulk confirmation reports conflicts and confirms the rest at constant cost"""
+        clash = Reservation.objects.create(
+            cottage=self.cottages[0], user=self.user, customer=self.customer,
+            start_date=self.start, end_date=self.end,
+            guests=2, total_price=Decimal('250.00'), status=ReservationStatus.PENDING
+        )
+        # Completed stays sit outside the exclusion constraint, so they can overlap
+        completed = Reservation.objects.create(
+            cottage=self.cottages[0], user=self.user, customer=self.customer,
+            start_date=self.start, end_date=self.start + datetime.timedelta(days=1),
+            guests=2, total_price=Decimal('150.00'), status=ReservationStatus.COMPLETED
+        )
+        clean = [
+            Reservation.objects.create(
+                cottage=cottage, user=self.user, customer=self.customer,
+                start_date=self.start, end_date=self.end,
+                guests=2, total_price=Decimal('250.00'), status=ReservationStatus.PENDING
+            )
+            for cottage in self.cottages[1:]
+        ]
+        
+        # Conflicts, the ids to confirm, the status update (the night rows
+        # follow through the trigger) and one history insert
+        with self.assertNumQueries(4):
+            confirmed, conflicts = confirm_pending(Reservation.objects.all())
+        
+        self.assertEqual(sorted(confirmed), sorted(r.pk for r in clean))
+        self.assertEqual(conflicts, [(clash.pk, completed.pk)])
+        clash.refresh_from_db()
+        self.assertEqual(clash.status, ReservationStatus.PENDING)
+        self.assertEqual(
+            set(ReservationNight.objects.filter(reservation__in=clean).values_list('status', flat=True)),
+            {ReservationStatus.CONFIRMED}
+        )
+
+
+class IntegrityScanTests(TestCase):
+    """Tests for the reservation integrity scanner"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(email='test@example.com', password='testpassword123')
+        self.customer = Customer.objects.create(full_name='Test User', address_line1='Test Address 123')
+        self.cottage = Cottage.objects.create(
+            name='Test Cottage', slug='test-cottage', description='A test cottage',
+            location='Test Location', beds=4,
+            base_price=Decimal('100.00'), cleaning_fee=Decimal('50.00')
+        )
+        self.start = timezone.now().date() + datetime.timedelta(days=7)
+    
+    def _reserve(self, start, nights, status):
+        return Reservation.objects.create(
+            cottage=self.cottage, user=self.user, customer=self.customer,
+            start_date=start, end_date=start + datetime.timedelta(days=nights),
+            guests=2, total_price=Decimal('250.00'), status=status
+        )
+    
+    def _scan(self):
+        stdout = StringIO()
+        call_command('scan_reservation_integrity', stdout=stdout, stderr=StringIO())
+        return [json.loads(line) for line in stdout.getvalue().splitlines()]
+    
+    def test_clean_table_reports_nothing(self):
+        """Test that back-to-back stays are not reported"""
+        self._reserve(self.start, 2, ReservationStatus.CONFIRMED)
+        self._reserve(self.start + datetime.timedelta(days=2), 2, ReservationStatus.PENDING)
+        
+        self.assertEqual(self._scan(), [])
+    
+    def test_reports_overlaps_stale_statuses_and_invoice_amounts(self):
+        """Test that every kind of inconsistency is reported"""
+        from kesamokki.invoices.models import Invoice
+        
+        long_stay = self._reserve(self.start, 5, ReservationStatus.COMPLETED)
+        # Completed stays sit outside the exclusion constraint, so they can overlap
+        inner = self._reserve(self.start + datetime.timedelta(days=3), 1, ReservationStatus.PENDING)
+        stale = self._reserve(self.start + datetime.timedelta(days=30), 2, ReservationStatus.CONFIRMED)
+        # A confirmed stay that already ended but was never completed
+        Reservation.objects.filter(pk=stale.pk).update(
+            start_date=self.start - datetime.timedelta(days=20),
+            end_date=self.start - datetime.timedelta(days=18),
+        )
+        invoice = Invoice.objects.create(
+            reservation=stale, billed_at=timezone.now().date(),
+            due_date=timezone.now().date() + datetime.timedelta(days=14)
+        )
+        Reservation.objects.filter(pk=stale.pk).update(total_price=Decimal('300.00'))
+        
+        issues = self._scan()
+        
+        self.assertIn({'type': 'overlap', 'cottage': self.cottage.pk, 'reservation': inner.pk, 'overlaps': long_stay.pk}, issues)
+        self.assertIn('stale_status', {issue['type'] for issue in issues if issue.get('reservation') == stale.pk})
+        self.assertIn(
+            {'type': 'invoice_amount', 'invoice': invoice.pk, 'number': invoice.invoice_number,
+             'amount': '250.00', 'total_price': '300.00'},
+            issues
+        )
+        self.assertEqual(len(issues), 3)
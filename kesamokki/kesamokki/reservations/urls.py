@@ -10,4 +10,9 @@ urlpatterns = [
     path('<int:pk>/cancel/', views.CancelReservationView.as_view(), name='cancel'),
     path('check-availability/', views.check_availability, name='check-availability'),
     path('create-ajax/', views.create_reservation_ajax, name='create-ajax'),
+    path('create-group/', views.create_group_reservation_ajax, name='create-group'),
+    path('calendar/<int:cottage_id>/', views.availability_calendar, name='calendar'),
+    path('flexible-search/', views.flexible_search, name='flexible-search'),
+    path('holds/', views.hold_dates, name='hold'),
+    path('holds/release/', views.release_dates, name='release-hold'),
 ]
\ No newline at end of file
@@ -1,3 +1,5 @@
+from itertools import groupby
+from datetime import timedelta
 from django.shortcuts import render, redirect, get_object_or_404
 from django.views.generic import CreateView, ListView, DetailView, UpdateView
 from django.urls import reverse_lazy, reverse
@@ -5,8 +7,14 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib import messages
 from django.utils import timezone
 from django.http import JsonResponse
+import json
+from django.core.cache import cache
 
-from .models import Reservation, ReservationStatus
+from .models import Reservation, ReservationStatus, ACTIVE_STATUSES, calendar_version_key
+from kesamokki.utils.cache import get_version
+from kesamokki.utils.idempotency import idempotent
+from .services import GROUP_BOOKING_MAX_ITEMS, book_group
+from .holds import HOLD_MAX_NIGHTS, HOLD_SECONDS, acquire_hold, is_held_by_other, release_hold
 from kesamokki.cottages.models import Cottage
 from .forms import ReservationForm
 from django.core.exceptions import ValidationError
@@ -26,11 +34,11 @@ class CreateReservationView(LoginRequiredMixin, CreateView):
             initial['cottage'] = cottage
             
             # Default to tomorrow for start_date
-            tomorrow = timezone.now().date() + timezone.timedelta(days=1)
+            tomorrow = timezone.now().date() + timedelta(days=1)
             initial['start_date'] = tomorrow
             
             # Default to tomorrow + 5 days for end_date
-            initial['end_date'] = tomorrow + timezone.timedelta(days=5)
+            initial['end_date'] = tomorrow + timedelta(days=5)
             
         return initial
     
@@ -49,8 +57,15 @@ class CreateReservationView(LoginRequiredMixin, CreateView):
         # Calculate total price
         form.instance.total_price = nights * cottage.base_price + cottage.cleaning_fee
         
+        try:
+            response = super().form_valid(form)
+        except ValidationError as e:
+            # Overlaps are only detected by the database constraint on insert
+            form.add_error(None, e)
+            return self.form_invalid(form)
+        
         messages.success(self.request, 'Your reservation has been created successfully!')
-        return super().form_valid(form)
+        return response
     
     def get_success_url(self):
         return reverse('reservations:detail', kwargs={'pk': self.object.pk})
@@ -114,6 +129,10 @@ def check_availability(request):
             start = timezone.datetime.strptime(start_date, '%Y-%m-%d').date()
             end = timezone.datetime.strptime(end_date, '%Y-%m-%d').date()
             
+            # Dates held by another guest are settled in the cache without a query
+            if is_held_by_other(cottage.id, start, end, request.GET.get('hold_token')):
+                return JsonResponse({'available': False, 'held': True})
+            
             # Check for overlapping reservations
             overlapping = Reservation.objects.filter(
                 cottage=cottage,
@@ -143,6 +162,182 @@ def check_availability(request):
     return JsonResponse({'available': False})
 
 
+CALENDAR_MAX_MONTHS = 24
+CALENDAR_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def get_blocked_ranges(cottage_id, start, end):
+    """Merged [start, end) ranges in which the cottage is booked."""
+    rows = Reservation.objects.filter(
+        cottage_id=cottage_id,
+        status__in=ACTIVE_STATUSES,
+        start_date__lt=end,
+        end_date__gt=start,
+    ).order_by('start_date').values_list('start_date', 'end_date')
+    
+    blocked = []
+    for res_start, res_end in rows:
+        res_start = max(res_start, start)
+        if blocked and res_start <= blocked[-1][1]:
+            blocked[-1][1] = max(blocked[-1][1], res_end)
+        else:
+            blocked.append([res_start, res_end])
+    return [[first.isoformat(), last.isoformat()] for first, last in blocked]
+
+
+def availability_calendar(request, cottage_id):
+    """AJAX endpoint returning the booked date ranges of a cottage"""
+    try:
+        months = min(max(int(request.GET.get('months', 12)), 1), CALENDAR_MAX_MONTHS)
+    except ValueError:
+        months = 12
+    
+    today = timezone.now().date()
+    version = get_version(calendar_version_key(cottage_id))
+    cache_key = f'reservations:calendar:{cottage_id}:{today.isoformat()}:{months}'
+    
+    data = cache.get(cache_key, version=version)
+    if data is None:
+        end = today
+        for _ in range(months):
+            end = (end.replace(day=28) + timedelta(days=4)).replace(day=1)
+        data = {
+            'cottage_id': cottage_id,
+            'start': today.isoformat(),
+            'end': end.isoformat(),
+            # Each range is [first booked night, checkout day)
+            'blocked': get_blocked_ranges(cottage_id, today, end),
+        }
+        cache.set(cache_key, data, CALENDAR_CACHE_TIMEOUT, version=version)
+    
+    return JsonResponse(data)
+
+
+FLEXIBLE_SEARCH_MAX_DAYS = 366
+FLEXIBLE_SEARCH_MAX_NIGHTS = 60
+
+
+def free_start_dates(bookings, start, end, nights):
+    """
+    Every day in [start, end) on which a stay of ``nights`` nights fits.
+    ``bookings`` are (start_date, end_date) pairs sorted by start_date; the
+    stay has to check out on or before ``end``.
+    """
+    one_day = timedelta(days=1)
+    stay = timedelta(days=nights)
+    dates = []
+    cursor = start
+    # Walk the gaps between bookings; a sentinel booking closes the last gap
+    for booked_start, booked_end in [*bookings, (end, end)]:
+        last_start = min(booked_start, end) - stay
+        while cursor <= last_start:
+            dates.append(cursor)
+            cursor += one_day
+        cursor = max(cursor, booked_end)
+    return dates
+
+
+def flexible_search(request):
+    """AJAX endpoint listing every cottage with the start dates a stay of N nights fits in a period"""
+    try:
+        start = timezone.datetime.strptime(request.GET.get('start', ''), '%Y-%m-%d').date()
+        end = timezone.datetime.strptime(request.GET.get('end', ''), '%Y-%m-%d').date()
+        nights = int(request.GET.get('nights', ''))
+    except ValueError:
+        return JsonResponse({'error': 'start, end and nights are required'}, status=400)
+    
+    if not 1 <= nights <= FLEXIBLE_SEARCH_MAX_NIGHTS or (end - start).days > FLEXIBLE_SEARCH_MAX_DAYS:
+        return JsonResponse({'error': 'The requested period or stay is too long'}, status=400)
+    
+    # Reservations cannot start in the past
+    start = max(start, timezone.localdate())
+    
+    cottages = Cottage.objects.filter(active=True)
+    min_beds = request.GET.get('min_beds', '')
+    if min_beds.isdigit():
+        cottages = cottages.filter(beds__gte=int(min_beds))
+    
+    # One query for every active booking in the period, grouped per cottage
+    rows = Reservation.objects.filter(
+        cottage__in=cottages,
+        status__in=ACTIVE_STATUSES,
+        start_date__lt=end,
+        end_date__gt=start,
+    ).order_by('cottage_id', 'start_date').values_list('cottage_id', 'start_date', 'end_date')
+    bookings = {
+        cottage_id: [(booked_start, booked_end) for _, booked_start, booked_end in group]
+        for cottage_id, group in groupby(rows, key=lambda row: row[0])
+    }
+    
+    results = []
+    for cottage in cottages:
+        dates = free_start_dates(bookings.get(cottage.id, []), start, end, nights)
+        if dates:
+            results.append({
+                'id': cottage.id,
+                'name': cottage.name,
+                'slug': cottage.slug,
+                'total_price': nights * float(cottage.base_price) + float(cottage.cleaning_fee),
+                'start_dates': [day.isoformat() for day in dates],
+            })
+    
+    return JsonResponse({
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'nights': nights,
+        'cottages': results,
+    })
+
+
+def _parse_hold_request(request):
+    """Read cottage_id, start_date and end_date from a hold POST."""
+    cottage_id = int(request.POST.get('cottage_id', ''))
+    start = timezone.datetime.strptime(request.POST.get('start_date', ''), '%Y-%m-%d').date()
+    end = timezone.datetime.strptime(request.POST.get('end_date', ''), '%Y-%m-%d').date()
+    if not 0 < (end - start).days <= HOLD_MAX_NIGHTS:
+        raise ValueError('Invalid stay length')
+    return cottage_id, start, end
+
+
+def hold_dates(request):
+    """AJAX endpoint to hold a cottage for a few minutes while the guest completes the booking"""
+    if request.method != 'POST' or not request.user.is_authenticated:
+        return JsonResponse({'success': False, 'error': 'Invalid request or not authenticated'})
+    
+    try:
+        cottage_id, start, end = _parse_hold_request(request)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Invalid cottage or dates'})
+    
+    # Nights that are already booked cannot be held
+    booked = Reservation.objects.filter(
+        cottage_id=cottage_id,
+        status__in=ACTIVE_STATUSES,
+        start_date__lt=end,
+        end_date__gt=start
+    ).exists()
+    token = None if booked else acquire_hold(cottage_id, start, end, request.POST.get('hold_token'))
+    
+    if token is None:
+        return JsonResponse({'success': False, 'error': 'The cottage is not available for these dates.'})
+    return JsonResponse({'success': True, 'hold_token': token, 'expires_in': HOLD_SECONDS})
+
+
+def release_dates(request):
+    """AJAX endpoint to give back a hold before it expires"""
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Invalid request'})
+    
+    try:
+        cottage_id, start, end = _parse_hold_request(request)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Invalid cottage or dates'})
+    
+    release_hold(cottage_id, start, end, request.POST.get('hold_token'))
+    return JsonResponse({'success': True})
+
+
+@idempotent
 def create_reservation_ajax(request):
     """AJAX endpoint to create a reservation directly from the cottage details page"""
     print("==== CREATE RESERVATION AJAX ====")
@@ -176,6 +371,12 @@ def create_reservation_ajax(request):
             start = timezone.datetime.strptime(start_date, '%Y-%m-%d').date()
             end = timezone.datetime.strptime(end_date, '%Y-%m-%d').date()
             guests_count = int(guests)
+            hold_token = request.POST.get('hold_token')
+            
+            if is_held_by_other(cottage.id, start, end, hold_token):
+                error_msg = 'These dates are on hold for another guest. Please try again in a few minutes.'
+                print(f"Error: {error_msg}")
+                return JsonResponse({'success': False, 'error': error_msg})
             
             # Calculate total price
             nights = (end - start).days
@@ -199,6 +400,8 @@ def create_reservation_ajax(request):
             # This will run validation via clean()
             reservation.save()
             print(f"✅ Reservation created successfully! ID={reservation.id}")
+            if hold_token:
+                release_hold(cottage.id, start, end, hold_token)
             
             return JsonResponse({
                 'success': True,
@@ -221,4 +424,53 @@ def create_reservation_ajax(request):
             
     error_msg = 'Invalid request or not authenticated'
     print(f"Error: {error_msg}")
-    return JsonResponse({'success': False, 'error': error_msg})
\ No newline at end of file
+    return JsonResponse({'success': False, 'error': error_msg})
+
+
+@idempotent
+def create_group_reservation_ajax(request):
+    """AJAX endpoint booking several cottages for one customer; all items are booked or none"""
+    if request.method != 'POST' or not request.user.is_authenticated:
+        return JsonResponse({'success': False, 'error': 'Invalid request or not authenticated'})
+    
+    try:
+        payload = json.loads(request.body)
+        customer = Customer.objects.get(id=payload['customer_id'])
+        items = [
+            {
+                'cottage_id': int(item['cottage_id']),
+                'start_date': timezone.datetime.strptime(item['start_date'], '%Y-%m-%d').date(),
+                'end_date': timezone.datetime.strptime(item['end_date'], '%Y-%m-%d').date(),
+                'guests': int(item['guests']),
+                'hold_token': item.get('hold_token'),
+            }
+            for item in payload['items']
+        ]
+    except Customer.DoesNotExist:
+        return JsonResponse({'success': False, 'error': 'Customer not found'})
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'success': False, 'error': 'Invalid group booking payload'})
+    
+    if not 0 < len(items) <= GROUP_BOOKING_MAX_ITEMS:
+        return JsonResponse({'success': False, 'error': f'A group booking takes 1 to {GROUP_BOOKING_MAX_ITEMS} items'})
+    
+    reservations, errors = book_group(request.user, customer, items)
+    
+    results = []
+    for index, item in enumerate(items):
+        result = {
+            'cottage_id': item['cottage_id'],
+            'start_date': item['start_date'].isoformat(),
+            'end_date': item['end_date'].isoformat(),
+        }
+        if errors:
+            result['success'] = False
+            result['error'] = errors.get(index, 'Not booked because another item was rejected.')
+        else:
+            reservation = reservations[index]
+            result['success'] = True
+            result['reservation_id'] = reservation.id
+            result['total_price'] = float(reservation.total_price)
+        results.append(result)
+    
+    return JsonResponse({'success': not errors, 'items': results})
@@ -2,6 +2,43 @@ let revenueChart;
 let occupancyChart;
 
 // Set default font family and other Chart.js settings
+// Milliseconds between two polls of a queued report job
+const REPORT_POLL_INTERVAL = 2000;
+
+function showReportProgress(progress) {
+  document.querySelectorAll('.chart-loading').forEach(loadingElement => {
+    let progressElement = loadingElement.querySelector('.chart-progress');
+    if (!progressElement) {
+      progressElement = document.createElement('div');
+      progressElement.className = 'chart-progress text-muted small mt-2';
+      loadingElement.appendChild(progressElement);
+    }
+    progressElement.textContent = `Preparing report in the background (${progress}%)...`;
+  });
+}
+
+// Long ranges answer 202 with a job; poll it until the report is ready
+function waitForReport(job) {
+  showReportProgress(job.progress);
+  return new Promise(resolve => setTimeout(resolve, REPORT_POLL_INTERVAL))
+    .then(() => fetch(job.status_url))
+    .then(response => {
+      if (!response.ok) {
+        throw new Error(`Network response was not ok: ${response.status}`);
+      }
+      return response.json();
+    })
+    .then(payload => {
+      if (payload.status === 'done') {
+        return payload.report;
+      }
+      if (payload.status === 'failed') {
+        throw new Error(`Report job failed: ${payload.error}`);
+      }
+      return waitForReport(payload);
+    });
+}
+
 function setChartDefaults() {
   Chart.defaults.font.family = "'Inter', system-ui, -apple-system, sans-serif";
   Chart.defaults.responsive = true;
@@ -47,6 +84,9 @@ document.addEventListener('DOMContentLoaded', function() {
         if (!response.ok) {
           throw new Error(`Network response was not ok: ${response.status}`);
         }
+        if (response.status === 202) {
+          return response.json().then(waitForReport);
+        }
         return response.json();
       })
       .then(reportData => {
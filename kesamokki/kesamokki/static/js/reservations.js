@@ -52,13 +52,67 @@ document.addEventListener('DOMContentLoaded', function() {
     // When check-out date changes, update pricing
     checkOutInput.addEventListener('change', checkAvailability);
 
+    // Booked ranges for this cottage, loaded once from the cached calendar
+    let blockedRanges = [];
+    fetch(`/reservations/calendar/${cottageId}/?months=12`)
+        .then(response => response.json())
+        .then(data => {
+            blockedRanges = data.blocked;
+        });
+
+    function isBlocked(startDate, endDate) {
+        // ISO dates compare correctly as strings; ranges end on the checkout day
+        return blockedRanges.some(([blockedStart, blockedEnd]) => startDate < blockedEnd && endDate > blockedStart);
+    }
+
+    function showUnavailable() {
+        // Show not available message
+        priceDisplay.textContent = `Not available for selected dates`;
+        totalDisplay.textContent = `N/A`;
+        
+        // Disable booking button
+        submitButton.disabled = true;
+    }
+
+    // Token of the short hold on the selected dates, if we have one
+    let holdToken = '';
+
+    function holdDates(startDate, endDate) {
+        const formData = new FormData();
+        formData.append('cottage_id', cottageId);
+        formData.append('start_date', startDate);
+        formData.append('end_date', endDate);
+        formData.append('hold_token', holdToken);
+
+        fetch('/reservations/holds/', {
+            method: 'POST',
+            headers: {
+                'X-CSRFToken': document.querySelector('[name=csrfmiddlewaretoken]').value
+            },
+            body: formData
+        })
+            .then(response => response.json())
+            .then(data => {
+                if (data.success) {
+                    holdToken = data.hold_token;
+                } else {
+                    showUnavailable();
+                }
+            });
+    }
+
     function checkAvailability() {
         if (!checkInInput.value || !checkOutInput.value) return;
         
         const startDate = checkInInput.value;
         const endDate = checkOutInput.value;
+        // Skip the round trip when the calendar already shows the dates as booked
+        if (isBlocked(startDate, endDate)) {
+            showUnavailable();
+            return;
+        }
         // Check if the dates are valid and the cottage is free for reservation
-        fetch(`/reservations/check-availability/?cottage_id=${cottageId}&start_date=${startDate}&end_date=${endDate}`)
+        fetch(`/reservations/check-availability/?cottage_id=${cottageId}&start_date=${startDate}&end_date=${endDate}&hold_token=${holdToken}`)
             .then(response => response.json())
             .then(data => {
                 if (data.available) {
@@ -72,17 +126,20 @@ document.addEventListener('DOMContentLoaded', function() {
                     
                     // Enable booking button
                     submitButton.disabled = false;
+
+                    // Keep the dates for this guest while they fill in the form
+                    if (form.dataset.userAuthenticated === 'True') {
+                        holdDates(startDate, endDate);
+                    }
                 } else {
-                    // Show not available message
-                    priceDisplay.textContent = `Not available for selected dates`;
-                    totalDisplay.textContent = `N/A`;
-                    
-                    // Disable booking button
-                    submitButton.disabled = true;
+                    showUnavailable();
                 }
             });
     }
     
+    // Sent with the booking so a retried request is only processed once
+    let idempotencyKey = crypto.randomUUID();
+
     // Handle form submission
     form.addEventListener('submit', function(e) {
         e.preventDefault();
@@ -97,6 +154,7 @@ document.addEventListener('DOMContentLoaded', function() {
             formData.append('guests', guestsInput.value);
             // Customer information
             formData.append('customer_id', customerSelect.value);
+            formData.append('hold_token', holdToken);
             
             // Get CSRF token from cookie
             const csrftoken = document.querySelector('[name=csrfmiddlewaretoken]').value;
@@ -104,12 +162,15 @@ document.addEventListener('DOMContentLoaded', function() {
             fetch('/reservations/create-ajax/', {
                 method: 'POST',
                 headers: {
-                    'X-CSRFToken': csrftoken
+                    'X-CSRFToken': csrftoken,
+                    'Idempotency-Key': idempotencyKey
                 },
                 body: formData
             })
             .then(response => {
                 console.log('Response received:', response.status);
+                // The next attempt is a new booking request
+                idempotencyKey = crypto.randomUUID();
                 return response.json();
             })
             .then(data => {
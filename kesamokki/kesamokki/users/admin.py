@@ -4,6 +4,8 @@ from django.contrib import admin
 from django.contrib.auth import admin as auth_admin
 from django.utils.translation import gettext_lazy as _
 
+from kesamokki.utils.csv_export import export_as_csv
+
 from .forms import UserAdminChangeForm
 from .forms import UserAdminCreationForm
 from .models import User, Customer
@@ -61,6 +63,19 @@ class CustomerAdmin(admin.ModelAdmin):
         "gdpr_consent",
     )
     list_filter = ("country_code", "gdpr_consent")
+    actions = [export_as_csv]
+    export_columns = (
+        ("ID", "id"),
+        ("Full name", "full_name"),
+        ("Email", "email"),
+        ("Phone", "phone"),
+        ("Address line 1", "address_line1"),
+        ("Address line 2", "address_line2"),
+        ("Postal code", "postal_code"),
+        ("City", "city"),
+        ("Country", "country_code"),
+        ("GDPR consent", "gdpr_consent"),
+    )
     search_fields = ("full_name", "user__email", "email", "phone", "city")
     
     fieldsets = (
@@ -8,6 +8,7 @@ from django.contrib.auth.models import AnonymousUser
 from django.urls import reverse
 from pytest_django.asserts import assertRedirects
 
+from kesamokki.users.models import Customer
 from kesamokki.users.models import User
 
 
@@ -63,3 +64,19 @@ class TestUserAdmin:
         # The `admin` login view should redirect to the `allauth` login view
         target_url = reverse(settings.LOGIN_URL) + "?next=" + request.path
         assertRedirects(response, target_url, fetch_redirect_response=False)
+
+
+class TestCustomerAdmin:
+    def test_export_as_csv(self, admin_client):
+        customer = Customer.objects.create(full_name="Matti Meikäläinen", city="Tampere", address_line1="Katu 1")
+        url = reverse("admin:users_customer_changelist")
+        response = admin_client.post(
+            url,
+            data={"action": "export_as_csv", "_selected_action": [customer.pk]},
+        )
+        assert response.status_code == HTTPStatus.OK
+        assert response.streaming
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        assert lines[0].startswith("ID,Full name,Email")
+        assert lines[1].startswith(f"{customer.pk},Matti Meikäläinen,")
+        assert len(lines) == 2  # noqa: PLR2004
@@ -0,0 +1,65 @@
+"""
+Version counters for write-through cache invalidation.
+
+Cached values are stored under a key plus the current value of a version
+counter. Writers bump the counter instead of deleting keys, which invalidates
+every cached variant at once; stale entries simply expire.
+"""
+import secrets
+import time
+
+from django.core.cache import cache
+
+
+def get_version(key):
+    """Return the current version for ``key``, creating it if missing."""
+    version = cache.get(key)
+    if version is None:
+        # Start from the clock so a lost counter never reuses an old version
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key, time.time_ns())
+    return version
+
+
+def bump_version(key):
+    """Invalidate everything cached under ``key``."""
+    try:
+        return cache.incr(key)
+    except ValueError:
+        version = time.time_ns()
+        cache.set(key, version, timeout=None)
+        return version
+
+
+def get_or_compute(key, compute, timeout, lock_timeout=30, wait=10):
+    """
+    Return the cached value of ``key``, computing it with ``compute()`` on a miss.
+
+    Concurrent misses are coalesced: the first caller takes a short lock and
+    computes, the others poll for its result for up to ``wait`` seconds before
+    falling back to computing it themselves without touching the lock.
+    """
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    lock_key = f'{key}:lock'
+    token = secrets.token_urlsafe(16)
+    acquired = cache.add(lock_key, token, lock_timeout)
+    if not acquired:
+        deadline = time.monotonic() + wait
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            value = cache.get(key)
+            if value is not None:
+                return value
+
+    try:
+        value = compute()
+        cache.set(key, value, timeout)
+    finally:
+        # Only the lock this call took is released: a caller that gave up
+        # waiting, or whose lock expired and was taken again, leaves it alone
+        if acquired and cache.get(lock_key) == token:
+            cache.delete(lock_key)
+    return value
@@ -0,0 +1,106 @@
+"""
+Idempotency keys for write endpoints.
+
+A client sends the same ``Idempotency-Key`` header (or ``idempotency_key``
+form field) when it retries a POST. The first response is kept in the cache
+and replayed for every retry, so the view and the database run only once.
+The response is stored with a fingerprint of the request body; reusing a key
+for a different body is rejected with 422 instead of replaying the first one.
+"""
+import hashlib
+import json
+from functools import wraps
+
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse, JsonResponse
+
+IDEMPOTENCY_TIMEOUT = 24 * 60 * 60
+IDEMPOTENCY_LOCK_TIMEOUT = 30
+
+# Form fields that may differ between retries of the same submission
+FINGERPRINT_IGNORED_FIELDS = {'csrfmiddlewaretoken', 'idempotency_key'}
+
+
+def _cache_key(request, key):
+    digest = hashlib.sha256(f'{request.user.pk}:{request.path}:{key}'.encode()).hexdigest()
+    return f'idempotency:{digest}'
+
+
+def _fingerprint(request):
+    """Hash of what the request asks for, independent of multipart boundaries and CSRF tokens."""
+    if request.content_type in ('multipart/form-data', 'application/x-www-form-urlencoded'):
+        fields = sorted(
+            (name, values) for name, values in request.POST.lists() if name not in FINGERPRINT_IGNORED_FIELDS
+        )
+        files = sorted(
+            (name, [(upload.name, upload.size) for upload in uploads]) for name, uploads in request.FILES.lists()
+        )
+        payload = json.dumps([fields, files]).encode()
+    else:
+        payload = request.body
+    return hashlib.sha256(payload).hexdigest()
+
+
+def idempotent(view):
+    """Replay the stored response of a POST retried with the same idempotency key."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get('Idempotency-Key') or request.POST.get('idempotency_key')
+        if request.method != 'POST' or not key:
+            return view(request, *args, **kwargs)
+
+        cache_key = _cache_key(request, key)
+        fingerprint = _fingerprint(request)
+        stored = cache.get(cache_key)
+        if stored is not None:
+            if stored['fingerprint'] != fingerprint:
+                return JsonResponse(
+                    {'success': False, 'error': 'This idempotency key was already used for a different request.'},
+                    status=422,
+                )
+            return _replay(stored)
+
+        # Claim the key so a retry arriving mid-request doesn't run the view twice
+        lock_key = f'{cache_key}:lock'
+        if not cache.add(lock_key, 1, IDEMPOTENCY_LOCK_TIMEOUT):
+            return JsonResponse(
+                {'success': False, 'error': 'A request with this idempotency key is already in progress.'},
+                status=409,
+            )
+
+        try:
+            response = view(request, *args, **kwargs)
+        except Exception:
+            cache.delete(lock_key)
+            raise
+
+        if response.status_code >= 500 or response.streaming:
+            cache.delete(lock_key)
+            return response
+
+        stored = {
+            'status': response.status_code,
+            'content': response.content,
+            'content_type': response.get('Content-Type'),
+            'location': response.get('Location'),
+            'fingerprint': fingerprint,
+        }
+
+        def store():
+            # Only remember responses whose writes were committed
+            cache.set(cache_key, stored, IDEMPOTENCY_TIMEOUT)
+            cache.delete(lock_key)
+
+        transaction.on_commit(store)
+        return response
+
+    return wrapper
+
+
+def _replay(stored):
+    response = HttpResponse(stored['content'], status=stored['status'], content_type=stored['content_type'])
+    if stored['location']:
+        response['Location'] = stored['location']
+    response['Idempotent-Replayed'] = 'true'
+    return response